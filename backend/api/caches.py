@@ -0,0 +1,131 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.models import CatalogVersion
+from recipes.constants import POPULAR_SIZE, POPULAR_WINDOWS
+from recipes.models import RecipeActivity, Tag
+
+CATALOG_VERSION_KEY = 'catalog_version:{}'
+TAG_MASKS_KEY = 'tag_masks:{}'
+POPULAR_KEY = 'popular:{}'
+
+_pending = threading.local()
+
+
+def get_catalog_states(catalogs):
+    """Версии каталогов и время их изменения в секундах.
+
+    Версии хранятся в БД и одинаковы во всех процессах, кеш лишь
+    избавляет от запроса к БД на каждый запрос API.
+    """
+    keys = {CATALOG_VERSION_KEY.format(name): name for name in catalogs}
+    states = {keys[key]: state for key, state in cache.get_many(keys).items()}
+    missing = [name for name in keys.values() if name not in states]
+    if missing:
+        found = {
+            name: (version, int(updated.timestamp()))
+            for name, version, updated in CatalogVersion.objects.filter(
+                name__in=missing
+            ).values_list('name', 'version', 'updated')
+        }
+        found = {name: found.get(name, (0, 0)) for name in missing}
+        cache.set_many(
+            {CATALOG_VERSION_KEY.format(name): state
+             for name, state in found.items()},
+            settings.CATALOG_VERSION_TIMEOUT
+        )
+        states.update(found)
+    return states
+
+
+def get_catalog_state(catalog):
+    """Версия каталога и время её изменения в секундах."""
+    return get_catalog_states((catalog, ))[catalog]
+
+
+def get_catalog_version(catalog):
+    """Номер изменения каталога."""
+    return get_catalog_state(catalog)[0]
+
+
+def increment_catalog_version(catalog, changes):
+    if CatalogVersion.objects.filter(name=catalog).update(**changes):
+        return
+    CatalogVersion.objects.bulk_create((CatalogVersion(name=catalog), ),
+                                       ignore_conflicts=True)
+    CatalogVersion.objects.filter(name=catalog).update(**changes)
+
+
+def update_catalog_versions():
+    """Увеличивает в БД версии каталогов, изменённых потоком."""
+    catalogs = getattr(_pending, 'catalogs', None)
+    if not catalogs:
+        return
+    _pending.catalogs = set()
+    changes = {'version': F('version') + 1, 'updated': timezone.now()}
+    with transaction.atomic():
+        for name in sorted(catalogs):
+            increment_catalog_version(name, changes)
+    cache.delete_many([CATALOG_VERSION_KEY.format(name) for name in catalogs])
+
+
+def next_catalog_version(catalog):
+    """Увеличивает в БД версию каталога и возвращает новую."""
+    with transaction.atomic():
+        increment_catalog_version(
+            catalog, {'version': F('version') + 1, 'updated': timezone.now()}
+        )
+        version = CatalogVersion.objects.filter(
+            name=catalog
+        ).values_list('version', flat=True).get()
+    cache.delete(CATALOG_VERSION_KEY.format(catalog))
+    return version
+
+
+def bump_catalog_version(catalog):
+    """Новая версия каталога после фиксации транзакции.
+
+    Изменения накапливаются, так что несколько записей каталога
+    в одной транзакции увеличивают его версию одним запросом.
+    """
+    if getattr(_pending, 'catalogs', None) is None:
+        _pending.catalogs = set()
+    _pending.catalogs.add(catalog)
+    transaction.on_commit(update_catalog_versions)
+
+
+def get_tag_masks():
+    """Маски тегов по слагам для текущей версии каталога тегов.
+
+    У тегов сверх TAG_MASK_BITS маски нет: None.
+    """
+    key = TAG_MASKS_KEY.format(get_catalog_version('tags'))
+    masks = cache.get(key)
+    if masks is None:
+        masks = dict(Tag.objects.values_list('slug', 'mask'))
+        cache.set(key, masks, settings.CATALOG_CACHE_TIMEOUT)
+    return masks
+
+
+def get_popular_ranking(window):
+    """Лучшие рецепты окна: пары (id рецепта, число добавлений).
+
+    Каждое окно читается по индексу (day, -score): неделя хранится
+    готовой строкой, которую команда prune_activity сдвигает раз в день.
+    """
+    key = POPULAR_KEY.format(window)
+    ranking = cache.get(key)
+    if ranking is not None:
+        return ranking
+    ranking = list(RecipeActivity.objects.filter(
+        day=POPULAR_WINDOWS[window] or timezone.localdate(), score__gt=0
+    ).order_by('-score', '-recipe_id').values_list(
+        'recipe', 'score'
+    )[:POPULAR_SIZE])
+    cache.set(key, ranking, settings.POPULAR_CACHE_TIMEOUT)
+    return ranking
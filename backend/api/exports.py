@@ -0,0 +1,59 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files import File
+from django.db import connection
+
+from api.servises import get_shopping_cart, render_pdf
+from recipes.constants import (EXPORT_DONE, EXPORT_FAILED, EXPORT_PENDING,
+                               EXPORT_RUNNING)
+from recipes.models import ShoppingCartExport
+
+logger = logging.getLogger('api.exports')
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.EXPORT_WORKERS,
+    thread_name_prefix='shopping-cart-export'
+)
+
+
+def run_export(export_id, link):
+    """Формирует PDF списка покупок во временный файл на диске.
+
+    Выгрузку, которую уже взял другой поток или которая признана
+    упавшей по таймауту, задача пропускает.
+    """
+    exports = ShoppingCartExport.objects.filter(id=export_id)
+    if not exports.filter(status=EXPORT_PENDING).update(
+        status=EXPORT_RUNNING
+    ):
+        return
+    export = exports.select_related('user').get()
+    try:
+        with SpooledTemporaryFile(
+            max_size=settings.EXPORT_SPOOL_MAX_SIZE
+        ) as spool:
+            render_pdf(spool, *get_shopping_cart(export.user), link)
+            spool.seek(0)
+            export.file.save('', File(spool), save=False)
+        export.status = EXPORT_DONE
+    except Exception:
+        logger.exception('Ошибка выгрузки списка покупок %s', export_id)
+        export.status = EXPORT_FAILED
+    if not exports.filter(status=EXPORT_RUNNING).update(
+        status=export.status, file=export.file.name
+    ) and export.file:
+        export.file.delete(save=False)
+
+
+def run_export_in_pool(export_id, link):
+    try:
+        run_export(export_id, link)
+    finally:
+        connection.close()
+
+
+def start_export(export, link):
+    executor.submit(run_export_in_pool, export.id, link)
@@ -1,16 +1,21 @@
-from django_filters import CharFilter, ChoiceFilter, ModelMultipleChoiceFilter
+from django.db.models import Exists, OuterRef
+from django_filters import CharFilter, ChoiceFilter, MultipleChoiceFilter
 from django_filters.rest_framework import FilterSet
 
+from api.caches import get_tag_masks
 from recipes.constants import BOOL_CHOICES
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import Ingredient, Recipe
+
+
+def tag_choices():
+    return [(slug, slug) for slug in get_tag_masks()]
 
 
 class RecipeFilter(FilterSet):
 
-    tags = ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
+    tags = MultipleChoiceFilter(
+        choices=tag_choices,
+        method='filter_tags',
         label='Tags'
     )
     is_favorited = ChoiceFilter(
@@ -21,19 +26,36 @@ class RecipeFilter(FilterSet):
         choices=BOOL_CHOICES,
         method='filter_is_in_shopping_cart',
     )
+    search = CharFilter(method='filter_search')
 
     class Meta:
         model = Recipe
-        fields = ('is_favorited', 'is_in_shopping_cart', 'author', 'tags')
+        fields = ('is_favorited', 'is_in_shopping_cart', 'author', 'tags',
+                  'search')
+
+    def filter_tags(self, queryset, name, value):
+        masks = get_tag_masks()
+        if any(masks[slug] is None for slug in value):
+            return queryset.filter(Exists(Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'), tag__slug__in=value
+            )))
+        mask = 0
+        for slug in value:
+            mask |= masks[slug]
+        return queryset.with_tags(mask)
+
+    def filter_search(self, queryset, name, value):
+        return queryset.search(value).order_by('-search_rank', '-created',
+                                               '-id')
 
     def filter_is_favorited(self, queryset, name, value):
         if int(value) and self.request.user.is_authenticated:
-            return queryset.filter(favorite_users__user=self.request.user)
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         if int(value) and self.request.user.is_authenticated:
-            return queryset.filter(shopping_cart_user__user=self.request.user)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
 
 
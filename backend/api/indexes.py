@@ -0,0 +1,289 @@
+import heapq
+import threading
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from itertools import chain
+
+from django.db import DatabaseError, connection, transaction
+
+from api.caches import get_catalog_version, next_catalog_version
+from core.models import CatalogVersion
+from recipes.models import Ingredient, IngredientRecipe
+
+MAX_CHAR = chr(0x10FFFF)
+
+
+class IngredientPrefixIndex:
+    """Неизменяемый индекс ингредиентов по префиксу названия.
+
+    Хранит отсортированные названия в нижнем регистре и готовые
+    к выдаче записи, поиск выполняется двоичным поиском.
+    """
+
+    def __init__(self, rows):
+        rows = sorted(
+            (name.casefold(), name, pk, measurement_unit)
+            for pk, name, measurement_unit in rows
+        )
+        self.keys = tuple(row[0] for row in rows)
+        self.items = tuple(
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _, name, pk, measurement_unit in rows
+        )
+        self.version = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def search(self, prefix):
+        prefix = prefix.casefold()
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + MAX_CHAR, start)
+        return list(self.items[start:end])
+
+
+class RecipeIngredientIndex:
+    """Инвертированный индекс: ингредиент -> отсортированные id рецептов.
+
+    Хранит набор ингредиентов каждого рецепта для доли покрытия,
+    изменения рецептов применяются на месте.
+    """
+
+    def __init__(self, rows):
+        postings = defaultdict(list)
+        recipes = defaultdict(set)
+        for recipe_id, ingredient_id in rows:
+            postings[ingredient_id].append(recipe_id)
+            recipes[recipe_id].add(ingredient_id)
+        self.postings = {
+            ingredient_id: array('q', sorted(recipe_ids))
+            for ingredient_id, recipe_ids in postings.items()
+        }
+        self.recipes = {
+            recipe_id: frozenset(ingredient_ids)
+            for recipe_id, ingredient_ids in recipes.items()
+        }
+        self.lock = threading.Lock()
+        self.version = None
+
+    def __len__(self):
+        return len(self.recipes)
+
+    def update(self, recipe_id, ingredient_ids):
+        """Заменяет ингредиенты рецепта, пустой набор удаляет рецепт."""
+        ingredient_ids = frozenset(ingredient_ids)
+        with self.lock:
+            old_ids = self.recipes.pop(recipe_id, frozenset())
+            for ingredient_id in old_ids - ingredient_ids:
+                posting = self.postings[ingredient_id]
+                del posting[bisect_left(posting, recipe_id)]
+            for ingredient_id in ingredient_ids - old_ids:
+                insort(self.postings.setdefault(ingredient_id, array('q')),
+                       recipe_id)
+            if ingredient_ids:
+                self.recipes[recipe_id] = ingredient_ids
+
+    def search(self, ingredient_ids, limit):
+        """Лучшие рецепты по доле имеющихся ингредиентов.
+
+        Возвращает кортежи (id рецепта, найдено ингредиентов, всего).
+        """
+        with self.lock:
+            matched = Counter(chain.from_iterable(
+                self.postings.get(ingredient_id, ())
+                for ingredient_id in set(ingredient_ids)
+            ))
+            sizes = {recipe_id: len(self.recipes[recipe_id])
+                     for recipe_id in matched}
+        return [
+            (recipe_id, count, sizes[recipe_id])
+            for recipe_id, count in heapq.nlargest(
+                limit, matched.items(),
+                key=lambda item: (item[1] / sizes[item[0]], item[1], item[0])
+            )
+        ]
+
+
+_index = None
+_lock = threading.Lock()
+_recipe_index = None
+_recipe_lock = threading.Lock()
+_recipe_changed = None
+_recipe_changed_lock = threading.Lock()
+_pending = threading.local()
+
+RECIPE_INGREDIENTS_CATALOG = 'recipe_ingredients'
+
+
+def build_ingredient_index(version=None):
+    """Строит индекс ингредиентов для версии каталога в БД.
+
+    Версия читается до строк, поэтому данные индекса не старше неё.
+    """
+    global _index
+    if version is None:
+        version = get_catalog_version('ingredients')
+    index = IngredientPrefixIndex(
+        Ingredient.objects.values_list('id', 'name', 'measurement_unit')
+    )
+    index.version = version
+    _index = index
+    return index
+
+
+def get_ingredient_index():
+    """Индекс процесса для текущей версии ингредиентов или None.
+
+    Версия каталога общая для всех процессов, так что индекс
+    перестраивается и после записей в других процессах. Индекс строится
+    текущим потоком; если его уже строит другой поток или БД недоступна,
+    вызывающий код обращается к БД.
+    """
+    try:
+        version = get_catalog_version('ingredients')
+    except DatabaseError:
+        return None
+    index = _index
+    if index is not None and index.version == version:
+        return index
+    if not _lock.acquire(blocking=False):
+        return None
+    try:
+        return build_ingredient_index(version)
+    except DatabaseError:
+        return None
+    finally:
+        _lock.release()
+
+
+def reset_ingredient_index(**kwargs):
+    global _index
+    _index = None
+
+
+def read_recipe_ingredients(recipe_ids):
+    """Ингредиенты рецептов из БД, у удалённых рецептов пустой набор."""
+    ingredients = {recipe_id: set() for recipe_id in recipe_ids}
+    for recipe_id, ingredient_id in IngredientRecipe.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by().values_list('recipe_id', 'ingredient_id'):
+        ingredients[recipe_id].add(ingredient_id)
+    return ingredients
+
+
+def build_recipe_ingredient_index():
+    """Строит индекс рецептов по ингредиентам и подменяет им текущий.
+
+    Рецепты, изменённые потоками процесса во время построения, после
+    него перечитываются, так что их обновления не теряются.
+    """
+    global _recipe_index, _recipe_changed
+    with _recipe_changed_lock:
+        _recipe_changed = (set(), set())
+    try:
+        version = CatalogVersion.objects.filter(
+            name=RECIPE_INGREDIENTS_CATALOG
+        ).values_list('version', flat=True).first() or 0
+        index = RecipeIngredientIndex(
+            IngredientRecipe.objects.order_by().values_list(
+                'recipe_id', 'ingredient_id'
+            ).iterator()
+        )
+        while True:
+            with _recipe_changed_lock:
+                (changed, versions), _recipe_changed = (
+                    _recipe_changed, (set(), set())
+                )
+                if not changed:
+                    index.version = version
+                    _recipe_index = index
+                    return index
+            for recipe_id, ingredient_ids in read_recipe_ingredients(
+                changed
+            ).items():
+                index.update(recipe_id, ingredient_ids)
+            while version + 1 in versions:
+                version += 1
+    finally:
+        with _recipe_changed_lock:
+            _recipe_changed = None
+
+
+def rebuild_recipe_ingredient_index():
+    try:
+        build_recipe_ingredient_index()
+    except DatabaseError:
+        pass
+    finally:
+        connection.close()
+        _recipe_lock.release()
+
+
+def start_recipe_ingredient_index_build():
+    """Перестраивает индекс в фоновом потоке, если он ещё не строится."""
+    if not _recipe_lock.acquire(blocking=False):
+        return
+    threading.Thread(target=rebuild_recipe_ingredient_index,
+                     name='recipe-ingredient-index', daemon=True).start()
+
+
+def get_recipe_ingredient_index():
+    """Текущий индекс рецептов по ингредиентам или None.
+
+    Записи рецептов этого процесса обновляют индекс на месте, при
+    записях других процессов версия в БД уходит вперёд и индекс заново
+    строится в фоне. Пока его нет, вызывающий код обращается к БД.
+    """
+    index = _recipe_index
+    try:
+        version = get_catalog_version(RECIPE_INGREDIENTS_CATALOG)
+    except DatabaseError:
+        return index
+    if index is None or index.version != version:
+        start_recipe_ingredient_index_build()
+    return index
+
+
+def update_recipe_ingredient_index():
+    """Перечитывает из БД ингредиенты изменённых рецептов потока.
+
+    Версия индекса сдвигается вместе с версией в БД, только если
+    между ними не было чужих записей.
+    """
+    recipe_ids = getattr(_pending, 'recipe_ids', None)
+    if not recipe_ids:
+        return
+    _pending.recipe_ids = set()
+    version = next_catalog_version(RECIPE_INGREDIENTS_CATALOG)
+    with _recipe_changed_lock:
+        if _recipe_changed is not None:
+            _recipe_changed[0].update(recipe_ids)
+            _recipe_changed[1].add(version)
+    index = _recipe_index
+    if index is None:
+        return
+    for recipe_id, ingredient_ids in read_recipe_ingredients(
+        recipe_ids
+    ).items():
+        index.update(recipe_id, ingredient_ids)
+    with index.lock:
+        if index.version == version - 1:
+            index.version = version
+
+
+def reindex_recipe_ingredients(recipe_ids):
+    """Обновляет индекс рецептов после фиксации транзакции.
+
+    Изменения накапливаются, так что каскадное удаление ингредиентов
+    рецепта обновляет индекс одним запросом.
+    """
+    if getattr(_pending, 'recipe_ids', None) is None:
+        _pending.recipe_ids = set()
+    _pending.recipe_ids.update(recipe_ids)
+    transaction.on_commit(update_recipe_ingredient_index)
+
+
+def reset_recipe_ingredient_index(**kwargs):
+    global _recipe_index
+    _recipe_index = None
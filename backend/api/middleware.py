@@ -0,0 +1,199 @@
+import logging
+import re
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger('api.performance')
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+METRICS_PATH_PREFIX = '/api/'
+SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+SQL_IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+def normalize_sql(sql):
+    """SQL без значений параметров для поиска повторяющихся запросов."""
+    return SQL_IN_LIST.sub('IN (...)', SQL_LITERALS.sub('?', sql))
+
+
+class RequestMetrics:
+    """Метрики одного запроса: SQL, время БД, view, сериализации и отрисовки.
+
+    Запросы к БД относятся к полю сериализатора, которое отрисовывалось
+    во время их выполнения.
+    """
+
+    def __init__(self):
+        self.start = perf_counter()
+        self.queries = 0
+        self.db_time = 0
+        self.serialize_time = 0
+        self.serializing = False
+        self.field = None
+        self.view_name = None
+        self.view_start = None
+        self.view_end = None
+        self.statements = Counter()
+        self.statement_fields = defaultdict(Counter)
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += perf_counter() - start
+            self.queries += 1
+            statement = normalize_sql(sql)
+            self.statements[statement] += 1
+            self.statement_fields[statement][self.field] += 1
+
+    def timings(self, end):
+        view_end = self.view_end or end
+        timings = [('db', self.db_time, f'{self.queries} queries')]
+        if self.view_start is not None:
+            timings.append(('view', view_end - self.view_start
+                            - self.serialize_time, None))
+            timings.append(('serialize', self.serialize_time, None))
+            timings.append(('render', end - view_end, None))
+        timings.append(('total', end - self.start, None))
+        return timings
+
+    def repeated_statements(self):
+        """Повторяющиеся запросы: (запрос, число, поле сериализатора)."""
+        return [
+            (statement, count,
+             self.statement_fields[statement].most_common(1)[0][0])
+            for statement, count in self.statements.items()
+            if count >= settings.N_PLUS_ONE_THRESHOLD
+        ]
+
+
+class SerializerMetricsMixin:
+    """Замеры сериализатора для RequestMetricsMiddleware.
+
+    Время to_representation внешнего сериализатора считается временем
+    сериализации, а имя отрисовываемого поля (метода для
+    SerializerMethodField) запоминается, чтобы отнести к нему запросы.
+    Вне запросов к API сериализатор работает без замеров.
+    """
+
+    def to_representation(self, instance):
+        metrics = current_metrics.get()
+        if metrics is None or metrics.serializing:
+            return super().to_representation(instance)
+        metrics.serializing = True
+        start = perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serialize_time += perf_counter() - start
+            metrics.serializing = False
+
+    @property
+    def _readable_fields(self):
+        metrics = current_metrics.get()
+        if metrics is None:
+            yield from super()._readable_fields
+            return
+        outer_field = metrics.field
+        try:
+            for field in super()._readable_fields:
+                metrics.field = '.'.join((
+                    type(self).__name__,
+                    getattr(field, 'method_name', None) or field.field_name,
+                ))
+                yield field
+        finally:
+            metrics.field = outer_field
+
+
+class RequestMetricsMiddleware:
+    """Server-Timing, журнал медленных запросов и поиск N+1 для API.
+
+    Время сериализаторов с SerializerMetricsMixin вычитается из времени
+    view и отдаётся отдельно, render - отрисовка ответа рендерером.
+    Server-Timing отдаётся только в режиме DEBUG и сотрудникам. Запросы
+    к БД, выполненные при отдаче тела потокового ответа, попадают
+    в журнал после отдачи, но не в заголовок, который уходит клиенту
+    раньше тела.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not request.path.startswith(METRICS_PATH_PREFIX):
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            with connection.execute_wrapper(metrics):
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        user = getattr(request, 'user', None)
+        if settings.DEBUG or getattr(user, 'is_staff', False):
+            response['Server-Timing'] = ', '.join(
+                f'{name};dur={duration * 1000:.1f}'
+                + (f';desc="{description}"' if description else '')
+                for name, duration, description in metrics.timings(
+                    perf_counter()
+                )
+            )
+        if response.streaming:
+            response.streaming_content = self.stream(
+                request, metrics, response.streaming_content
+            )
+        else:
+            self.report(request, metrics)
+        return response
+
+    def stream(self, request, metrics, content):
+        with connection.execute_wrapper(metrics):
+            yield from content
+        self.report(request, metrics)
+
+    def report(self, request, metrics):
+        end = perf_counter()
+        timings = metrics.timings(end)
+        view_name = metrics.view_name or request.path
+        total = (end - metrics.start) * 1000
+        if total >= settings.SLOW_REQUEST_THRESHOLD:
+            logger.warning(
+                'Медленный запрос %s %s (%s): %.1f мс, %s',
+                request.method, request.get_full_path(), view_name, total,
+                ', '.join(f'{name} {duration * 1000:.1f} мс'
+                          for name, duration, _ in timings[:-1])
+                + f', SQL-запросов {metrics.queries}'
+            )
+        for statement, count, field in metrics.repeated_statements():
+            if field is None:
+                logger.warning('N+1 в %s: %d повторов запроса: %s',
+                               view_name, count, statement)
+            else:
+                logger.warning('N+1 в %s (%s): %d повторов запроса: %s',
+                               view_name, field, count, statement)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = current_metrics.get()
+        if metrics is None:
+            return
+        view_class = getattr(view_func, 'cls', None)
+        actions = getattr(view_func, 'actions', None) or {}
+        action = actions.get(request.method.lower())
+        metrics.view_name = '.'.join(filter(None, (
+            view_class.__name__ if view_class else view_func.__name__,
+            action,
+        )))
+        metrics.view_start = perf_counter()
+
+    def process_template_response(self, request, response):
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.view_end = perf_counter()
+        return response
@@ -0,0 +1,46 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+
+from api.caches import get_catalog_state
+
+
+class CatalogCacheMixin:
+    """Условное кеширование справочников.
+
+    ETag и Last-Modified берутся из версии каталога в БД, поэтому
+    If-None-Match отвечается кодом 304 без сериализации, а готовые
+    данные хранятся в кеше под ключом этой версии.
+    """
+
+    catalog = None
+
+    def cached_response(self, request, get_response, *args, **kwargs):
+        version, last_modified = get_catalog_state(self.catalog)
+        etag = (f'"{self.catalog}-{version}-'
+                f'{request.accepted_renderer.format}"')
+        headers = {'ETag': etag, 'Last-Modified': http_date(last_modified)}
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if not_modified is not None:
+            return Response(status=not_modified.status_code, headers=headers)
+        key = f'catalog:{self.catalog}:{version}:{request.get_full_path()}'
+        data = cache.get(key)
+        if data is None:
+            response = get_response(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cache.set(key, data, settings.CATALOG_CACHE_TIMEOUT)
+        return Response(data, headers=headers)
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(request, super().retrieve,
+                                    *args, **kwargs)
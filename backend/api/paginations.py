@@ -1,8 +1,214 @@
+import base64
+import binascii
+import hashlib
+import json
+from collections import OrderedDict
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db import connection
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
+from api.caches import get_catalog_states
 from users.constants import MAX_PAGE_SIZE
 
 
 class LimitPageNumberPagination(PageNumberPagination):
     page_size_query_param = 'limit'
     max_page_size = MAX_PAGE_SIZE
+
+
+def estimate_count(queryset):
+    """Оценка числа строк таблицы планировщиком PostgreSQL."""
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+            (queryset.model._meta.db_table,)
+        )
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+
+class CachedCountPaginator(DjangoPaginator):
+    """Пагинатор, который берёт число объектов из кеша.
+
+    Без ключа кеша число считается при каждом запросе, но для таблиц
+    без фильтров по-прежнему используется оценка планировщика.
+    """
+
+    def __init__(self, object_list, per_page, *args, count_key=None,
+                 **kwargs):
+        super().__init__(object_list, per_page, *args, **kwargs)
+        self.count_key = count_key
+
+    @cached_property
+    def count(self):
+        if self.count_key is None:
+            return self.get_count()
+        count = cache.get(self.count_key)
+        if count is None:
+            count = self.get_count()
+            cache.set(self.count_key, count, settings.COUNT_CACHE_TIMEOUT)
+        return count
+
+    def get_count(self):
+        if not self.object_list.query.has_filters():
+            estimate = estimate_count(self.object_list)
+            if (estimate is not None
+                    and estimate >= settings.APPROXIMATE_COUNT_THRESHOLD):
+                return estimate
+        return self.object_list.count()
+
+
+class CachedCountPagination(LimitPageNumberPagination):
+    """Пагинация с кешированием числа объектов по набору фильтров.
+
+    Ключ кеша строится из параметров запроса без параметров страницы
+    и из версий данных, которые меняются при записи.
+    """
+
+    ignored_query_params = ('page', 'limit', 'cursor', 'format')
+    user_query_params = ()
+
+    def get_count_versions(self, request):
+        return ()
+
+    def get_count_user(self, request):
+        """Пользователь, от которого зависит число: есть его фильтры."""
+        if request.user.is_authenticated and any(
+            param in request.query_params for param in self.user_query_params
+        ):
+            return request.user.id
+        return None
+
+    def get_count_key(self, request, view):
+        params = sorted(
+            (key, sorted(values))
+            for key, values in request.query_params.lists()
+            if key not in self.ignored_query_params
+        )
+        names = self.get_count_versions(request)
+        states = get_catalog_states(names)
+        versions = [states[name][0] for name in names]
+        return 'count:' + hashlib.sha1(json.dumps(
+            (getattr(view, 'basename', None), getattr(view, 'action', None),
+             params, versions, self.get_count_user(request))
+        ).encode('utf-8')).hexdigest()
+
+    def django_paginator_class(self, object_list, per_page):
+        return CachedCountPaginator(object_list, per_page,
+                                    count_key=self.count_key)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count_key = self.get_count_key(request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+
+class RecipePagination(CachedCountPagination):
+    """Номера страниц по умолчанию, keyset-курсор при параметре cursor.
+
+    Курсор хранит (created, id) последнего рецепта страницы, поэтому
+    любая страница выбирается по индексу без OFFSET и COUNT(*).
+    Первая страница запрашивается с пустым cursor.
+    """
+
+    cursor_query_param = 'cursor'
+    ordering = ('-created', '-id')
+    cursor_fields = ('created', 'pk')
+    invalid_cursor_message = 'Неверный курсор.'
+    user_query_params = ('is_favorited', 'is_in_shopping_cart')
+
+    def get_count_versions(self, request):
+        versions = ['recipes']
+        user_id = self.get_count_user(request)
+        if user_id is not None:
+            versions.append(f'recipes:user:{user_id}')
+        return versions
+
+    def is_cursor_request(self, request):
+        return self.cursor_query_param in request.query_params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = self.is_cursor_request(request)
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.display_page_controls = False
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(
+            request.query_params.get(self.cursor_query_param)
+        )
+        if position is not None:
+            created, pk = position
+            created_field, pk_field = self.cursor_fields
+            # Избыточная граница created <= даёт планировщику диапазон
+            # по индексу: условие с OR сам он в диапазон не превращает.
+            queryset = queryset.filter(
+                Q(**{f'{created_field}__lt': created})
+                | Q(**{created_field: created, f'{pk_field}__lt': pk}),
+                **{f'{created_field}__lte': created}
+            )
+        results = list(queryset[:page_size + 1])
+        self.has_next = len(results) > page_size
+        self.page = results[:page_size]
+        return self.page
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            created, pk = base64.urlsafe_b64decode(
+                cursor.encode('ascii')
+            ).decode('ascii').split('|')
+            return datetime.fromisoformat(created), int(pk)
+        except (TypeError, ValueError, UnicodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, recipe):
+        created, pk = (getattr(recipe, field) for field in self.cursor_fields)
+        return base64.urlsafe_b64encode(
+            f'{created.isoformat()}|{pk}'.encode('ascii')
+        ).decode('ascii')
+
+    def get_next_link(self):
+        if not self.use_cursor:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(),
+                                   self.cursor_query_param,
+                                   self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict((
+            ('next', self.get_next_link()),
+            ('previous', None),
+            ('results', data),
+        )))
+
+
+class FeedPagination(RecipePagination):
+    """Пагинация ленты только keyset-курсором.
+
+    Курсор строится по полям строки ленты (feed_created, feed_recipe_id),
+    поэтому страницы идут по индексу feed_user_created_idx без OFFSET
+    и COUNT(*). Первая страница запрашивается без параметра cursor.
+    """
+
+    ordering = ('-feed_created', '-feed_recipe_id')
+    cursor_fields = ('feed_created', 'feed_recipe_id')
+
+    def is_cursor_request(self, request):
+        return True
@@ -1,15 +1,25 @@
-from django.db.models import Count
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
+from django.urls import reverse
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
+from api.middleware import SerializerMetricsMixin
+from api.servises import annotate_author_recipes, get_recipes_limit
+from core.signals import ingredients_bulk_changed
 from recipes.constants import (AMOUNT_MAX_VALUE, AMOUNT_MIN_VALUE,
-                               COOKING_MAX_TIME, COOKING_MIN_TIME)
+                               COOK_DEFAULT_LIMIT, COOK_INGREDIENTS_MAX_LENGTH,
+                               COOK_MAX_LIMIT, COOKING_MAX_TIME,
+                               COOKING_MIN_TIME, EXPORT_DONE, IMAGE_VARIANTS,
+                               OPTION_RECIPES_MAX_LENGTH)
 from recipes.models import (FavoriteUser, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingCartUser, Tag)
+                            ShoppingCartExport, ShoppingCartUser, Tag)
 from users.models import SubscriptionUser, User
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SerializerMetricsMixin,
+                     serializers.ModelSerializer):
 
     is_subscribed = serializers.SerializerMethodField(read_only=True)
 
@@ -24,10 +34,20 @@ class UserSerializer(serializers.ModelSerializer):
             'is_subscribed',
         )
 
+    def get_subscribed_ids(self):
+        """Авторы, на которых подписан пользователь, один раз на запрос."""
+        if 'subscribed_ids' not in self.context:
+            self.context['subscribed_ids'] = set(
+                self.context['request'].user.authors.values_list(
+                    'author_id', flat=True
+                )
+            )
+        return self.context['subscribed_ids']
+
     def get_is_subscribed(self, obj):
-        request = self.context['request']
+        request = self.context.get('request')
         return bool(request and request.user.is_authenticated
-                    and request.user.authors.filter(author=obj))
+                    and obj.id in self.get_subscribed_ids())
 
 
 class UserWithRecipesSerializer(UserSerializer):
@@ -44,21 +64,16 @@ class UserWithRecipesSerializer(UserSerializer):
 
     def get_recipes(self, obj):
         recipes_user = obj.recipes.all()
-        try:
-            recipes_limit = int(
-                self.context['request'].query_params.get('recipes_limit')
-            )
-        except (TypeError, ValueError, KeyError, AttributeError):
-            recipes_limit = 0
-
-        if recipes_limit:
+        recipes_limit = get_recipes_limit(self.context.get('request'))
+        if recipes_limit > 0:
             recipes_user = recipes_user[:recipes_limit]
         return RecipeMinifieldSerialiser(recipes_user,
                                          many=True,
                                          context=self.context).data
 
 
-class TagSerialiser(serializers.ModelSerializer):
+class TagSerialiser(SerializerMetricsMixin,
+                    serializers.ModelSerializer):
     """Сериализатор для работы с моделью Tag."""
 
     class Meta:
@@ -66,7 +81,8 @@ class TagSerialiser(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class IngredientSerialiser(serializers.ModelSerializer):
+class IngredientSerialiser(SerializerMetricsMixin,
+                           serializers.ModelSerializer):
     """Сериализатор для работы с моделью Ingredient."""
 
     class Meta:
@@ -74,14 +90,36 @@ class IngredientSerialiser(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class RecipeMinifieldSerialiser(serializers.ModelSerializer):
+class ImageVariantsField(serializers.Field):
+    """Ссылки на уменьшенные копии картинки рецепта."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        request = self.context.get('request')
+        urls = {}
+        for variant, _, _ in IMAGE_VARIANTS:
+            url = default_storage.url(recipe.get_image_name(variant))
+            urls[variant] = (request.build_absolute_uri(url)
+                             if request else url)
+        return urls
+
+
+class RecipeMinifieldSerialiser(SerializerMetricsMixin,
+                                serializers.ModelSerializer):
+
+    images = ImageVariantsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'images', 'cooking_time')
 
 
-class IngredientRecipeReadSerialiser(serializers.ModelSerializer):
+class IngredientRecipeReadSerialiser(SerializerMetricsMixin,
+                                     serializers.ModelSerializer):
     id = serializers.ReadOnlyField(source='ingredient_id')
     name = serializers.ReadOnlyField(source='ingredient.name')
     measurement_unit = serializers.ReadOnlyField(
@@ -94,7 +132,7 @@ class IngredientRecipeReadSerialiser(serializers.ModelSerializer):
 
 
 class IngredientRecipeCreateUpdateSerialiser(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = serializers.IntegerField()
     amount = serializers.IntegerField(max_value=AMOUNT_MAX_VALUE,
                                       min_value=AMOUNT_MIN_VALUE)
 
@@ -103,10 +141,12 @@ class IngredientRecipeCreateUpdateSerialiser(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
-class RecipeReadSerialiser(serializers.ModelSerializer):
+class RecipeReadSerialiser(SerializerMetricsMixin,
+                           serializers.ModelSerializer):
 
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    images = ImageVariantsField()
     tags = TagSerialiser(many=True)
     author = UserSerializer()
     ingredients = IngredientRecipeReadSerialiser(
@@ -116,30 +156,37 @@ class RecipeReadSerialiser(serializers.ModelSerializer):
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time', 'tags', 'author',
-                  'ingredients', 'is_favorited', 'is_in_shopping_cart', 'text')
+        fields = ('id', 'name', 'image', 'images', 'cooking_time', 'tags',
+                  'author', 'ingredients', 'is_favorited',
+                  'is_in_shopping_cart', 'text')
         read_only_fields = ('id', 'name', 'image', 'cooking_time', 'tags',
                             'author', 'ingredients', 'is_favorited',
                             'is_in_shopping_cart', 'text')
 
-    def get_is_favorited(self, obj):
+    def get_user_flag(self, obj, flag, related_name):
+        if hasattr(obj, flag):
+            return getattr(obj, flag)
         request = self.context['request']
         return bool(request and request.user.is_authenticated
-                    and request.user.favorite_users.filter(recipe=obj))
+                    and getattr(request.user, related_name).filter(
+                        recipe=obj
+                    ).exists())
+
+    def get_is_favorited(self, obj):
+        return self.get_user_flag(obj, 'is_favorited', 'favorite_users')
 
     def get_is_in_shopping_cart(self, obj):
-        request = self.context['request']
-        return bool(request and request.user.is_authenticated
-                    and request.user.shopping_cart_user.filter(recipe=obj))
+        return self.get_user_flag(obj, 'is_in_shopping_cart',
+                                  'shopping_cart_user')
 
 
-class RecipeCreateUpdateSerialiser(serializers.ModelSerializer):
+class RecipeCreateUpdateSerialiser(SerializerMetricsMixin,
+                                   serializers.ModelSerializer):
 
     image = Base64ImageField(allow_empty_file=False, allow_null=False)
     cooking_time = serializers.IntegerField(min_value=COOKING_MIN_TIME,
                                             max_value=COOKING_MAX_TIME)
-    tags = serializers.PrimaryKeyRelatedField(many=True,
-                                              queryset=Tag.objects.all())
+    tags = serializers.ListField(child=serializers.IntegerField())
     ingredients = IngredientRecipeCreateUpdateSerialiser(many=True)
 
     class Meta:
@@ -147,6 +194,15 @@ class RecipeCreateUpdateSerialiser(serializers.ModelSerializer):
         fields = ('name', 'image', 'cooking_time', 'tags', 'ingredients',
                   'text')
 
+    @staticmethod
+    def get_missing_ids(model, ids):
+        """Идентификаторы, которых нет в таблице, одним запросом."""
+        return set(ids) - set(
+            model.objects.filter(id__in=ids).order_by().values_list(
+                'id', flat=True
+            )
+        )
+
     def validate_ingredients(self, value):
         if not value:
             raise serializers.ValidationError(
@@ -156,6 +212,14 @@ class RecipeCreateUpdateSerialiser(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 [{'ingredient': ['Ингредиенты повторяются.']}]
             )
+        missing = self.get_missing_ids(Ingredient,
+                                       [ingr['id'] for ingr in value])
+        if missing:
+            raise serializers.ValidationError([
+                {'id': [f'Ингредиент {ingr["id"]} не существует.']}
+                if ingr['id'] in missing else {}
+                for ingr in value
+            ])
         return value
 
     def validate_tags(self, value):
@@ -167,6 +231,11 @@ class RecipeCreateUpdateSerialiser(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Тэги повторяются.'
             )
+        missing = self.get_missing_ids(Tag, value)
+        if missing:
+            raise serializers.ValidationError(
+                [f'Тэг {tag} не существует.' for tag in sorted(missing)]
+            )
         return value
 
     @staticmethod
@@ -174,10 +243,55 @@ class RecipeCreateUpdateSerialiser(serializers.ModelSerializer):
         recipe.tags.set(tags)
         IngredientRecipe.objects.bulk_create(
             [IngredientRecipe(recipe=recipe,
-                              ingredient=ingr['id'],
+                              ingredient_id=ingr['id'],
                               amount=ingr['amount']) for ingr in ingredients]
         )
+        ingredients_bulk_changed.send(IngredientRecipe,
+                                      recipe_ids=(recipe.id, ))
+
+    @staticmethod
+    def update_tags(recipe, tags):
+        """Добавляет и удаляет только изменившиеся теги."""
+        current = {tag.id for tag in recipe.tags.all()}
+        if current - set(tags):
+            recipe.tags.remove(*(current - set(tags)))
+        if set(tags) - current:
+            recipe.tags.add(*(set(tags) - current))
+
+    @staticmethod
+    def update_ingredients(recipe, ingredients):
+        """Вставляет, изменяет и удаляет только изменившиеся строки."""
+        current = {
+            ingredient_recipe.ingredient_id: ingredient_recipe
+            for ingredient_recipe in recipe.ingredient_recipes.all()
+        }
+        amounts = {ingr['id']: ingr['amount'] for ingr in ingredients}
+        removed = current.keys() - amounts.keys()
+        if removed:
+            IngredientRecipe.objects.filter(
+                pk__in=[current[ingredient_id].pk
+                        for ingredient_id in removed]
+            ).delete()
+        changed = []
+        for ingredient_id, ingredient_recipe in current.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and amount != ingredient_recipe.amount:
+                ingredient_recipe.amount = amount
+                changed.append(ingredient_recipe)
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ('amount',))
+        added = IngredientRecipe.objects.bulk_create(
+            [IngredientRecipe(recipe=recipe,
+                              ingredient_id=ingredient_id,
+                              amount=amount)
+             for ingredient_id, amount in amounts.items()
+             if ingredient_id not in current]
+        )
+        if added:
+            ingredients_bulk_changed.send(IngredientRecipe,
+                                          recipe_ids=(recipe.id, ))
 
+    @transaction.atomic
     def create(self, validated_data):
         request = self.context['request']
         validated_data['author'] = request.user
@@ -187,33 +301,32 @@ class RecipeCreateUpdateSerialiser(serializers.ModelSerializer):
         self.set_tags_ingredients_in_recipe(recipe, tags, ingredients)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data, **kwargs):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
-        instance.tags.clear()
-        instance.ingredients.clear()
-        self.set_tags_ingredients_in_recipe(instance, tags, ingredients)
-        return super().update(instance, validated_data)
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        if tags is not None:
+            self.update_tags(instance, tags)
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
+        instance = super().update(instance, validated_data)
+        instance._prefetched_objects_cache = {}
+        return instance
 
     def to_representation(self, instance):
+        prefetch_related_objects([instance], 'tags', Prefetch(
+            'ingredient_recipes',
+            queryset=IngredientRecipe.objects.select_related('ingredient')
+        ))
         return RecipeReadSerialiser(instance, context=self.context).data
 
 
-class OptionUserSerializer(serializers.ModelSerializer):
+class OptionUserSerializer(SerializerMetricsMixin,
+                           serializers.ModelSerializer):
 
     class Meta:
         fields = ('recipe', 'user')
 
-    def validate(self, data):
-        option_model = self.Meta.model
-        if option_model.objects.filter(recipe=data['recipe'],
-                                       user=data['user']).exists():
-            raise serializers.ValidationError(
-                f'Не возможно добавить в {option_model._meta.verbose_name} '
-                'повторно.'
-            )
-        return data
-
     def to_representation(self, instance):
         return RecipeMinifieldSerialiser(instance.recipe,
                                          context=self.context).data
@@ -231,7 +344,65 @@ class ShoppingCartUserSerializer(OptionUserSerializer):
         model = ShoppingCartUser
 
 
-class SubscriptionUserSerializer(serializers.ModelSerializer):
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=OPTION_RECIPES_MAX_LENGTH,
+    )
+
+
+class CookQuerySerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=COOK_INGREDIENTS_MAX_LENGTH,
+    )
+    limit = serializers.IntegerField(
+        min_value=1,
+        max_value=COOK_MAX_LIMIT,
+        default=COOK_DEFAULT_LIMIT,
+    )
+
+
+class RecipeCoverageSerializer(RecipeMinifieldSerialiser):
+    matched = serializers.IntegerField(read_only=True)
+    ingredients_count = serializers.IntegerField(read_only=True)
+    coverage = serializers.FloatField(read_only=True)
+
+    class Meta(RecipeMinifieldSerialiser.Meta):
+        fields = RecipeMinifieldSerialiser.Meta.fields + (
+            'matched', 'ingredients_count', 'coverage'
+        )
+
+
+class RecipePopularSerializer(RecipeMinifieldSerialiser):
+    score = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeMinifieldSerialiser.Meta):
+        fields = RecipeMinifieldSerialiser.Meta.fields + ('score', )
+
+
+class ShoppingCartExportSerializer(SerializerMetricsMixin,
+                                   serializers.ModelSerializer):
+
+    url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ShoppingCartExport
+        fields = ('id', 'status', 'created', 'url')
+
+    def get_url(self, obj):
+        if obj.status != EXPORT_DONE:
+            return None
+        return self.context['request'].build_absolute_uri(reverse(
+            'recipes-shopping-cart-export-file',
+            kwargs={'export_id': obj.id}
+        ))
+
+
+class SubscriptionUserSerializer(SerializerMetricsMixin,
+                                 serializers.ModelSerializer):
 
     class Meta:
         model = SubscriptionUser
@@ -253,8 +424,9 @@ class SubscriptionUserSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         return UserWithRecipesSerializer(
-            User.objects.annotate(recipes_count=Count('recipes')).get(
-                id=instance.author.id
-            ),
+            annotate_author_recipes(
+                User.objects.all(),
+                get_recipes_limit(self.context.get('request'))
+            ).get(id=instance.author_id),
             context=self.context
         ).data
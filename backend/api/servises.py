@@ -1,4 +1,18 @@
-from django.http import HttpResponse
+import csv
+import hashlib
+import json
+from functools import lru_cache
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import (Count, Exists, F, FloatField, OuterRef, Prefetch,
+                              Subquery, Sum)
+from django.db.models.functions import Cast
+from django.http import HttpResponse, StreamingHttpResponse
+from PIL import Image
 from reportlab.lib.units import inch
 from reportlab.lib.utils import ImageReader
 from reportlab.pdfbase import pdfmetrics
@@ -7,15 +21,63 @@ from reportlab.pdfgen import canvas
 from rest_framework import status
 from rest_framework.response import Response
 
+from api.caches import get_popular_ranking
+from api.indexes import get_recipe_ingredient_index
+from core.signals import options_bulk_changed
+from recipes.constants import (OPTION_CREATED, OPTION_DELETED, OPTION_EXISTS,
+                               OPTION_MISSING, OPTION_NOT_FOUND, PDF_FONT,
+                               PDF_IMAGE_SIZE, PDF_LOGO_PATH,
+                               PDF_THUMBNAILS_CACHE_SIZE,
+                               SHOPPING_CART_CHUNK_SIZE)
+from recipes.models import IngredientRecipe, Recipe
 
-def get_pdf(ingredients, recipes, link):
 
+@lru_cache(maxsize=None)
+def register_font():
     pdfmetrics.registerFont(
-        TTFont('Ubuntu-Regular', 'data/Ubuntu-Regular.ttf', 'UTF-8')
+        TTFont(PDF_FONT, 'data/Ubuntu-Regular.ttf', 'UTF-8')
     )
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = ('attachment;'
-                                       'filename="ingredients.pdf"')
+
+
+@lru_cache(maxsize=None)
+def get_logo():
+    try:
+        return ImageReader(PDF_LOGO_PATH)
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=PDF_THUMBNAILS_CACHE_SIZE)
+def get_thumbnail(image_name):
+    """Уменьшенная копия картинки рецепта для списка покупок."""
+    try:
+        with default_storage.open(image_name) as image_file:
+            image = Image.open(image_file)
+            image.thumbnail((PDF_IMAGE_SIZE, PDF_IMAGE_SIZE))
+            return ImageReader(image.convert('RGB'))
+    except (OSError, ValueError):
+        return None
+
+
+def get_cart_key(ingredients, recipes, link):
+    """Ключ кеша по содержимому списка покупок."""
+    content = json.dumps(
+        (
+            link,
+            [(recipe.id, recipe.name, recipe.get_image_name('pdf'))
+             for recipe in recipes],
+            [(ingredient['name'], ingredient['measurement_unit'],
+              ingredient['amount']) for ingredient in ingredients],
+        ),
+        ensure_ascii=False
+    )
+    return 'shopping_cart_pdf:' + hashlib.sha256(
+        content.encode('utf-8')
+    ).hexdigest()
+
+
+def render_pdf(file, ingredients, recipes, link):
+    register_font()
     y_start = 600
     y = 750
     x = 100
@@ -29,16 +91,12 @@ def get_pdf(ingredients, recipes, link):
     font_middle = 25
     max_length = 40
     head_length = 5
-    logo_path = '../static/logo192.png'
 
-    p = canvas.Canvas(response)
-    try:
-        p.drawImage(
-            ImageReader(logo_path), x_start, y, size * inch, size * inch
-        )
-    except Exception:
-        ...
-    p.setFont('Ubuntu-Regular', font_big)
+    p = canvas.Canvas(file)
+    logo = get_logo()
+    if logo is not None:
+        p.drawImage(logo, x_start, y, size * inch, size * inch)
+    p.setFont(PDF_FONT, font_big)
     p.drawString(x, y, 'FOODGRAM')
     p.linkURL(
         link,
@@ -46,19 +104,20 @@ def get_pdf(ingredients, recipes, link):
         relative=1
     )
     y -= step_big
-    p.setFont('Ubuntu-Regular', font_middle)
+    p.setFont(PDF_FONT, font_middle)
     p.drawString(x_start, y, 'Для приготовления выбранных блюд:')
     y -= step_big
-    p.setFont('Ubuntu-Regular', font)
+    p.setFont(PDF_FONT, font)
     for recipe in recipes:
-        image = ImageReader(recipe.image)
-        p.drawImage(
-            image,
-            x_start + step,
-            y,
-            size_recipe * inch,
-            size_recipe * inch,
-        )
+        image = get_thumbnail(recipe.get_image_name('pdf'))
+        if image is not None:
+            p.drawImage(
+                image,
+                x_start + step,
+                y,
+                size_recipe * inch,
+                size_recipe * inch,
+            )
         p.drawString(
             x, y, f'{recipe.name[:max_length]}'
         )
@@ -66,14 +125,14 @@ def get_pdf(ingredients, recipes, link):
         if y <= 0:
             y = y_start
             p.showPage()
-            p.setFont('Ubuntu-Regular', font)
-    p.setFont('Ubuntu-Regular', font_middle)
+            p.setFont(PDF_FONT, font)
+    p.setFont(PDF_FONT, font_middle)
     p.drawString(x_start, y, 'Требуются следующие ингредиенты:')
     y -= step_big
     if y <= 0:
         y = y_start
         p.showPage()
-    p.setFont('Ubuntu-Regular', font)
+    p.setFont(PDF_FONT, font)
     for ingredient in ingredients:
         p.drawString(
             x, y,
@@ -85,31 +144,319 @@ def get_pdf(ingredients, recipes, link):
         if y <= 0:
             y = y_start
             p.showPage()
-            p.setFont('Ubuntu-Regular', font)
+            p.setFont(PDF_FONT, font)
 
     p.showPage()
     p.save()
+
+
+def get_shopping_cart(user):
+    return (
+        IngredientRecipe.objects.filter(
+            recipe__shopping_cart_user__user=user
+        ).values(
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit')
+        ).annotate(amount=Sum('amount')).order_by('name'),
+        Recipe.objects.filter(
+            shopping_cart_user__user=user
+        ).only('id', 'name', 'image', 'image_variants'),
+    )
+
+
+def get_pdf(ingredients, recipes, link):
+    ingredients = list(ingredients)
+    recipes = list(recipes)
+    key = get_cart_key(ingredients, recipes, link)
+    content = cache.get(key)
+    if content is None:
+        buffer = BytesIO()
+        render_pdf(buffer, ingredients, recipes, link)
+        content = buffer.getvalue()
+        cache.set(key, content, settings.PDF_CACHE_TIMEOUT)
+    response = HttpResponse(content, content_type='application/pdf')
+    response['Content-Disposition'] = ('attachment;'
+                                       'filename="ingredients.pdf"')
     return response
 
 
-def add_option_user(option_serializer, pk, request):
-    serializer = option_serializer(
-        data={'user': request.user.id, 'recipe': pk},
-        context={'request': request}
+class Echo:
+    """Буфер, который сразу возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def iter_shopping_cart_txt(ingredients):
+    for ingredient in ingredients:
+        yield (f'- {ingredient["name"]}, {ingredient["amount"]} '
+               f'{ingredient["measurement_unit"]}\n')
+
+
+def iter_shopping_cart_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('name', 'measurement_unit', 'amount'))
+    for ingredient in ingredients:
+        yield writer.writerow((ingredient['name'],
+                               ingredient['measurement_unit'],
+                               ingredient['amount']))
+
+
+def iter_shopping_cart_json(ingredients):
+    separator = '['
+    for ingredient in ingredients:
+        yield separator + json.dumps(ingredient, ensure_ascii=False)
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+SHOPPING_CART_STREAMS = {
+    'txt': (iter_shopping_cart_txt, 'text/plain; charset=utf-8'),
+    'csv': (iter_shopping_cart_csv, 'text/csv; charset=utf-8'),
+    'json': (iter_shopping_cart_json, 'application/json'),
+}
+
+
+def stream_shopping_cart(ingredients, file_format):
+    """Потоковая выдача списка ингредиентов через серверный курсор."""
+    iter_rows, content_type = SHOPPING_CART_STREAMS[file_format]
+    response = StreamingHttpResponse(
+        iter_rows(ingredients.iterator(chunk_size=SHOPPING_CART_CHUNK_SIZE)),
+        content_type=content_type
+    )
+    response['Content-Disposition'] = (
+        f'attachment;filename="ingredients.{file_format}"'
+    )
+    return response
+
+
+def insert_options_user(option_model, user, recipe_ids):
+    """Вставляет связи пользователя с рецептами, пропуская существующие.
+
+    Возвращает рецепты, строки которых вставлены именно этим вызовом:
+    строки, добавленные параллельным запросом, в них не попадают.
+    Вызывается внутри транзакции.
+    """
+    if connection.vendor == 'postgresql':
+        meta = option_model._meta
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote(meta.db_table)} '
+                f'({quote(meta.get_field("user").column)}, '
+                f'{quote(meta.get_field("recipe").column)}) '
+                f'SELECT %s, recipe_id FROM unnest(%s::bigint[]) '
+                f'AS recipe_id ON CONFLICT DO NOTHING RETURNING '
+                f'{quote(meta.get_field("recipe").column)}',
+                [user.id, list(recipe_ids)]
+            )
+            return {recipe_id for recipe_id, in cursor.fetchall()}
+    # SQLite пишет в БД по одной транзакции: параллельная запись между
+    # проверкой и вставкой завершит эту транзакцию ошибкой блокировки.
+    inserted = set(recipe_ids) - set(option_model.objects.filter(
+        user=user, recipe_id__in=recipe_ids
+    ).order_by().values_list('recipe_id', flat=True))
+    option_model.objects.bulk_create(
+        [option_model(user=user, recipe_id=recipe_id)
+         for recipe_id in inserted]
     )
-    serializer.is_valid(raise_exception=True)
-    serializer.save()
+    return inserted
+
+
+def delete_rows(model, pks):
+    """Удаляет строки по первичным ключам одним DELETE без сигналов.
+
+    Обработчики изменений вызывает пакетный сигнал вызывающего кода.
+    """
+    meta = model._meta
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(meta.db_table)} '
+            f'WHERE {quote(meta.pk.column)} IN '
+            f'({", ".join(["%s"] * len(pks))})',
+            list(pks)
+        )
+
+
+def add_options_user(option_model, user, recipe_ids):
+    """Добавляет рецепты в избранное или список покупок пакетом.
+
+    Возвращает результат для каждого идентификатора и найденные рецепты.
+    """
+    recipes = {
+        recipe.id: recipe
+        for recipe in Recipe.objects.filter(id__in=recipe_ids).annotate(
+            present=Exists(option_model.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            ))
+        )
+    }
+    created = set()
+    candidates = [recipe_id for recipe_id, recipe in recipes.items()
+                  if not recipe.present]
+    if candidates:
+        with transaction.atomic():
+            created = insert_options_user(option_model, user, candidates)
+            if created:
+                options_bulk_changed.send(option_model, user=user,
+                                          recipe_ids=sorted(created),
+                                          delta=1)
+    outcomes = {}
+    for recipe_id in recipe_ids:
+        if recipe_id not in recipes:
+            outcomes[recipe_id] = OPTION_NOT_FOUND
+        elif recipe_id in created:
+            outcomes[recipe_id] = OPTION_CREATED
+        else:
+            outcomes[recipe_id] = OPTION_EXISTS
+    return outcomes, recipes
+
+
+def remove_options_user(option_model, user, recipe_ids):
+    """Удаляет рецепты из избранного или списка покупок пакетом."""
+    with transaction.atomic():
+        deleted = dict(option_model.objects.filter(
+            user=user, recipe_id__in=recipe_ids
+        ).order_by().select_for_update().values_list('recipe_id', 'pk'))
+        if deleted:
+            # Без выборки объектов и сигналов post_delete: счётчики
+            # обновляются одним запросом по всем рецептам.
+            delete_rows(option_model, deleted.values())
+            options_bulk_changed.send(option_model, user=user,
+                                      recipe_ids=list(deleted), delta=-1)
+    return {
+        recipe_id: OPTION_DELETED if recipe_id in deleted else OPTION_MISSING
+        for recipe_id in recipe_ids
+    }
+
+
+def add_option_user(option_serializer, pk, request):
+    option_model = option_serializer.Meta.model
+    pk = int(pk)
+    outcomes, recipes = add_options_user(option_model, request.user, [pk])
+    if outcomes[pk] == OPTION_NOT_FOUND:
+        return Response(
+            {'recipe': [f'Рецепт {pk} не существует.']},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if outcomes[pk] == OPTION_EXISTS:
+        return Response(
+            {'non_field_errors': [
+                f'Не возможно добавить в {option_model._meta.verbose_name} '
+                'повторно.'
+            ]},
+            status=status.HTTP_400_BAD_REQUEST
+        )
     return Response(
-        serializer.data,
+        option_serializer(option_model(user=request.user,
+                                       recipe=recipes[pk]),
+                          context={'request': request}).data,
         status=status.HTTP_201_CREATED
     )
 
 
 def remove_option_user(option_model, pk, request):
-    option_user = option_model.objects.filter(user=request.user,
-                                              recipe=pk)
-    if option_user.exists():
-        option_user.delete()
+    pk = int(pk)
+    outcomes = remove_options_user(option_model, request.user, [pk])
+    if outcomes[pk] == OPTION_DELETED:
         return Response(status=status.HTTP_204_NO_CONTENT)
     return Response({'errors': 'Запись для удаления ещё не добавлена.'},
                     status=status.HTTP_400_BAD_REQUEST)
+
+
+def change_options_user(option_model, recipe_ids, request):
+    """Пакетное добавление (POST) или удаление (DELETE) рецептов."""
+    recipe_ids = list(dict.fromkeys(recipe_ids))
+    if request.method == 'POST':
+        outcomes, _ = add_options_user(option_model, request.user,
+                                       recipe_ids)
+    else:
+        outcomes = remove_options_user(option_model, request.user,
+                                       recipe_ids)
+    return Response([
+        {'id': recipe_id, 'status': outcome}
+        for recipe_id, outcome in outcomes.items()
+    ])
+
+
+def get_recipes_limit(request):
+    try:
+        return int(request.query_params.get('recipes_limit'))
+    except (TypeError, ValueError, AttributeError):
+        return 0
+
+
+def annotate_author_recipes(authors, recipes_limit=0):
+    """Последние recipes_limit рецептов авторов.
+
+    Ограничение применяется в БД коррелированным подзапросом по каждому
+    автору: он читает первые recipes_limit строк индекса
+    recipe_author_created_idx без сортировки, и загружаются только
+    выводимые рецепты. Число рецептов хранится в User.recipes_count.
+    """
+    recipes = Recipe.objects.order_by('-created', '-id')
+    if recipes_limit > 0:
+        recipes = recipes.filter(pk__in=Subquery(
+            Recipe.objects.filter(
+                author=OuterRef('author')
+            ).order_by('-created', '-id').values('pk')[:recipes_limit]
+        ))
+    return authors.prefetch_related(Prefetch('recipes', queryset=recipes))
+
+
+def search_cook_db(ingredient_ids, limit):
+    """Лучшие рецепты по доле имеющихся ингредиентов запросом к БД."""
+    sizes = IngredientRecipe.objects.filter(
+        recipe=OuterRef('recipe')
+    ).order_by().values('recipe').annotate(total=Count('pk')).values('total')
+    return list(IngredientRecipe.objects.filter(
+        ingredient_id__in=ingredient_ids
+    ).order_by().values('recipe').annotate(
+        matched=Count('pk'), size=Subquery(sizes)
+    ).annotate(
+        coverage=Cast('matched', FloatField()) / F('size')
+    ).order_by('-coverage', '-matched', '-recipe').values_list(
+        'recipe', 'matched', 'size'
+    )[:limit])
+
+
+def get_cook_recipes(ingredient_ids, limit):
+    """Рецепты с долей покрытия имеющимися ингредиентами.
+
+    Ранжирование выполняется по индексу процесса, пока он строится -
+    запросом к БД.
+    """
+    index = get_recipe_ingredient_index()
+    if index is not None:
+        ranking = index.search(ingredient_ids, limit)
+    else:
+        ranking = search_cook_db(ingredient_ids, limit)
+    recipes = Recipe.objects.in_bulk(
+        [recipe_id for recipe_id, _, _ in ranking]
+    )
+    result = []
+    for recipe_id, matched, size in ranking:
+        recipe = recipes.get(recipe_id)
+        if recipe is None:
+            continue
+        recipe.matched = matched
+        recipe.ingredients_count = size
+        recipe.coverage = round(matched / size, 4)
+        result.append(recipe)
+    return result
+
+
+def get_popular_recipes(window):
+    """Популярные рецепты окна с числом добавлений."""
+    ranking = get_popular_ranking(window)
+    recipes = Recipe.objects.in_bulk(
+        [recipe_id for recipe_id, _ in ranking]
+    )
+    result = []
+    for recipe_id, score in ranking:
+        recipe = recipes.get(recipe_id)
+        if recipe is not None:
+            recipe.score = score
+            result.append(recipe)
+    return result
@@ -0,0 +1,47 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from api.caches import bump_catalog_version
+from api.indexes import reindex_recipe_ingredients, reset_ingredient_index
+from core.signals import ingredients_bulk_changed, options_bulk_changed
+from recipes.models import (FavoriteUser, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCartUser, Tag)
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(**kwargs):
+    reset_ingredient_index()
+    bump_catalog_version('ingredients')
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tag_changed(**kwargs):
+    bump_catalog_version('tags')
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_changed(**kwargs):
+    bump_catalog_version('recipes')
+
+
+@receiver((post_save, post_delete), sender=IngredientRecipe)
+def ingredient_recipe_changed(instance, **kwargs):
+    reindex_recipe_ingredients((instance.recipe_id, ))
+
+
+@receiver(ingredients_bulk_changed, sender=IngredientRecipe)
+def ingredients_changed(recipe_ids, **kwargs):
+    reindex_recipe_ingredients(recipe_ids)
+
+
+@receiver((post_save, post_delete), sender=FavoriteUser)
+@receiver((post_save, post_delete), sender=ShoppingCartUser)
+def user_recipes_changed(instance, **kwargs):
+    bump_catalog_version(f'recipes:user:{instance.user_id}')
+
+
+@receiver(options_bulk_changed, sender=FavoriteUser)
+@receiver(options_bulk_changed, sender=ShoppingCartUser)
+def options_changed(user, **kwargs):
+    bump_catalog_version(f'recipes:user:{user.id}')
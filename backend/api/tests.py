@@ -1,8 +1,63 @@
+import json
+import shutil
+import tempfile
+from datetime import timedelta
 from http import HTTPStatus
+from io import BytesIO, StringIO
+from unittest import mock
 
-from django.test import TestCase
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Count, F
+from django.http import StreamingHttpResponse
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
 from rest_framework.test import APIClient
 
+from api.caches import get_catalog_version, next_catalog_version
+from api.exports import run_export
+from api.indexes import (RECIPE_INGREDIENTS_CATALOG, RecipeIngredientIndex,
+                         build_recipe_ingredient_index, get_ingredient_index,
+                         get_recipe_ingredient_index, reset_ingredient_index,
+                         reset_recipe_ingredient_index)
+from api.serializers import RecipeCreateUpdateSerialiser
+from api.servises import add_options_user, insert_options_user, search_cook_db
+from core.management.commands.fan_out_feeds import fan_out_feeds
+from core.management.commands.generate_data import GENERATED_PASSWORD
+from core.management.commands.prune_activity import prune_activity
+from core.management.commands.recount import recount
+from recipes.constants import (EXPORT_DONE, EXPORT_FAILED, EXPORT_PENDING,
+                               IMAGE_VARIANTS, OPTION_EXISTS, POPULAR_ALL_TIME,
+                               POPULAR_WEEK, TAG_MASK_BITS)
+from recipes.models import (FavoriteUser, FeedRecipe, Ingredient,
+                            IngredientRecipe, Recipe, RecipeActivity,
+                            ShoppingCartExport, ShoppingCartUser, Tag)
+from users.models import SubscriptionUser, User
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
+TEMP_EXPORT_ROOT = tempfile.mkdtemp()
+
+AUTHORS_COUNT = 8
+RECIPES_PER_AUTHOR = 8
+TAGS_COUNT = 4
+INGREDIENTS_COUNT = 30
+INGREDIENTS_PER_RECIPE = 5
+SMALL_PAGE = 6
+BIG_PAGE = 60
+
+
+def make_image(name='image.png'):
+    buffer = BytesIO()
+    Image.new('RGB', (8, 8), 'red').save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(),
+                              content_type='image/png')
+
 
 class CatsAPITestCase(TestCase):
     def setUp(self):
@@ -12,3 +67,1675 @@ class CatsAPITestCase(TestCase):
         """Проверка доступности списка рецептов."""
         response = self.client.get('/api/recipes/')
         self.assertEqual(response.status_code, HTTPStatus.OK)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, EXPORT_ROOT=TEMP_EXPORT_ROOT)
+class QueryBudgetTestCase(TestCase):
+    """Бюджет SQL-запросов для эндпоинтов API.
+
+    Бюджет не зависит от размера страницы: каждая проверка списка
+    выполняется для маленькой и большой страницы.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}',
+                               color=f'#0000{number:02d}',
+                               slug=f'tag{number}')
+            for number in range(TAGS_COUNT)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(INGREDIENTS_COUNT)
+        ]
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@foodgram.ru',
+            first_name='Читатель', last_name='Читатель', password='pass'
+        )
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{number}', email=f'a{number}@foodgram.ru',
+                first_name='Автор', last_name=f'{number}', password='pass'
+            )
+            for number in range(AUTHORS_COUNT)
+        ]
+        image = make_image()
+        cls.recipes = []
+        for author in cls.authors:
+            for number in range(RECIPES_PER_AUTHOR):
+                recipe = Recipe(name=f'Рецепт {author.id}-{number}',
+                                author=author, text='Описание',
+                                cooking_time=number + 1)
+                recipe.image.save('image.png', image, save=False)
+                recipe.save()
+                cls.recipes.append(recipe)
+        for index, recipe in enumerate(cls.recipes):
+            recipe.tags.set(cls.tags[:index % TAGS_COUNT + 1])
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(
+                    recipe=recipe,
+                    ingredient=cls.ingredients[
+                        (index + shift) % INGREDIENTS_COUNT
+                    ],
+                    amount=shift + 1
+                )
+                for shift in range(INGREDIENTS_PER_RECIPE)
+            )
+        FavoriteUser.objects.bulk_create(
+            FavoriteUser(user=cls.user, recipe=recipe)
+            for recipe in cls.recipes[::2]
+        )
+        ShoppingCartUser.objects.bulk_create(
+            ShoppingCartUser(user=cls.user, recipe=recipe)
+            for recipe in cls.recipes[::3]
+        )
+        SubscriptionUser.objects.bulk_create(
+            SubscriptionUser(user=cls.user, author=author)
+            for author in cls.authors[::2]
+        )
+        recount()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        shutil.rmtree(TEMP_EXPORT_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        reset_ingredient_index()
+        self.initial_ids = {
+            'favorite': {recipe.id for recipe in self.recipes[::2]},
+            'shopping_cart': {recipe.id for recipe in self.recipes[::3]},
+        }
+        self.guest_client = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertMaxQueries(self, budget, client, method, url, data=None,
+                         status=HTTPStatus.OK):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(client, method)(url, data, format='json')
+        self.assertEqual(response.status_code, status, url)
+        queries = context.captured_queries
+        if len(queries) > budget:
+            self.fail(
+                f'{method.upper()} {url} {data or ""}: {len(queries)} '
+                f'запросов при бюджете {budget}:\n' + '\n'.join(
+                    f'{number}. {query["sql"]}'
+                    for number, query in enumerate(queries, start=1)
+                )
+            )
+        return response
+
+    def assertListBudget(self, budget, client, url, params=None):
+        for limit in (SMALL_PAGE, BIG_PAGE):
+            self.assertMaxQueries(budget, client, 'get', url,
+                                  {**(params or {}), 'limit': limit})
+
+    def test_recipe_list(self):
+        """Список рецептов со всеми комбинациями фильтров."""
+        tags = [tag.slug for tag in self.tags[:2]]
+        filters = (
+            {},
+            {'tags': tags},
+            {'author': self.authors[0].id},
+            {'is_favorited': 1},
+            {'is_in_shopping_cart': 1},
+            {'is_favorited': 1, 'is_in_shopping_cart': 1},
+            {'tags': tags, 'author': self.authors[1].id, 'is_favorited': 1,
+             'is_in_shopping_cart': 1},
+        )
+        for params in filters:
+            with self.subTest(params=params):
+                self.assertListBudget(8, self.client, '/api/recipes/',
+                                      params)
+                self.assertListBudget(6, self.guest_client,
+                                      '/api/recipes/', params)
+
+    def test_recipe_cursor_pagination(self):
+        """Курсорная пагинация проходит все рецепты без COUNT(*)."""
+        tags = [tag.slug for tag in self.tags[:2]]
+        for params in ({}, {'tags': tags}, {'is_favorited': 1},
+                       {'tags': tags, 'is_in_shopping_cart': 1}):
+            with self.subTest(params=params):
+                expected = [
+                    recipe['id'] for recipe in self.client.get(
+                        '/api/recipes/', {**params, 'limit': BIG_PAGE * 2}
+                    ).data['results']
+                ]
+                ids = []
+                url, data = '/api/recipes/', {**params, 'cursor': '',
+                                              'limit': SMALL_PAGE}
+                while url:
+                    with CaptureQueriesContext(connection) as context:
+                        response = self.assertMaxQueries(
+                            6, self.client, 'get', url, data
+                        )
+                    if data is None:
+                        self.assertTrue(any(
+                            '"recipes_recipe"."created" <=' in query['sql']
+                            for query in context.captured_queries
+                        ))
+                    self.assertNotIn('count', response.data)
+                    ids += [recipe['id']
+                            for recipe in response.data['results']]
+                    url, data = response.data['next'], None
+                self.assertEqual(ids, expected)
+        self.assertMaxQueries(0, self.client, 'get', '/api/recipes/',
+                              {'cursor': 'broken'},
+                              status=HTTPStatus.NOT_FOUND)
+
+    def test_recipe_detail(self):
+        url = f'/api/recipes/{self.recipes[0].id}/'
+        self.assertMaxQueries(6, self.client, 'get', url)
+        self.assertMaxQueries(3, self.guest_client, 'get', url)
+
+    def test_recipe_create_update_delete(self):
+        data = {
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 5,
+            'image': ('data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAA'
+                      'BCAYAAAAfFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJR'
+                      'U5ErkJggg=='),
+            'tags': [tag.id for tag in self.tags],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': 10}
+                for ingredient in self.ingredients
+            ],
+        }
+        response = self.assertMaxQueries(
+            20, self.client, 'post', '/api/recipes/', data,
+            status=HTTPStatus.CREATED
+        )
+        url = f'/api/recipes/{response.data["id"]}/'
+        self.assertMaxQueries(15, self.client, 'patch', url, data)
+        self.assertMaxQueries(15, self.client, 'delete', url,
+                              status=HTTPStatus.NO_CONTENT)
+
+    def test_recipe_update_diff(self):
+        """Изменение рецепта затрагивает только изменившиеся строки."""
+        recipe = self.recipes[0]
+        IngredientRecipe.objects.filter(recipe=recipe).delete()
+        recipe.ingredients.set(self.ingredients,
+                               through_defaults={'amount': 10})
+        recipe.tags.set(self.tags[:2])
+        self.client.force_authenticate(recipe.author)
+        url = f'/api/recipes/{recipe.id}/'
+        ingredients = [{'id': ingredient.id, 'amount': 10}
+                       for ingredient in self.ingredients]
+        data = {'tags': [tag.id for tag in self.tags[:2]],
+                'ingredients': ingredients}
+        with CaptureQueriesContext(connection) as context:
+            self.assertMaxQueries(15, self.client, 'patch', url, data)
+        self.assertFalse(any(
+            'recipes_ingredientrecipe' in query['sql']
+            and not query['sql'].startswith('SELECT')
+            for query in context.captured_queries
+        ))
+        ingredients[0]['amount'] = 20
+        data = {'tags': [tag.id for tag in self.tags[1:]],
+                'ingredients': ingredients[1:] + ingredients[:1]}
+        data['ingredients'][0]['amount'] = 30
+        data['ingredients'].pop()
+        self.assertMaxQueries(23, self.client, 'patch', url, data)
+        self.assertEqual(
+            set(recipe.tags.values_list('id', flat=True)),
+            {tag.id for tag in self.tags[1:]}
+        )
+        self.assertEqual(
+            dict(recipe.ingredient_recipes.values_list('ingredient_id',
+                                                       'amount')),
+            {ingredient['id']: ingredient['amount']
+             for ingredient in data['ingredients']}
+        )
+
+    def test_recipe_invalid_ids(self):
+        """Несуществующие теги и ингредиенты проверяются одним запросом."""
+        recipe = self.recipes[0]
+        self.client.force_authenticate(recipe.author)
+        data = {'tags': [0],
+                'ingredients': [{'id': self.ingredients[0].id, 'amount': 1},
+                                {'id': 0, 'amount': 1}]}
+        response = self.assertMaxQueries(
+            7, self.client, 'patch', f'/api/recipes/{recipe.id}/', data,
+            status=HTTPStatus.BAD_REQUEST
+        )
+        self.assertIn('tags', response.data)
+        self.assertEqual(response.data['ingredients'][0], {})
+        self.assertIn('id', response.data['ingredients'][1])
+
+    def test_tags_and_ingredients(self):
+        self.assertMaxQueries(2, self.guest_client, 'get', '/api/tags/')
+        self.assertMaxQueries(1, self.guest_client, 'get',
+                              f'/api/tags/{self.tags[0].id}/')
+        self.assertMaxQueries(2, self.guest_client, 'get',
+                              '/api/ingredients/')
+        self.assertMaxQueries(1, self.guest_client, 'get',
+                              '/api/ingredients/', {'name': 'ингр'})
+        self.assertMaxQueries(1, self.guest_client, 'get',
+                              f'/api/ingredients/{self.ingredients[0].id}/')
+
+    def test_users(self):
+        self.assertListBudget(3, self.client, '/api/users/')
+        self.assertListBudget(2, self.guest_client, '/api/users/')
+        self.assertMaxQueries(2, self.client, 'get',
+                              f'/api/users/{self.authors[0].id}/')
+        self.assertMaxQueries(1, self.client, 'get', '/api/users/me/')
+
+    def test_subscriptions(self):
+        self.assertListBudget(4, self.client, '/api/users/subscriptions/')
+        self.assertListBudget(4, self.client, '/api/users/subscriptions/',
+                              {'recipes_limit': 3})
+
+    def test_subscriptions_recipes_limit(self):
+        """recipes_limit ограничивает выборку рецептов в БД."""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/users/subscriptions/',
+                                       {'recipes_limit': 2})
+        for author in response.data['results']:
+            self.assertEqual(len(author['recipes']), 2)
+            self.assertEqual(author['recipes_count'], RECIPES_PER_AUTHOR)
+        sql, = (query['sql'] for query in context.captured_queries
+                if 'LIMIT 2' in query['sql']
+                and 'recipes_recipe' in query['sql'])
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = cursor.fetchall()
+            subqueries = {node for node, _, _, detail in plan
+                          if 'SUBQUERY' in detail}
+            subquery_plan = ' '.join(detail for _, parent, _, detail in plan
+                                     if parent in subqueries)
+            self.assertIn('recipe_author_created_idx', subquery_plan)
+            self.assertNotIn('TEMP B-TREE', subquery_plan)
+
+    def test_subscribe_toggle(self):
+        url = f'/api/users/{self.authors[1].id}/subscribe/'
+        self.assertMaxQueries(12, self.client, 'post', url,
+                              status=HTTPStatus.CREATED)
+        self.assertMaxQueries(6, self.client, 'delete', url,
+                              status=HTTPStatus.NO_CONTENT)
+
+    def test_favorite_and_cart_toggles(self):
+        recipe = self.recipes[1]
+        for option in ('favorite', 'shopping_cart'):
+            with self.subTest(option=option):
+                url = f'/api/recipes/{recipe.id}/{option}/'
+                self.assertMaxQueries(8, self.client, 'post', url,
+                                      status=HTTPStatus.CREATED)
+                self.assertMaxQueries(6, self.client, 'delete', url,
+                                      status=HTTPStatus.NO_CONTENT)
+
+    def test_bulk_favorite_and_cart(self):
+        """Пакетное изменение не зависит от числа рецептов."""
+        recipes = self.recipes[1:8]
+        ids = [recipe.id for recipe in recipes] + [10 ** 6]
+        for option in ('favorite', 'shopping_cart'):
+            with self.subTest(option=option):
+                url = f'/api/recipes/{option}/'
+                response = self.assertMaxQueries(
+                    8, self.client, 'post', url, {'recipes': ids}
+                )
+                self.assertEqual(
+                    [item['status'] for item in response.data],
+                    ['exists' if recipe.id in self.initial_ids[option]
+                     else 'created' for recipe in recipes] + ['not_found']
+                )
+                response = self.assertMaxQueries(
+                    6, self.client, 'delete', url, {'recipes': ids}
+                )
+                self.assertEqual(
+                    [item['status'] for item in response.data],
+                    ['deleted'] * len(recipes) + ['missing']
+                )
+        self.assertEqual(
+            Recipe.objects.get(pk=recipes[1].pk).favorites_count, 0
+        )
+
+    def test_download_shopping_cart(self):
+        self.assertMaxQueries(3, self.client, 'get',
+                              '/api/recipes/download_shopping_cart/')
+
+    @mock.patch('api.views.start_export',
+                lambda export, link: run_export(export.id, link))
+    def test_shopping_cart_export(self):
+        """Выгрузка списка покупок формируется отдельной задачей."""
+        response = self.client.post(
+            '/api/recipes/download_shopping_cart/exports/'
+        )
+        self.assertEqual(response.status_code, HTTPStatus.ACCEPTED)
+        response = self.client.get(
+            f'/api/recipes/download_shopping_cart/exports/'
+            f'{response.data["id"]}/'
+        )
+        self.assertEqual(response.data['status'], EXPORT_DONE)
+        url = response.data['url']
+        export = ShoppingCartExport.objects.get(id=response.data['id'])
+        self.assertTrue(export.file.path.startswith(TEMP_EXPORT_ROOT))
+        self.assertRegex(export.file.name,
+                         r'^shopping_cart/[0-9a-f]{32}\.pdf$')
+        other = APIClient()
+        other.force_authenticate(self.authors[0])
+        self.assertEqual(other.get(url).status_code, HTTPStatus.NOT_FOUND)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertTrue(b''.join(response.streaming_content).startswith(
+            b'%PDF'
+        ))
+
+    def test_shopping_cart_streaming_formats(self):
+        """Текстовые форматы списка покупок отдаются потоком."""
+        url = '/api/recipes/download_shopping_cart/'
+        expected = IngredientRecipe.objects.filter(
+            recipe__shopping_cart_user__user=self.user
+        ).values('ingredient').distinct().count()
+        for file_format, content_type in (('txt', 'text/plain'),
+                                          ('csv', 'text/csv'),
+                                          ('json', 'application/json')):
+            with self.subTest(file_format=file_format):
+                response = self.assertMaxQueries(2, self.client, 'get', url,
+                                                 {'format': file_format})
+                self.assertTrue(response.streaming)
+                self.assertTrue(response['Content-Type'].startswith(
+                    content_type
+                ))
+                content = b''.join(response.streaming_content).decode()
+                if file_format == 'json':
+                    self.assertEqual(len(json.loads(content)), expected)
+                else:
+                    self.assertEqual(
+                        len(content.splitlines()),
+                        expected + (file_format == 'csv')
+                    )
+        self.assertMaxQueries(0, self.client, 'get', url, {'format': 'doc'},
+                              status=HTTPStatus.BAD_REQUEST)
+
+    def test_shopping_cart_pdf_cached(self):
+        """Неизменный список покупок отдаётся из кеша."""
+        url = '/api/recipes/download_shopping_cart/'
+        first = self.client.get(url)
+        self.assertEqual(first['Content-Type'], 'application/pdf')
+        with mock.patch('api.servises.render_pdf') as render_pdf:
+            second = self.client.get(url)
+        render_pdf.assert_not_called()
+        self.assertEqual(first.content, second.content)
+        ShoppingCartUser.objects.create(user=self.user,
+                                        recipe=self.recipes[1])
+        with mock.patch('api.servises.render_pdf') as render_pdf:
+            self.client.get(url)
+        render_pdf.assert_called_once()
+
+
+@override_settings(EXPORT_ROOT=TEMP_EXPORT_ROOT)
+class ShoppingCartExportTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user', email='u@u.ru')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_EXPORT_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def make_export(self, age, **kwargs):
+        export = ShoppingCartExport.objects.create(user=self.user, **kwargs)
+        ShoppingCartExport.objects.filter(id=export.id).update(
+            created=timezone.now() - timedelta(seconds=age)
+        )
+        return export
+
+    def test_stale_export_failed(self):
+        """Выгрузка, потерянная упавшим процессом, не висит вечно."""
+        export = self.make_export(settings.EXPORT_TIMEOUT + 1)
+        response = self.client.get(
+            f'/api/recipes/download_shopping_cart/exports/{export.id}/'
+        )
+        self.assertEqual(response.data['status'], EXPORT_FAILED)
+        run_export(export.id, 'http://testserver/')
+        export.refresh_from_db()
+        self.assertEqual(export.status, EXPORT_FAILED)
+        self.assertFalse(export.file)
+
+    @mock.patch('api.exports.render_pdf', side_effect=OSError('disk full'))
+    def test_export_error_logged(self, render_pdf):
+        export = self.make_export(0)
+        with self.assertLogs('api.exports', 'ERROR') as logs:
+            run_export(export.id, 'http://testserver/')
+        self.assertIn('disk full', logs.output[0])
+        export.refresh_from_db()
+        self.assertEqual(export.status, EXPORT_FAILED)
+
+    def test_clean_exports(self):
+        """Команда удаляет устаревшие выгрузки вместе с файлами."""
+        export = self.make_export(0)
+        run_export(export.id, 'http://testserver/')
+        export.refresh_from_db()
+        fresh = self.make_export(0, status=EXPORT_PENDING)
+        ShoppingCartExport.objects.filter(id=export.id).update(
+            created=timezone.now() - timedelta(
+                seconds=settings.EXPORT_EXPIRY + 1
+            )
+        )
+        storage = export.file.storage
+        self.assertTrue(storage.exists(export.file.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('clean_exports', stdout=StringIO())
+        self.assertFalse(storage.exists(export.file.name))
+        self.assertEqual(
+            list(ShoppingCartExport.objects.values_list('id', flat=True)),
+            [fresh.id]
+        )
+
+
+class IngredientIndexTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('Соль', 'соус', 'сахар', 'Сыр', 'мука', 'Соль морская'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+        reset_ingredient_index()
+        self.client = APIClient()
+
+    def test_search_matches_database(self):
+        """Поиск по индексу не зависит от регистра."""
+        index = get_ingredient_index()
+        for prefix in ('с', 'СО', 'соль', 'мука', 'х', ''):
+            with self.subTest(prefix=prefix):
+                self.assertEqual(
+                    {item['id'] for item in index.search(prefix)},
+                    {
+                        ingredient.id
+                        for ingredient in Ingredient.objects.all()
+                        if ingredient.name.casefold().startswith(
+                            prefix.casefold()
+                        )
+                    }
+                )
+
+    def test_warm_index_without_queries(self):
+        """Тёплый индекс отвечает без запросов к БД."""
+        get_ingredient_index()
+        get_catalog_version('ingredients')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/ingredients/', {'name': 'со'})
+        self.assertEqual(
+            [item['name'] for item in response.data],
+            ['Соль', 'Соль морская', 'соус']
+        )
+
+    def test_index_rebuilt_on_change(self):
+        """Изменение ингредиентов сбрасывает индекс."""
+        get_ingredient_index()
+        Ingredient.objects.create(name='Сода', measurement_unit='г')
+        response = self.client.get('/api/ingredients/', {'name': 'сод'})
+        self.assertEqual([item['name'] for item in response.data], ['Сода'])
+
+    def test_index_rebuilt_on_foreign_write(self):
+        """Запись другого процесса перестраивает индекс по версии."""
+        index = get_ingredient_index()
+        self.assertIs(get_ingredient_index(), index)
+        Ingredient.objects.bulk_create(
+            (Ingredient(name='Сода', measurement_unit='г'), )
+        )
+        self.assertIs(get_ingredient_index(), index)
+        next_catalog_version('ingredients')
+        response = self.client.get('/api/ingredients/', {'name': 'сод'})
+        self.assertEqual([item['name'] for item in response.data], ['Сода'])
+        self.assertIsNot(get_ingredient_index(), index)
+
+
+class RecipeIngredientIndexTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user', email='u@u.ru')
+        cls.tag = Tag.objects.create(name='Обед', color='#000001',
+                                     slug='lunch')
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(5)
+        ]
+        cls.recipes = []
+        for number, count in enumerate((1, 2, 4, 5)):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {number}', author=cls.user, text='Текст',
+                cooking_time=10, image='recipes/image.png'
+            )
+            recipe.ingredients.set(cls.ingredients[:count],
+                                   through_defaults={'amount': 10})
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        reset_recipe_ingredient_index()
+        self.client = APIClient()
+        patcher = mock.patch('api.indexes.start_recipe_ingredient_index_build')
+        self.start_build = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def cook(self, *ingredients, limit=10):
+        response = self.client.get('/api/recipes/cook/', {
+            'ingredients': [ingredient.id for ingredient in ingredients],
+            'limit': limit,
+        })
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [(recipe['id'], recipe['matched'], recipe['ingredients_count'])
+                for recipe in response.data]
+
+    def test_search_matches_database(self):
+        """Ранжирование по индексу совпадает с запросом к БД."""
+        index = build_recipe_ingredient_index()
+        for count in range(1, 6):
+            for limit in (1, 3, 10):
+                with self.subTest(count=count, limit=limit):
+                    ingredient_ids = [ingredient.id for ingredient
+                                      in self.ingredients[count - 1::-1]]
+                    self.assertEqual(
+                        index.search(ingredient_ids, limit),
+                        search_cook_db(ingredient_ids, limit)
+                    )
+
+    def test_cook_ranked_by_coverage(self):
+        """Рецепты упорядочены по доле имеющихся ингредиентов."""
+        build_recipe_ingredient_index()
+        first, second, third, fourth = (recipe.id for recipe in self.recipes)
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                self.cook(*self.ingredients[:2]),
+                [(second, 2, 2), (first, 1, 1), (third, 2, 4), (fourth, 2, 5)]
+            )
+        self.assertEqual(self.cook(self.ingredients[4], limit=1),
+                         [(fourth, 1, 5)])
+        response = self.client.get('/api/recipes/cook/')
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_index_updated_on_write(self):
+        """Запись рецепта меняет индекс без его перестроения."""
+        index = build_recipe_ingredient_index()
+        recipe = self.recipes[3]
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/recipes/{recipe.id}/', {
+                'tags': [self.tag.id],
+                'ingredients': [{'id': self.ingredients[4].id, 'amount': 1}],
+            }, format='json')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertIs(get_recipe_ingredient_index(), index)
+        self.assertEqual(self.cook(self.ingredients[4]), [(recipe.id, 1, 1)])
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+            IngredientRecipe.objects.filter(
+                recipe=self.recipes[0]
+            ).update(ingredient=self.ingredients[4])
+            IngredientRecipe.objects.get(recipe=self.recipes[0]).save()
+        self.assertEqual(self.cook(self.ingredients[4]),
+                         [(self.recipes[0].id, 1, 1)])
+        self.assertEqual(len(index), 3)
+        self.assertIs(get_recipe_ingredient_index(), index)
+        self.start_build.assert_not_called()
+
+    def test_rebuilt_on_foreign_write(self):
+        """Чужая запись не перестраивает индекс в запросе."""
+        self.assertIsNone(get_recipe_ingredient_index())
+        self.start_build.assert_called_once()
+        self.assertEqual(self.cook(self.ingredients[4]),
+                         [(self.recipes[3].id, 1, 5)])
+        index = build_recipe_ingredient_index()
+        self.start_build.reset_mock()
+        next_catalog_version(RECIPE_INGREDIENTS_CATALOG)
+        with self.assertNumQueries(1):
+            self.assertIs(get_recipe_ingredient_index(), index)
+        self.start_build.assert_called_once()
+
+    def test_changes_during_build_kept(self):
+        """Запись рецепта во время построения попадает в новый индекс."""
+        recipe = self.recipes[3]
+        rows = IngredientRecipe.objects.order_by().values_list(
+            'recipe_id', 'ingredient_id'
+        )
+        snapshot = list(rows)
+
+        def write_during_build(rows):
+            with self.captureOnCommitCallbacks(execute=True):
+                IngredientRecipe.objects.filter(recipe=recipe).delete()
+            return RecipeIngredientIndex(snapshot)
+
+        with mock.patch('api.indexes.RecipeIngredientIndex',
+                        side_effect=write_during_build):
+            index = build_recipe_ingredient_index()
+        self.assertNotIn(recipe.id, index.recipes)
+        self.assertEqual(index.version,
+                         get_catalog_version(RECIPE_INGREDIENTS_CATALOG))
+
+
+class FeedTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, cls.author, cls.popular, cls.other = (
+            User.objects.create(username=name, email=f'{name}@foodgram.ru')
+            for name in ('reader', 'author', 'popular', 'other')
+        )
+        cls.old_recipe = cls.create_recipe(cls.author)
+
+    @staticmethod
+    def create_recipe(author):
+        return Recipe.objects.create(
+            name='Рецепт', author=author, text='Текст', cooking_time=10,
+            image='recipes/image.png'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def get_feed(self, queries=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        if queries is not None:
+            self.assertEqual(len(context.captured_queries), queries)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_feed_fan_out(self):
+        """Лента заполняется при подписке и публикации рецептов."""
+        SubscriptionUser.objects.create(user=self.reader, author=self.author)
+        self.create_recipe(self.other)
+        recipe = self.create_recipe(self.author)
+        self.assertEqual(self.get_feed(queries=5),
+                         [recipe.id, self.old_recipe.id])
+        recipe.delete()
+        cache.clear()
+        self.assertEqual(self.get_feed(), [self.old_recipe.id])
+        SubscriptionUser.objects.get(user=self.reader,
+                                     author=self.author).delete()
+        self.assertFalse(FeedRecipe.objects.filter(user=self.reader).exists())
+        self.assertEqual(self.get_feed(), [])
+        response = APIClient().get('/api/recipes/feed/')
+        self.assertEqual(response.status_code, HTTPStatus.UNAUTHORIZED)
+
+    def test_feed_cursor(self):
+        """Лента листается курсором по полям строк ленты без OFFSET."""
+        SubscriptionUser.objects.create(user=self.reader, author=self.author)
+        recipes = [self.create_recipe(self.author) for _ in range(2)]
+        expected = [recipe.id for recipe in reversed(recipes)]
+        expected.append(self.old_recipe.id)
+        url, ids = '/api/recipes/feed/?limit=1', []
+        while url:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, HTTPStatus.OK)
+            self.assertNotIn('count', response.data)
+            sql, = (query['sql'] for query in context.captured_queries
+                    if 'JOIN "recipes_feedrecipe"' in query['sql'])
+            self.assertNotIn('OFFSET', sql)
+            self.assertIn('"recipes_feedrecipe"."created" AS "feed_created"',
+                          sql)
+            self.assertIn('ORDER BY "feed_created" DESC', sql)
+            self.assertEqual(sql.count('JOIN "recipes_feedrecipe"'), 1)
+            if ids:
+                self.assertIn('"recipes_feedrecipe"."created" <=', sql)
+            ids += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, expected)
+
+    @override_settings(FEED_PULL_SUBSCRIBERS=2)
+    def test_feed_pull_for_popular_authors(self):
+        """Рецепты популярных авторов выбираются при чтении ленты."""
+        SubscriptionUser.objects.create(user=self.reader, author=self.author)
+        SubscriptionUser.objects.create(user=self.reader, author=self.popular)
+        SubscriptionUser.objects.create(user=self.other, author=self.popular)
+        self.assertTrue(User.objects.get(pk=self.popular.pk).feed_pulled)
+        recipe = self.create_recipe(self.popular)
+        self.assertFalse(FeedRecipe.objects.filter(recipe=recipe).exists())
+        self.assertEqual(self.get_feed(), [recipe.id, self.old_recipe.id])
+        SubscriptionUser.objects.get(user=self.other,
+                                     author=self.popular).delete()
+        late_recipe = self.create_recipe(self.popular)
+        self.assertFalse(FeedRecipe.objects.filter(
+            author=self.popular
+        ).exists())
+        self.assertEqual(self.get_feed(),
+                         [late_recipe.id, recipe.id, self.old_recipe.id])
+        self.assertEqual(fan_out_feeds(), 1)
+        self.assertFalse(User.objects.get(pk=self.popular.pk).feed_pulled)
+        self.assertEqual(
+            set(FeedRecipe.objects.filter(
+                author=self.popular
+            ).values_list('user', 'recipe')),
+            {(self.reader.id, recipe.id), (self.reader.id, late_recipe.id)}
+        )
+        self.assertEqual(self.get_feed(),
+                         [late_recipe.id, recipe.id, self.old_recipe.id])
+        self.assertEqual(fan_out_feeds(), 0)
+
+    @override_settings(FEED_PULL_SUBSCRIBERS=2)
+    def test_fan_out_drops_unsubscribed(self):
+        """Строки лент отписавшихся во время копирования удаляются."""
+        SubscriptionUser.objects.create(user=self.reader, author=self.author)
+        User.objects.filter(pk=self.author.pk).update(feed_pulled=True)
+        FeedRecipe.objects.create(user=self.other, recipe=self.old_recipe,
+                                  author=self.author,
+                                  created=self.old_recipe.created)
+        self.assertEqual(fan_out_feeds(), 1)
+        self.assertEqual(
+            list(FeedRecipe.objects.values_list('user', 'recipe')),
+            [(self.reader.id, self.old_recipe.id)]
+        )
+
+
+class PopularTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.first_user, cls.second_user = (
+            User.objects.create(username=name, email=f'{name}@foodgram.ru')
+            for name in ('first', 'second')
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                name=f'Рецепт {number}', author=cls.first_user, text='Текст',
+                cooking_time=10, image='recipes/image.png'
+            )
+            for number in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get_popular(self, window):
+        cache.clear()
+        response = self.client.get('/api/recipes/popular/',
+                                   {'window': window})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [(recipe['id'], recipe['score']) for recipe in response.data]
+
+    def test_popular_windows(self):
+        """Дни и неделя считают добавления, всё время - текущее число."""
+        first, second, third = self.recipes
+        FavoriteUser.objects.create(user=self.first_user, recipe=first)
+        FavoriteUser.objects.create(user=self.second_user, recipe=first)
+        ShoppingCartUser.objects.create(user=self.first_user, recipe=second)
+        self.client.force_authenticate(self.second_user)
+        self.client.post('/api/recipes/shopping_cart/',
+                         {'recipes': [second.id, third.id]}, format='json')
+        self.client.delete('/api/recipes/shopping_cart/',
+                           {'recipes': [third.id]}, format='json')
+        today = timezone.localdate()
+        for days, score in ((3, 5), (7, 10)):
+            RecipeActivity.objects.create(
+                recipe=third, day=today - timedelta(days=days), score=score
+            )
+        RecipeActivity.objects.filter(
+            recipe=third, day=POPULAR_WEEK
+        ).update(score=F('score') + 15)
+        added = [(second.id, 2), (first.id, 2), (third.id, 1)]
+        self.assertEqual(self.get_popular('day'), added)
+        self.assertEqual(self.get_popular('all'), added[:2])
+        self.assertEqual(self.get_popular('week'), [(third.id, 16)]
+                         + added[:2])
+        self.assertEqual(prune_activity(), 1)
+        self.assertEqual(self.get_popular('week'), [(third.id, 6)]
+                         + added[:2])
+        self.assertEqual(prune_activity(), 0)
+        RecipeActivity.objects.filter(day=POPULAR_WEEK).delete()
+        recount()
+        self.assertEqual(self.get_popular('all'), added[:2])
+        self.assertEqual(self.get_popular('week'), [(third.id, 6)]
+                         + added[:2])
+        first.delete()
+        self.assertEqual(self.get_popular('day'), added[::2])
+
+    def test_popular_cached(self):
+        """Готовый рейтинг читается из кеша."""
+        FavoriteUser.objects.create(user=self.first_user,
+                                    recipe=self.recipes[0])
+        self.client.get('/api/recipes/popular/')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/recipes/popular/')
+        self.assertEqual(response.data[0]['id'], self.recipes[0].id)
+        response = self.client.get('/api/recipes/popular/',
+                                   {'window': 'year'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+
+class CatalogCacheTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(name='Обед', color='#00FF00',
+                                     slug='lunch')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_etag_not_modified(self):
+        """Совпавший ETag отвечается кодом 304 без запросов к БД."""
+        response = self.client.get('/api/tags/')
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                '/api/tags/', HTTP_IF_NONE_MATCH=response['ETag']
+            )
+        self.assertEqual(response.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_payload_cached(self):
+        """Данные каталога берутся из кеша."""
+        self.client.get('/api/tags/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/tags/')
+        self.assertEqual(response.data[0]['slug'], 'lunch')
+
+    def test_etag_shared_between_processes(self):
+        """ETag не зависит от кеша процесса."""
+        response = self.client.get('/api/tags/')
+        cache.clear()
+        repeated = self.client.get('/api/tags/')
+        self.assertEqual(repeated['ETag'], response['ETag'])
+        self.assertEqual(repeated['Last-Modified'], response['Last-Modified'])
+
+    def test_version_bumped_on_change(self):
+        """Изменение тега меняет ETag и данные."""
+        etag = self.client.get('/api/tags/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.slug = 'dinner'
+            self.tag.save()
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.data[0]['slug'], 'dinner')
+
+
+class RecipeUserFlagsTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user', email='u@u.ru')
+        tag = Tag.objects.create(name='Завтрак', color='#FF0000',
+                                 slug='breakfast')
+        ingredient = Ingredient.objects.create(name='соль',
+                                               measurement_unit='г')
+        cls.recipes = []
+        for number in range(10):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {number}', author=cls.user, text='Текст',
+                cooking_time=10, image='recipes/image.png'
+            )
+            recipe.tags.add(tag)
+            IngredientRecipe.objects.create(recipe=recipe,
+                                            ingredient=ingredient, amount=5)
+            cls.recipes.append(recipe)
+        FavoriteUser.objects.create(user=cls.user, recipe=cls.recipes[0])
+        ShoppingCartUser.objects.create(user=cls.user, recipe=cls.recipes[1])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_flags_annotated(self):
+        """Признаки пользователя вычисляются в запросе списка."""
+        response = self.client.get('/api/recipes/', {'limit': 10})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        results = {
+            recipe['id']: recipe for recipe in response.data['results']
+        }
+        self.assertTrue(results[self.recipes[0].id]['is_favorited'])
+        self.assertFalse(results[self.recipes[0].id]['is_in_shopping_cart'])
+        self.assertTrue(results[self.recipes[1].id]['is_in_shopping_cart'])
+        self.assertEqual(
+            results[self.recipes[2].id]['ingredients'][0]['name'], 'соль'
+        )
+
+    def test_filter_is_favorited(self):
+        """Фильтр по избранному использует аннотацию."""
+        response = self.client.get('/api/recipes/', {'is_favorited': 1})
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [self.recipes[0].id]
+        )
+
+
+class TagMaskTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user', email='u@u.ru')
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {number}',
+                               color=f'#0000{number:02d}',
+                               slug=f'tag{number}')
+            for number in range(3)
+        ]
+        cls.recipes = []
+        for number in range(3):
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {number}', author=cls.user, text='Текст',
+                cooking_time=10, image='recipes/image.png'
+            )
+            recipe.tags.set(cls.tags[:number + 1])
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get_ids(self, *slugs):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/recipes/', {'tags': slugs})
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertFalse(any('recipes_recipe_tags' in query['sql']
+                             and 'COUNT(' in query['sql']
+                             for query in context.captured_queries))
+        return sorted(recipe['id'] for recipe in response.data['results'])
+
+    def test_masks_follow_tags(self):
+        """Маска рецепта меняется вместе с его тегами."""
+        masks = [tag.mask for tag in self.tags]
+        self.assertEqual(len(set(masks)), len(masks))
+        recipe = self.recipes[2]
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.tags_mask, sum(masks))
+        recipe.tags.remove(self.tags[0])
+        self.assertEqual(recipe.tags_mask, masks[1] + masks[2])
+        self.tags[2].recipes.clear()
+        self.tags[1].delete()
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.tags_mask, 0)
+
+    def test_filter_by_tags(self):
+        """Фильтр по нескольким тегам без дублей."""
+        ids = [recipe.id for recipe in self.recipes]
+        self.assertEqual(self.get_ids('tag0'), ids)
+        self.assertEqual(self.get_ids('tag1', 'tag2'), ids[1:])
+        self.assertEqual(self.get_ids('tag2'), ids[2:])
+        response = self.client.get('/api/recipes/', {'tags': 'unknown'})
+        self.assertEqual(response.status_code, HTTPStatus.BAD_REQUEST)
+
+    def test_tags_over_mask_limit(self):
+        """Тег сверх TAG_MASK_BITS: ошибка формы в админке, не 500."""
+        Tag.objects.bulk_create(
+            Tag(name=f'Доп {number}', color=f'#AA{number:04d}',
+                slug=f'extra{number}', mask=1 << (number + 3))
+            for number in range(TAG_MASK_BITS - 3)
+        )
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@foodgram.ru', password='pass'
+        )
+        self.client.force_login(admin)
+        response = self.client.post('/admin/recipes/tag/add/', {
+            'name': 'Лишний', 'color': '#ABCDEF', 'slug': 'extra'
+        })
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertContains(response, f'больше {TAG_MASK_BITS} тегов')
+        tag = Tag.objects.create(name='Лишний', color='#ABCDEF',
+                                 slug='extra')
+        self.assertIsNone(tag.mask)
+        self.recipes[0].tags.add(tag)
+        response = self.client.get('/api/recipes/',
+                                   {'tags': ['extra', 'tag2']})
+        self.assertEqual(
+            sorted(recipe['id'] for recipe in response.data['results']),
+            [self.recipes[0].id, self.recipes[2].id]
+        )
+
+    def test_concurrent_mask_retried(self):
+        """Маска, занятая параллельно созданным тегом, выбирается заново."""
+        with mock.patch('recipes.models.get_free_tag_mask',
+                        side_effect=[self.tags[0].mask, 1 << 10]):
+            tag = Tag.objects.create(name='Новый', color='#ABCDEF',
+                                     slug='new')
+        self.assertEqual(tag.mask, 1 << 10)
+
+
+class RecipeSearchTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user', email='u@u.ru')
+        cls.tag = Tag.objects.create(name='Обед', color='#000001',
+                                     slug='lunch')
+        cls.recipes = [
+            Recipe.objects.create(
+                name=name, author=cls.user, text=text, cooking_time=10,
+                image='recipes/image.png'
+            )
+            for name, text in (
+                ('Грибной суп', 'Суп с грибами.'),
+                ('Каша', 'Подавать вместо супа.'),
+                ('Салат', 'Нарезать овощи.'),
+            )
+        ]
+        cls.recipes[0].tags.add(cls.tag)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def search(self, **params):
+        response = self.client.get('/api/recipes/', params)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_search_ranked(self):
+        """Совпадение в названии выше совпадения в описании."""
+        soup, porridge, salad = (recipe.id for recipe in self.recipes)
+        self.assertEqual(self.search(search='суп'), [soup, porridge])
+        self.assertEqual(self.search(search='ГРИБ суп'), [soup])
+        self.assertEqual(self.search(search='суп', tags='lunch'), [soup])
+        self.assertEqual(self.search(search='?!'), [])
+        response = self.client.get('/api/recipes/',
+                                   {'search': 'суп', 'cursor': ''})
+        self.assertEqual([recipe['id'] for recipe in response.data[
+            'results'
+        ]], [porridge, soup])
+
+    def test_search_index_updated(self):
+        """Индекс следует за изменением и удалением рецептов."""
+        salad = self.recipes[2]
+        salad.text = 'Заправить супом.'
+        salad.save()
+        self.assertIn(salad.id, self.search(search='суп'))
+        salad.delete()
+        self.assertNotIn(salad.id, self.search(search='суп'))
+
+
+class CachedCountTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user', email='u@u.ru')
+        cls.tag = Tag.objects.create(name='Ужин', color='#0000FF',
+                                     slug='dinner')
+        cls.recipes = [
+            Recipe.objects.create(
+                name=f'Рецепт {number}', author=cls.user, text='Текст',
+                cooking_time=10, image='recipes/image.png'
+            )
+            for number in range(3)
+        ]
+        for recipe in cls.recipes:
+            recipe.tags.add(cls.tag)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_count(self, params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/recipes/', params)
+        counts = [query for query in context.captured_queries
+                  if 'COUNT(' in query['sql']]
+        return response.data['count'], len(counts)
+
+    def test_count_cached(self):
+        """Число рецептов для тех же фильтров берётся из кеша."""
+        params = {'tags': 'dinner', 'author': self.user.id}
+        self.assertEqual(self.get_count({**params, 'page': 1}), (3, 1))
+        self.assertEqual(self.get_count({**params, 'limit': 1}), (3, 0))
+
+    def test_count_invalidated(self):
+        """Создание рецепта и добавление в избранное сбрасывают число."""
+        self.get_count({'tags': 'dinner'})
+        self.get_count({'is_favorited': 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                name='Новый', author=self.user, text='Текст',
+                cooking_time=5, image='recipes/image.png'
+            )
+            recipe.tags.add(self.tag)
+        self.assertEqual(self.get_count({'tags': 'dinner'}), (4, 1))
+        with self.captureOnCommitCallbacks(execute=True):
+            FavoriteUser.objects.create(user=self.user, recipe=recipe)
+        self.assertEqual(self.get_count({'is_favorited': 1}), (1, 1))
+
+    def test_count_per_user(self):
+        """Число по фильтрам пользователя не достаётся другому."""
+        other = User.objects.create(username='other', email='o@o.ru')
+        for recipe in self.recipes:
+            FavoriteUser.objects.create(user=self.user, recipe=recipe)
+        FavoriteUser.objects.create(user=other, recipe=self.recipes[0])
+        self.assertEqual(
+            get_catalog_version(f'recipes:user:{self.user.id}'),
+            get_catalog_version(f'recipes:user:{other.id}')
+        )
+        self.assertEqual(self.get_count({'is_favorited': 1}), (3, 1))
+        self.client.force_authenticate(other)
+        self.assertEqual(self.get_count({'is_favorited': 1}), (1, 1))
+
+
+class CountersTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(username='author', email='a@a.ru')
+        cls.user = User.objects.create(username='user', email='u@u.ru')
+        cls.recipe = Recipe.objects.create(
+            name='Рецепт', author=cls.author, text='Текст',
+            cooking_time=10, image='recipes/image.png'
+        )
+
+    def assertCounters(self, recipes, subscribers, favorites):
+        self.author.refresh_from_db()
+        self.recipe.refresh_from_db()
+        self.assertEqual(
+            (self.author.recipes_count, self.author.subscribers_count,
+             self.recipe.favorites_count),
+            (recipes, subscribers, favorites)
+        )
+
+    def test_counters_follow_writes(self):
+        """Счётчики меняются вместе с записями."""
+        self.assertCounters(1, 0, 0)
+        SubscriptionUser.objects.create(user=self.user, author=self.author)
+        FavoriteUser.objects.create(user=self.user, recipe=self.recipe)
+        self.assertCounters(1, 1, 1)
+        self.user.delete()
+        self.assertCounters(1, 0, 0)
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        recipe.author = User.objects.create(username='new', email='n@n.ru')
+        recipe.save()
+        self.assertCounters(0, 0, 0)
+        self.assertEqual(recipe.author.recipes_count, 0)
+        recipe.author.refresh_from_db()
+        self.assertEqual(recipe.author.recipes_count, 1)
+
+    def create_options(self, count):
+        recipe = Recipe.objects.create(
+            name='Рецепт', author=self.author, text='Текст',
+            cooking_time=10, image='recipes/image.png'
+        )
+        start = User.objects.count()
+        users = [User.objects.create(username=f'user{number}',
+                                     email=f'user{number}@foodgram.ru')
+                 for number in range(start, start + count)]
+        for user in users:
+            FavoriteUser.objects.create(user=user, recipe=recipe)
+            ShoppingCartUser.objects.create(user=user, recipe=recipe)
+            SubscriptionUser.objects.create(user=user, author=self.author)
+        return recipe, users
+
+    def test_cascade_batched(self):
+        """Каскадное удаление не меняет счётчики построчно."""
+        queries = []
+        for count in (1, 5):
+            recipe, users = self.create_options(count)
+            with CaptureQueriesContext(connection) as context:
+                recipe.delete()
+            queries.append(len(context.captured_queries))
+            self.assertFalse(FavoriteUser.objects.filter(
+                recipe_id=recipe.pk
+            ).exists())
+        self.assertEqual(queries[0], queries[1])
+        with CaptureQueriesContext(connection) as context:
+            User.objects.filter(pk__in=[user.pk for user in users]).delete()
+        updates = [query['sql'] for query in context.captured_queries
+                   if query['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 4 * len(users))
+        for sql in updates:
+            self.assertIn(' IN (SELECT ', sql)
+        self.assertCounters(1, 1, 0)
+
+    def test_user_deleted_counters(self):
+        """Удаление пользователя снимает его избранное и подписки."""
+        _, (user, ) = self.create_options(1)
+        FavoriteUser.objects.create(user=user, recipe=self.recipe)
+        self.assertCounters(2, 1, 1)
+        user.delete()
+        self.assertCounters(2, 0, 0)
+        self.assertEqual(
+            self.get_popular_total(self.recipe), 0
+        )
+
+    def test_cascade_ignores_drifted_counters(self):
+        """Удаление рецепта не зависит от значения его счётчиков."""
+        recipe, _ = self.create_options(2)
+        Recipe.objects.filter(pk=recipe.pk).update(favorites_count=0)
+        User.objects.filter(pk=self.author.pk).update(subscribers_count=0)
+        recipe.delete()
+        self.author.delete()
+        self.assertFalse(Recipe.objects.exists())
+
+    @staticmethod
+    def get_popular_total(recipe):
+        return RecipeActivity.objects.get(
+            recipe=recipe, day=POPULAR_ALL_TIME
+        ).score
+
+    def test_save_keeps_counters(self):
+        """Сохранение загруженного объекта не затирает счётчики."""
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        author = User.objects.get(pk=self.author.pk)
+        SubscriptionUser.objects.create(user=self.user, author=self.author)
+        FavoriteUser.objects.create(user=self.user, recipe=self.recipe)
+        recipe.name = 'Новое название'
+        recipe.save()
+        author.first_name = 'Автор'
+        author.save()
+        self.assertCounters(1, 1, 1)
+
+    def test_patch_keeps_favorites(self):
+        """Избранное, добавленное между чтением и PATCH, сохраняется."""
+        update = RecipeCreateUpdateSerialiser.update
+
+        def update_after_favorite(serializer, instance, validated_data):
+            FavoriteUser.objects.create(user=self.user, recipe=instance)
+            return update(serializer, instance, validated_data)
+
+        client = APIClient()
+        client.force_authenticate(self.author)
+        with mock.patch.object(RecipeCreateUpdateSerialiser, 'update',
+                               update_after_favorite):
+            response = client.patch(f'/api/recipes/{self.recipe.pk}/',
+                                    {'name': 'Новое название'},
+                                    format='json')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertCounters(1, 0, 1)
+
+    def test_concurrent_favorite_counted_once(self):
+        """Рецепт, добавленный параллельным запросом, не считается дважды."""
+        insert = insert_options_user
+
+        def insert_after_concurrent(option_model, user, recipe_ids):
+            FavoriteUser.objects.create(user=user, recipe_id=recipe_ids[0])
+            return insert(option_model, user, recipe_ids)
+
+        with mock.patch('api.servises.insert_options_user',
+                        insert_after_concurrent):
+            outcomes, _ = add_options_user(FavoriteUser, self.user,
+                                           [self.recipe.id])
+        self.assertEqual(outcomes, {self.recipe.id: OPTION_EXISTS})
+        self.assertCounters(1, 0, 1)
+
+    def test_recount(self):
+        """Команда recount восстанавливает счётчики."""
+        FavoriteUser.objects.bulk_create(
+            (FavoriteUser(user=self.user, recipe=self.recipe),)
+        )
+        User.objects.update(recipes_count=0)
+        call_command('recount', stdout=StringIO())
+        self.assertCounters(1, 0, 1)
+
+
+class LoadDataTestCase(TestCase):
+    """Пакетная загрузка небольшого набора данных из CSV."""
+
+    FILES = {
+        'ingredients.csv': '1,соль,г\n2,мука,г\n',
+        'tags.csv': '1,Завтрак,#96ceb4,breakfast\n',
+        'users.csv': ('1,user1,Ольга,Семёнова,user1@mail.ru,pass1\n'
+                      '2,user2,Иван,Иванов,user2@mail.ru,pass2\n'),
+        'subscriptions.csv': '1,2\n',
+        'recipes.csv': ('1,Блины,2,recipes/image1.jpg,"Смешать,\nжарить",'
+                        '20,2024-01-01 10:00:00+00:00\n'),
+        'ingredients_recipe.csv': '1,1,5\n2,1,300\n',
+        'tags_recipe.csv': '1,1\n',
+        'favorite_recipe.csv': '1,1\n',
+        'shopping_cart_recipe.csv': '1,1\n',
+    }
+
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.data_dir, ignore_errors=True)
+        for filename, content in self.FILES.items():
+            with open(f'{self.data_dir}/{filename}', 'w',
+                      encoding='utf-8') as file_data:
+                file_data.write(content)
+
+    def test_bulk_load(self):
+        with mock.patch('core.management.commands.load_data.DIR_DATA',
+                        self.data_dir):
+            call_command('load_data', '--bulk', '--erase', '--workers', '1',
+                         '--chunk-size', '1', stdout=StringIO())
+        self.assertEqual(
+            [model.objects.count() for model in (
+                Ingredient, Tag, User, SubscriptionUser, Recipe,
+                IngredientRecipe, Recipe.tags.through, FavoriteUser,
+                ShoppingCartUser
+            )],
+            [2, 1, 2, 1, 1, 2, 1, 1, 1]
+        )
+        self.assertTrue(User.objects.get(pk=1).check_password('pass1'))
+        recipe = Recipe.objects.get()
+        self.assertEqual(recipe.text, 'Смешать,\nжарить')
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertEqual(recipe.author.recipes_count, 1)
+        self.assertEqual(recipe.author.subscribers_count, 1)
+        self.assertEqual(Ingredient.objects.create(
+            name='сахар', measurement_unit='г'
+        ).pk, 3)
+
+
+class GenerateDataTestCase(TestCase):
+    """Генерация данных в маленьком масштабе."""
+
+    def test_generate_data(self):
+        with self.assertRaises(CommandError):
+            call_command('generate_data', stdout=StringIO())
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(3)
+        )
+        Tag.objects.bulk_create(
+            Tag(name=f'Тег {number}', color=f'#00000{number}',
+                slug=f'tag{number}')
+            for number in range(2)
+        )
+        call_command('generate_data', '--users', '5', '--recipes', '10',
+                     '--subscriptions', '3', '--favorites', '4',
+                     '--cart', '2', '--ingredients-per-recipe', '2',
+                     '--chunk-size', '3', stdout=StringIO())
+        self.assertEqual(User.objects.count(), 5)
+        self.assertEqual(Recipe.objects.count(), 10)
+        self.assertEqual(IngredientRecipe.objects.count(), 20)
+        self.assertEqual(
+            Recipe.objects.filter(tags__isnull=True).count(), 0
+        )
+        self.assertFalse(SubscriptionUser.objects.filter(
+            user=F('author')
+        ).exists())
+        for model, limit in ((SubscriptionUser, 3), (FavoriteUser, 4),
+                             (ShoppingCartUser, 2)):
+            per_user = model.objects.values('user').annotate(
+                count=Count('id')
+            ).values_list('count', flat=True)
+            self.assertTrue(all(0 < count <= limit for count in per_user))
+        self.assertEqual(
+            sum(User.objects.values_list('recipes_count', flat=True)), 10
+        )
+        self.assertEqual(
+            sum(Recipe.objects.values_list('favorites_count', flat=True)),
+            FavoriteUser.objects.count()
+        )
+        self.assertTrue(User.objects.first().check_password(
+            GENERATED_PASSWORD
+        ))
+
+
+class BenchmarkTestCase(TestCase):
+    """Нагрузочный тест в процессе и проверки удалённого режима."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='bench', email='bench@foodgram.ru', password='pass',
+            first_name='Бенч', last_name='Марк'
+        )
+        Tag.objects.create(name='Обед', color='#00FF00', slug='lunch')
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+
+    def test_report(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = f'{directory}/report.json'
+            call_command('benchmark', '-s', 'anonymous', '-s', 'filtering',
+                         '-n', '12', '-c', '1', '-o', output,
+                         stdout=StringIO())
+            with open(output, encoding='utf-8') as file:
+                report = json.load(file)
+        self.assertEqual(report['mode'], 'in-process')
+        self.assertEqual(report['requests'], 12)
+        self.assertEqual(set(report['scenarios']), {'anonymous', 'filtering'})
+        for result in report['scenarios'].values():
+            self.assertEqual(result['requests'], 12)
+            self.assertEqual(set(result['latency_ms']),
+                             {'p50', 'p95', 'p99', 'mean', 'max'})
+            self.assertEqual(set(result['queries_per_request']),
+                             {'mean', 'max'})
+            self.assertGreater(result['rps'], 0)
+            for key, total in (('requests', 12),
+                               ('errors', result['errors'])):
+                self.assertEqual(
+                    sum(endpoint[key]
+                        for endpoint in result['endpoints'].values()),
+                    total
+                )
+        self.assertEqual(report['scenarios']['filtering']['errors'], 0)
+
+    def test_remote_requires_staff(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark', '--base-url', 'http://localhost',
+                         stdout=StringIO())
+        with self.assertRaises(CommandError):
+            call_command('benchmark', '--base-url', 'http://localhost',
+                         '--user', self.user.email, stdout=StringIO())
+
+    def test_remote_without_server_timing(self):
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        response = mock.MagicMock(status=HTTPStatus.OK, headers={})
+        response.__enter__.return_value = response
+        with mock.patch('urllib.request.urlopen', return_value=response):
+            with self.assertRaisesMessage(CommandError, 'Server-Timing'):
+                call_command('benchmark', '-s', 'filtering', '-n', '1',
+                             '-c', '1', '--base-url', 'http://localhost',
+                             stdout=StringIO())
+
+
+class AdminChangelistTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@foodgram.ru', password='pass',
+            first_name='Админ', last_name='Админ'
+        )
+        cls.tag = Tag.objects.create(name='Обед', color='#00FF00',
+                                     slug='lunch')
+        cls.ingredient = Ingredient.objects.create(name='соль',
+                                                   measurement_unit='г')
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def add_recipes(self, count):
+        for number in range(count):
+            author = User.objects.create(username=f'author{number}',
+                                         email=f'a{number}@foodgram.ru',
+                                         first_name='Автор',
+                                         last_name=f'№{number}')
+            recipe = Recipe.objects.create(
+                name=f'Рецепт {number}', author=author, text='Текст',
+                cooking_time=10, image='recipes/image.png'
+            )
+            recipe.tags.add(self.tag)
+            IngredientRecipe.objects.create(recipe=recipe, amount=1,
+                                            ingredient=self.ingredient)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        return len(context.captured_queries)
+
+    def test_queries_do_not_depend_on_rows(self):
+        """Число запросов списков админки не зависит от числа строк."""
+        for url in ('/admin/recipes/recipe/', '/admin/users/user/'):
+            with self.subTest(url=url):
+                self.add_recipes(2)
+                queries = self.count_queries(url)
+                User.objects.exclude(pk=self.admin.pk).delete()
+                self.add_recipes(10)
+                self.assertEqual(self.count_queries(url), queries)
+                User.objects.exclude(pk=self.admin.pk).delete()
+
+    def test_author_autocomplete_filter(self):
+        """Фильтр по автору не загружает список всех авторов."""
+        self.add_recipes(3)
+        author = User.objects.get(username='author1')
+        response = self.client.get('/admin/recipes/recipe/',
+                                   {'author__id__exact': author.id})
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertContains(response, 'Рецепт 1')
+        self.assertNotContains(response, 'Рецепт 2')
+        self.assertContains(response, 'Автор №1')
+        self.assertNotContains(response, 'Автор №2')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageVariantsTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user', email='u@u.ru')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def create_recipe(self):
+        recipe = Recipe(name='Рецепт', author=self.user, text='Текст',
+                        cooking_time=10)
+        recipe.image = make_image('photo.png')
+        recipe.save()
+        return recipe
+
+    def test_variants_on_upload(self):
+        """При загрузке картинки сохраняются её уменьшенные копии."""
+        recipe = self.create_recipe()
+        self.assertTrue(recipe.image_variants)
+        for variant, _, _ in IMAGE_VARIANTS:
+            name = recipe.get_image_name(variant)
+            self.assertTrue(default_storage.exists(name), name)
+        response = APIClient().get(f'/api/recipes/{recipe.id}/')
+        self.assertTrue(response.data['images']['card'].endswith(
+            recipe.get_image_name('card')
+        ))
+        self.assertTrue(recipe.get_image_name('card').endswith('_card.webp'))
+
+    def test_backfill(self):
+        """Команда image_variants создаёт копии для старых рецептов."""
+        recipe = self.create_recipe()
+        Recipe.objects.update(image_variants=False)
+        default_storage.delete(recipe.get_image_name('pdf'))
+        call_command('image_variants', '--workers', '1', stdout=StringIO())
+        recipe.refresh_from_db()
+        self.assertTrue(recipe.image_variants)
+        self.assertTrue(default_storage.exists(recipe.get_image_name('pdf')))
+
+
+class UserSubscribedTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='reader', email='r@r.ru')
+        cls.authors = [
+            User.objects.create(username=f'author{number}',
+                                email=f'a{number}@a.ru')
+            for number in range(5)
+        ]
+        SubscriptionUser.objects.create(user=cls.user, author=cls.authors[0])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_subscribed_ids_loaded_once(self):
+        """Подписки пользователя загружаются одним запросом."""
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/users/', {'limit': 10})
+        subscribed = {
+            user['id']: user['is_subscribed']
+            for user in response.data['results']
+        }
+        self.assertTrue(subscribed[self.authors[0].id])
+        self.assertFalse(subscribed[self.authors[1].id])
+
+
+class RequestMetricsTestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user', email='u@u.ru')
+        for number in range(6):
+            Recipe.objects.create(
+                name=f'Рецепт {number}', author=cls.user, text='Текст',
+                cooking_time=10, image='recipes/image.png'
+            )
+
+    def test_server_timing(self):
+        """Server-Timing с числом запросов отдаётся сотрудникам."""
+        response = self.client.get('/api/recipes/')
+        self.assertNotIn('Server-Timing', response)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(
+            username='staff', email='s@s.ru', is_staff=True
+        ))
+        response = self.client.get('/api/recipes/')
+        self.assertRegex(response['Server-Timing'],
+                         r'db;dur=[\d.]+;desc="\d+ queries"')
+        for name in ('view', 'serialize', 'render', 'total'):
+            self.assertIn(f'{name};dur=', response['Server-Timing'])
+        response = self.client.get('/admin/')
+        self.assertNotIn('Server-Timing', response)
+
+    @override_settings(DEBUG=True)
+    def test_server_timing_debug(self):
+        response = self.client.get('/api/recipes/')
+        self.assertIn('total;dur=', response['Server-Timing'])
+
+    def test_n_plus_one_reported(self):
+        """Повторяющийся запрос сообщается с полем сериализатора."""
+        with mock.patch('api.views.RecipeViewSet.get_queryset',
+                        lambda view: Recipe.objects.all()):
+            with self.assertLogs('api.performance', 'WARNING') as logs:
+                self.client.get('/api/recipes/')
+        self.assertIn(
+            'WARNING:api.performance:N+1 в RecipeViewSet.list '
+            '(RecipeReadSerialiser.author): 6 повторов запроса: '
+            'SELECT "users_user"."id", "users_user"."last_login", ',
+            '\n'.join(logs.output)
+        )
+        author_queries = [
+            message for message in logs.output
+            if 'FROM "users_user" WHERE "users_user"."id" = %s LIMIT ?'
+            in message
+        ]
+        self.assertEqual(len(author_queries), 1)
+        self.assertIn(': 6 повторов запроса: ', author_queries[0])
+
+    def test_n_plus_one_method_field(self):
+        """Запросы SerializerMethodField относятся к его методу."""
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch('api.views.RecipeViewSet.get_queryset',
+                        lambda view: Recipe.objects.select_related('author')):
+            with self.assertLogs('api.performance', 'WARNING') as logs:
+                client.get('/api/recipes/')
+        self.assertIn(
+            'N+1 в RecipeViewSet.list (RecipeReadSerialiser.get_is_favorited)'
+            ': 6 повторов запроса: SELECT (?) AS "a" FROM '
+            '"recipes_favoriteuser"',
+            '\n'.join(logs.output)
+        )
+
+    def test_streaming_queries_reported(self):
+        """Запросы при отдаче потокового ответа попадают в журнал."""
+        def content():
+            for recipe in Recipe.objects.values_list('id', flat=True):
+                yield str(User.objects.get(pk=self.user.pk).pk)
+
+        with mock.patch(
+            'api.views.RecipeViewSet.list',
+            lambda view, request: StreamingHttpResponse(content())
+        ):
+            response = self.client.get('/api/recipes/')
+            with self.assertLogs('api.performance', 'WARNING') as logs:
+                b''.join(response.streaming_content)
+        self.assertIn(': 6 повторов запроса: ', logs.output[0])
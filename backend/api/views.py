@@ -1,4 +1,6 @@
-from django.db.models import Count, F, Sum
+from django.db.models import Prefetch
+from django.http import FileResponse
+from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import status, viewsets
@@ -6,17 +8,30 @@ from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
+from api.exports import start_export
 from api.filters import IngredientFilter, RecipeFilter
-from api.paginations import LimitPageNumberPagination
+from api.indexes import get_ingredient_index
+from api.mixins import CatalogCacheMixin
+from api.paginations import (FeedPagination, LimitPageNumberPagination,
+                             RecipePagination)
 from api.permissions import IsAuthenticatedOrAuthorOrReadOnly
-from api.serializers import (FavoriteUserSerializer, IngredientSerialiser,
-                             RecipeCreateUpdateSerialiser,
-                             RecipeReadSerialiser, ShoppingCartUserSerializer,
+from api.serializers import (CookQuerySerializer, FavoriteUserSerializer,
+                             IngredientSerialiser, RecipeCoverageSerializer,
+                             RecipeCreateUpdateSerialiser, RecipeIdsSerializer,
+                             RecipePopularSerializer, RecipeReadSerialiser,
+                             ShoppingCartExportSerializer,
+                             ShoppingCartUserSerializer,
                              SubscriptionUserSerializer, TagSerialiser,
                              UserWithRecipesSerializer)
-from api.servises import add_option_user, get_pdf, remove_option_user
+from api.servises import (add_option_user, annotate_author_recipes,
+                          change_options_user, get_cook_recipes, get_pdf,
+                          get_popular_recipes, get_recipes_limit,
+                          get_shopping_cart, remove_option_user,
+                          stream_shopping_cart)
+from recipes.constants import (EXPORT_DONE, EXPORT_FAILED, POPULAR_WINDOWS,
+                               SHOPPING_CART_FORMATS)
 from recipes.models import (FavoriteUser, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingCartUser, Tag)
+                            ShoppingCartExport, ShoppingCartUser, Tag)
 from users.models import SubscriptionUser, User
 
 
@@ -69,12 +84,9 @@ class UserViewSet(DjoserUserViewSet):
     def subscriptions(self, request):
         """Функция для вывода списка подписок"""
         serializer = UserWithRecipesSerializer(
-            self.paginate_queryset(User.objects.filter(
-                subscribers__user=request.user
-            ).annotate(
-                recipes_count=Count('recipes')
-            ).prefetch_related(
-                'recipes'
+            self.paginate_queryset(annotate_author_recipes(
+                User.objects.filter(subscribers__user=request.user),
+                get_recipes_limit(request)
             ).order_by('username')),
             many=True,
             context={'request': request}
@@ -82,16 +94,18 @@ class UserViewSet(DjoserUserViewSet):
         return self.get_paginated_response(serializer.data)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
 
+    catalog = 'tags'
     permission_classes = (AllowAny,)
     pagination_class = None
     queryset = Tag.objects.all()
     serializer_class = TagSerialiser
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CatalogCacheMixin, viewsets.ReadOnlyModelViewSet):
 
+    catalog = 'ingredients'
     permission_classes = (AllowAny,)
     pagination_class = None
     queryset = Ingredient.objects.all()
@@ -99,24 +113,56 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (DjangoFilterBackend, )
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return self.cached_response(request, self.search, name)
+        return super().list(request, *args, **kwargs)
+
+    def search(self, request, name):
+        """Поиск по префиксу названия.
+
+        Индекс берётся после версии ключа кеша, поэтому под ключом
+        не сохраняются данные старее его версии.
+        """
+        index = get_ingredient_index()
+        if index is None:
+            return Response(self.get_serializer(
+                self.filter_queryset(self.get_queryset()), many=True
+            ).data)
+        return Response(index.search(name))
+
 
 class RecipeViewSet(viewsets.ModelViewSet):
 
     http_method_names = ('get', 'post', 'delete', 'patch')
     permission_classes = (IsAuthenticatedOrAuthorOrReadOnly, )
-    pagination_class = LimitPageNumberPagination
+    pagination_class = RecipePagination
     filter_backends = (DjangoFilterBackend, )
     filterset_class = RecipeFilter
 
     def get_queryset(self):
-        return Recipe.objects.prefetch_related(
-            'tags', 'ingredient_recipes'
+        return Recipe.objects.with_user_flags(
+            self.request.user
+        ).prefetch_related(
+            'tags',
+            Prefetch(
+                'ingredient_recipes',
+                queryset=IngredientRecipe.objects.select_related('ingredient')
+            ),
         ).select_related(
             'author'
         )
 
+    def perform_content_negotiation(self, request, force=False):
+        # Параметр format задаёт формат файла списка покупок,
+        # а не рендерер ответа.
+        return super().perform_content_negotiation(
+            request, force=force or self.action == 'download_shopping_cart'
+        )
+
     def get_serializer_class(self):
-        if self.action in ('list', 'retrieve'):
+        if self.action in ('list', 'retrieve', 'feed'):
             return RecipeReadSerialiser
         return RecipeCreateUpdateSerialiser
 
@@ -152,21 +198,142 @@ class RecipeViewSet(viewsets.ModelViewSet):
         """Функция для удаления из списка покупок."""
         return remove_option_user(ShoppingCartUser, kwargs['id'], request)
 
+    def change_options(self, option_model, request):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return change_options_user(option_model,
+                                   serializer.validated_data['recipes'],
+                                   request)
+
+    @action(
+        detail=False,
+        methods=('POST', 'DELETE'),
+        url_path='favorite',
+        url_name='favorites',
+        permission_classes=(IsAuthenticated, ))
+    def favorites(self, request):
+        """Функция для пакетного изменения избранного."""
+        return self.change_options(FavoriteUser, request)
+
+    @action(
+        detail=False,
+        methods=('POST', 'DELETE'),
+        url_path='shopping_cart',
+        url_name='shopping_carts',
+        permission_classes=(IsAuthenticated, ))
+    def shopping_carts(self, request):
+        """Функция для пакетного изменения списка покупок."""
+        return self.change_options(ShoppingCartUser, request)
+
+    @action(
+        detail=False,
+        methods=('GET', ),
+        pagination_class=FeedPagination,
+        permission_classes=(IsAuthenticated, ))
+    def feed(self, request):
+        """Функция для ленты рецептов авторов из подписок."""
+        page = self.paginate_queryset(
+            self.get_queryset().feed(request.user)
+        )
+        return self.get_paginated_response(
+            self.get_serializer(page, many=True).data
+        )
+
+    @action(
+        detail=False,
+        methods=('GET', ),
+        permission_classes=(AllowAny, ))
+    def cook(self, request):
+        """Функция для подбора рецептов по имеющимся ингредиентам."""
+        serializer = CookQuerySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(RecipeCoverageSerializer(
+            get_cook_recipes(serializer.validated_data['ingredients'],
+                             serializer.validated_data['limit']),
+            many=True,
+            context={'request': request}
+        ).data)
+
+    @action(
+        detail=False,
+        methods=('GET', ),
+        permission_classes=(AllowAny, ))
+    def popular(self, request):
+        """Функция для списка популярных рецептов."""
+        window = request.query_params.get('window', 'week')
+        if window not in POPULAR_WINDOWS:
+            return Response(
+                {'window': [f'Допустимые периоды: '
+                            f'{", ".join(POPULAR_WINDOWS)}.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(RecipePopularSerializer(
+            get_popular_recipes(window),
+            many=True,
+            context={'request': request}
+        ).data)
+
     @action(
         detail=False,
         methods=('GET', ),
         permission_classes=(IsAuthenticated, ))
     def download_shopping_cart(self, request):
         """Функция для скачивания списка покупок."""
-        return get_pdf(
-            IngredientRecipe.objects.filter(
-                recipe__shopping_cart_user__user=request.user
-            ).values(
-                name=F('ingredient__name'),
-                measurement_unit=F('ingredient__measurement_unit')
-            ).annotate(amount=Sum('amount')).order_by(
-                'name'
-            ),
-            Recipe.objects.filter(shopping_cart_user__user=request.user),
-            request.build_absolute_uri('/')
+        file_format = request.query_params.get('format', 'pdf')
+        if file_format not in SHOPPING_CART_FORMATS:
+            return Response(
+                {'format': [f'Допустимые форматы: '
+                            f'{", ".join(SHOPPING_CART_FORMATS)}.']},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        ingredients, recipes = get_shopping_cart(request.user)
+        if file_format == 'pdf':
+            return get_pdf(ingredients, recipes,
+                           request.build_absolute_uri('/'))
+        return stream_shopping_cart(ingredients, file_format)
+
+    @action(
+        detail=False,
+        methods=('POST', ),
+        url_path='download_shopping_cart/exports',
+        permission_classes=(IsAuthenticated, ))
+    def shopping_cart_export(self, request):
+        """Функция для запуска формирования списка покупок."""
+        exports = request.user.shopping_cart_exports.all()
+        exports.fail_stale()
+        exports.filter(status__in=(EXPORT_DONE, EXPORT_FAILED)).delete()
+        export = ShoppingCartExport.objects.create(user=request.user)
+        start_export(export, request.build_absolute_uri('/'))
+        return Response(
+            ShoppingCartExportSerializer(
+                export, context={'request': request}
+            ).data,
+            status=status.HTTP_202_ACCEPTED
         )
+
+    @action(
+        detail=False,
+        methods=('GET', ),
+        url_path=r'download_shopping_cart/exports/(?P<export_id>\d+)',
+        permission_classes=(IsAuthenticated, ))
+    def shopping_cart_export_status(self, request, export_id):
+        """Функция для проверки статуса формирования списка покупок."""
+        exports = request.user.shopping_cart_exports.all()
+        exports.fail_stale()
+        return Response(ShoppingCartExportSerializer(
+            get_object_or_404(exports, id=export_id),
+            context={'request': request}
+        ).data)
+
+    @action(
+        detail=False,
+        methods=('GET', ),
+        url_path=r'download_shopping_cart/exports/(?P<export_id>\d+)/file',
+        permission_classes=(IsAuthenticated, ))
+    def shopping_cart_export_file(self, request, export_id):
+        """Функция для скачивания сформированного списка покупок."""
+        export = get_object_or_404(request.user.shopping_cart_exports,
+                                   id=export_id, status=EXPORT_DONE)
+        return FileResponse(export.file.open('rb'), as_attachment=True,
+                            filename='ingredients.pdf',
+                            content_type='application/pdf')
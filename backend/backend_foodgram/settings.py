@@ -32,6 +32,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -125,6 +126,60 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 6,
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 60 * 60 * 24))
+CATALOG_VERSION_TIMEOUT = int(os.getenv('CATALOG_VERSION_TIMEOUT', 300))
+
+COUNT_CACHE_TIMEOUT = int(os.getenv('COUNT_CACHE_TIMEOUT', 300))
+APPROXIMATE_COUNT_THRESHOLD = int(
+    os.getenv('APPROXIMATE_COUNT_THRESHOLD', 100000)
+)
+
+PDF_CACHE_TIMEOUT = int(os.getenv('PDF_CACHE_TIMEOUT', 60 * 60))
+
+EXPORT_WORKERS = int(os.getenv('EXPORT_WORKERS', 2))
+EXPORT_SPOOL_MAX_SIZE = int(os.getenv('EXPORT_SPOOL_MAX_SIZE', 1024 * 1024))
+EXPORT_ROOT = os.getenv('EXPORT_ROOT', BASE_DIR / 'exports')
+EXPORT_TIMEOUT = int(os.getenv('EXPORT_TIMEOUT', 60 * 10))
+EXPORT_EXPIRY = int(os.getenv('EXPORT_EXPIRY', 60 * 60 * 24))
+
+SLOW_REQUEST_THRESHOLD = float(os.getenv('SLOW_REQUEST_THRESHOLD', 500))
+N_PLUS_ONE_THRESHOLD = int(os.getenv('N_PLUS_ONE_THRESHOLD', 5))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'api.performance': {
+            'handlers': ['console'],
+            'level': os.getenv('PERFORMANCE_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+        'api.exports': {
+            'handlers': ['console'],
+            'level': 'ERROR',
+            'propagate': False,
+        },
+    },
+}
+
+FEED_PULL_SUBSCRIBERS = int(os.getenv('FEED_PULL_SUBSCRIBERS', 10000))
+
+POPULAR_CACHE_TIMEOUT = int(os.getenv('POPULAR_CACHE_TIMEOUT', 60))
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'SERIALIZERS': {
@@ -14,3 +14,9 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend_foodgram.settings')
 
 application = get_wsgi_application()
+
+from api.indexes import get_ingredient_index  # noqa: E402
+from api.indexes import get_recipe_ingredient_index  # noqa: E402
+
+get_ingredient_index()
+get_recipe_ingredient_index()
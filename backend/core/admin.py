@@ -0,0 +1,35 @@
+from django import forms
+from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+
+
+class AutocompleteFilter(admin.RelatedFieldListFilter):
+    """Фильтр по внешнему ключу с поиском вместо списка всех значений.
+
+    Варианты подгружаются представлением автодополнения админки, поэтому
+    у ModelAdmin связанной модели должны быть заданы search_fields.
+    """
+
+    template = 'admin/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin,
+                 field_path):
+        super().__init__(field, request, params, model, model_admin,
+                         field_path)
+        form_field = forms.ModelChoiceField(
+            queryset=field.remote_field.model._default_manager.all(),
+            widget=AutocompleteSelect(field, model_admin.admin_site),
+            required=False,
+        )
+        self.media = form_field.widget.media
+        self.rendered_widget = form_field.widget.render(
+            self.lookup_kwarg, self.lookup_val,
+            attrs={'id': f'autocomplete_filter_{field_path}',
+                   'style': 'width: 100%'}
+        )
+
+    def has_output(self):
+        return True
+
+    def field_choices(self, field, request, model_admin):
+        return ()
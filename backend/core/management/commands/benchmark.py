@@ -0,0 +1,249 @@
+import json
+import re
+import statistics
+import subprocess
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import cycle, islice
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+SCENARIOS = ('anonymous', 'filtering', 'cart')
+SERVER_TIMING_QUERIES = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+def percentile(values, percent):
+    """Перцентиль по методу ближайшего ранга."""
+    ordered = sorted(values)
+    index = max(0, round(percent / 100 * len(ordered) + 0.5) - 1)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест API: задержки p50/p95/p99, запросы в секунду '
+            'и SQL-запросы на запрос.')
+
+    def get_urls(self, scenario):
+        recipe = Recipe.objects.order_by('?').values('id').first()
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        ingredient = Ingredient.objects.values('name').first()
+        prefix = ingredient['name'][:2] if ingredient else 'а'
+        if scenario == 'anonymous':
+            urls = [
+                '/api/recipes/',
+                '/api/recipes/?page=2',
+                '/api/tags/',
+                f'/api/ingredients/?name={prefix}',
+            ]
+            if recipe:
+                urls.append(f'/api/recipes/{recipe["id"]}/')
+            return urls
+        if scenario == 'filtering':
+            tags_query = '&'.join(f'tags={slug}' for slug in tags)
+            return [
+                f'/api/recipes/?{tags_query}',
+                '/api/recipes/?is_favorited=1',
+                f'/api/recipes/?is_favorited=1&{tags_query}',
+                '/api/recipes/?is_in_shopping_cart=1',
+                '/api/users/subscriptions/?recipes_limit=3',
+                '/api/users/',
+            ]
+        return [
+            '/api/recipes/download_shopping_cart/',
+            '/api/recipes/download_shopping_cart/?format=txt',
+        ]
+
+    def get_user(self, email, staff=False):
+        users = User.objects.filter(is_staff=True) if staff else User.objects
+        if email:
+            user = User.objects.filter(email=email).first()
+            if user is None:
+                raise CommandError(f'Пользователь {email} не найден.')
+            if staff and not user.is_staff:
+                raise CommandError(
+                    f'Пользователь {email} не сотрудник: сервер не отдаст '
+                    'ему Server-Timing с количеством SQL-запросов.'
+                )
+            return user
+        user = (users.filter(authors__isnull=False,
+                             favorite_users__isnull=False).first()
+                or users.first())
+        if staff and user is None:
+            raise CommandError('Для удалённого замера нужен сотрудник: '
+                               'укажите его почту в --user.')
+        return user
+
+    def request_local(self, client, url, headers):
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url, **headers)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        return (time.perf_counter() - start, response.status_code,
+                len(context.captured_queries))
+
+    def request_remote(self, base_url, url, headers):
+        request = urllib.request.Request(base_url.rstrip('/') + url,
+                                         headers=headers)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                status = response.status
+                server_timing = response.headers.get('Server-Timing', '')
+        except urllib.error.HTTPError as error:
+            status = error.code
+            server_timing = error.headers.get('Server-Timing', '')
+        elapsed = time.perf_counter() - start
+        queries = SERVER_TIMING_QUERIES.search(server_timing)
+        if queries is None and 'Authorization' in headers:
+            raise CommandError(
+                f'Сервер не вернул количество SQL-запросов в Server-Timing '
+                f'для {url}: проверьте, что прокси не вырезает заголовок.'
+            )
+        return elapsed, status, int(queries.group(1)) if queries else None
+
+    def run_worker(self, urls, token, options):
+        results = []
+        if options['base_url']:
+            headers = {'Authorization': f'Token {token}'} if token else {}
+            for url in urls:
+                results.append((url, *self.request_remote(
+                    options['base_url'], url, headers
+                )))
+            return results
+        client = Client(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+        headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+        try:
+            for url in urls:
+                results.append((url, *self.request_local(client, url,
+                                                         headers)))
+        finally:
+            if options['concurrency'] > 1:
+                connection.close()
+        return results
+
+    def run_scenario(self, scenario, token, options):
+        urls = self.get_urls(scenario)
+        token = None if scenario == 'anonymous' else token
+        self.run_worker(urls, token, options)
+        requests = list(islice(cycle(urls), options['requests']))
+        concurrency = options['concurrency']
+        batches = [requests[index::concurrency]
+                   for index in range(concurrency)]
+        start = time.perf_counter()
+        if concurrency > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                results = [
+                    result for batch in executor.map(
+                        lambda batch: self.run_worker(batch, token, options),
+                        batches
+                    ) for result in batch
+                ]
+        else:
+            results = self.run_worker(requests, token, options)
+        elapsed = time.perf_counter() - start
+        return {
+            **self.summarize(results),
+            'rps': round(len(results) / elapsed, 2),
+            'endpoints': {
+                url: self.summarize(
+                    [result for result in results if result[0] == url]
+                )
+                for url in urls
+            },
+        }
+
+    @staticmethod
+    def summarize(results):
+        latencies = [result[1] * 1000 for result in results]
+        queries = [result[3] for result in results if result[3] is not None]
+        return {
+            'requests': len(results),
+            'errors': sum(result[2] >= 400 for result in results),
+            'latency_ms': {
+                'p50': round(percentile(latencies, 50), 2),
+                'p95': round(percentile(latencies, 95), 2),
+                'p99': round(percentile(latencies, 99), 2),
+                'mean': round(statistics.mean(latencies), 2),
+                'max': round(max(latencies), 2),
+            },
+            'queries_per_request': {
+                'mean': round(statistics.mean(queries), 2),
+                'max': max(queries),
+            } if queries else None,
+        }
+
+    @staticmethod
+    def get_commit():
+        try:
+            return subprocess.run(
+                ('git', 'rev-parse', '--short', 'HEAD'),
+                capture_output=True, text=True, check=True
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('Количество запросов и потоков должно быть '
+                               'больше нуля.')
+        user = self.get_user(options['user'],
+                             staff=bool(options['base_url']))
+        token = Token.objects.get_or_create(user=user)[0].key if user else None
+        report = {
+            'commit': self.get_commit(),
+            'date': datetime.now(timezone.utc).isoformat(),
+            'mode': options['base_url'] or 'in-process',
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'scenarios': {},
+        }
+        for scenario in options['scenarios'] or SCENARIOS:
+            result = self.run_scenario(scenario, token, options)
+            report['scenarios'][scenario] = result
+            latency = result['latency_ms']
+            queries = result['queries_per_request']
+            self.stdout.write(
+                f'{scenario}: {result["rps"]} запр/с, '
+                f'p50 {latency["p50"]} мс, p95 {latency["p95"]} мс, '
+                f'p99 {latency["p99"]} мс, ошибок {result["errors"]}'
+                + (f', SQL {queries["mean"]}/запрос' if queries else '')
+            )
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+            self.stdout.write(self.style.SUCCESS(
+                f'Результаты сохранены в {options["output"]}'
+            ))
+
+    def add_arguments(self, parser):
+        parser.add_argument('-s', '--scenario', dest='scenarios',
+                            action='append', choices=SCENARIOS,
+                            help='Сценарий нагрузки (по умолчанию все)')
+        parser.add_argument('-n', '--requests', type=int, default=200,
+                            help='Количество запросов в сценарии')
+        parser.add_argument('-c', '--concurrency', type=int, default=4,
+                            help='Количество параллельных клиентов')
+        parser.add_argument('--base-url',
+                            help=('Адрес запущенного сервера; по умолчанию '
+                                  'запросы выполняются в процессе'))
+        parser.add_argument('--user',
+                            help=('Почта пользователя для авторизованных '
+                                  'сценариев; для --base-url нужен '
+                                  'сотрудник'))
+        parser.add_argument('-o', '--output',
+                            help='Файл для сохранения результатов в JSON')
@@ -0,0 +1,45 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from recipes.constants import EXPORT_DIRECTORY
+from recipes.models import ShoppingCartExport
+
+
+def clean_exports():
+    """Завершает зависшие и удаляет устаревшие выгрузки с файлами.
+
+    Файлы, на которые не ссылается ни одна выгрузка (задачу прервали
+    между записью файла и статуса), удаляются по тому же сроку.
+    """
+    failed = ShoppingCartExport.objects.fail_stale()
+    deleted, _ = ShoppingCartExport.objects.expired().delete()
+    storage = ShoppingCartExport.file.field.storage
+    if not storage.exists(EXPORT_DIRECTORY):
+        return failed, deleted, 0
+    _, names = storage.listdir(EXPORT_DIRECTORY)
+    used = set(ShoppingCartExport.objects.exclude(file='').values_list(
+        'file', flat=True
+    ))
+    expired = timezone.now() - timedelta(seconds=settings.EXPORT_EXPIRY)
+    orphans = 0
+    for name in names:
+        name = f'{EXPORT_DIRECTORY}/{name}'
+        if name not in used and storage.get_modified_time(name) < expired:
+            storage.delete(name)
+            orphans += 1
+    return failed, deleted, orphans
+
+
+class Command(BaseCommand):
+    help = ('Помечает упавшими зависшие выгрузки списка покупок и удаляет '
+            'выгрузки старше EXPORT_EXPIRY. Запускается по расписанию.')
+
+    def handle(self, *args, **options):
+        failed, deleted, orphans = clean_exports()
+        self.stdout.write(self.style.SUCCESS(
+            f'Зависших выгрузок: {failed}, удалено выгрузок: {deleted}, '
+            f'файлов без выгрузки: {orphans}'
+        ))
@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from core.signals import author_recipes, fan_out
+from recipes.models import FeedRecipe, Recipe
+from users.models import SubscriptionUser, User
+
+
+def subscriber_ids(author_id, **filters):
+    return SubscriptionUser.objects.filter(
+        author_id=author_id, **filters
+    ).order_by().values_list('user_id', flat=True).iterator()
+
+
+def fan_out_author(author_id):
+    """Копирует рецепты автора в ленты подписчиков и снимает feed_pulled.
+
+    Основное копирование идёт без блокировок. Затем под блокировкой строки
+    автора (её берут и запись рецептов, и подписки) докопируются рецепты
+    и подписки, появившиеся за это время, и удаляются строки лент
+    отписавшихся.
+    """
+    last_recipe_id = Recipe.objects.filter(
+        author_id=author_id
+    ).aggregate(last=Max('id'))['last'] or 0
+    last_subscription_id = SubscriptionUser.objects.filter(
+        author_id=author_id
+    ).aggregate(last=Max('id'))['last'] or 0
+    fan_out(subscriber_ids(author_id, pk__lte=last_subscription_id),
+            list(author_recipes(author_id).filter(pk__lte=last_recipe_id)))
+    with transaction.atomic():
+        if not User.objects.select_for_update().filter(
+            pk=author_id, feed_pulled=True,
+            subscribers_count__lt=settings.FEED_PULL_SUBSCRIBERS
+        ).order_by().exists():
+            return False
+        fan_out(subscriber_ids(author_id),
+                list(author_recipes(author_id).filter(pk__gt=last_recipe_id)))
+        fan_out(subscriber_ids(author_id, pk__gt=last_subscription_id),
+                list(author_recipes(author_id)))
+        FeedRecipe.objects.filter(author_id=author_id).exclude(
+            user_id__in=SubscriptionUser.objects.filter(
+                author_id=author_id
+            ).values('user_id')
+        ).delete()
+        User.objects.filter(pk=author_id).update(feed_pulled=False)
+    return True
+
+
+def fan_out_feeds():
+    """Возвращает к копированию в ленты авторов, потерявших подписчиков."""
+    author_ids = list(User.objects.filter(
+        feed_pulled=True,
+        subscribers_count__lt=settings.FEED_PULL_SUBSCRIBERS
+    ).order_by().values_list('pk', flat=True))
+    return sum(fan_out_author(author_id) for author_id in author_ids)
+
+
+class Command(BaseCommand):
+    help = ('Копирует в ленты подписок рецепты авторов, у которых стало '
+            'меньше FEED_PULL_SUBSCRIBERS подписчиков. Запускается по '
+            'расписанию.')
+
+    def handle(self, *args, **options):
+        authors = fan_out_feeds()
+        self.stdout.write(self.style.SUCCESS(
+            f'Рецепты скопированы в ленты подписчиков авторов: {authors}'
+        ))
@@ -0,0 +1,187 @@
+import random
+import time
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+
+from core.management.commands.load_data import CHUNK_SIZE, DATA
+from core.management.commands.load_data import Command as LoadDataCommand
+from core.management.commands.recount import recount
+from recipes.models import Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+GENERATED_PASSWORD = 'generated-password'
+RECIPE_IMAGES = (
+    'recipes/image1.jpg',
+    'recipes/image2.jpeg',
+    'recipes/image3.jpeg',
+    'recipes/image4.png',
+)
+RECIPE_WORDS = (
+    'Суп', 'Салат', 'Пирог', 'Каша', 'Рагу', 'Омлет', 'Паста', 'Запеканка',
+    'с грибами', 'с курицей', 'по-домашнему', 'острый', 'летний', 'быстрый',
+)
+
+
+class ZipfSampler:
+    """Выбор номеров 0..size-1 с вероятностью, убывающей по закону Ципфа."""
+
+    def __init__(self, rnd, size, exponent):
+        self.rnd = rnd
+        self.population = range(size)
+        self.cum_weights = list(accumulate(
+            1 / rank ** exponent for rank in range(1, size + 1)
+        ))
+
+    def sample(self, count):
+        """Не более count различных номеров."""
+        return set(self.rnd.choices(self.population,
+                                    cum_weights=self.cum_weights, k=count))
+
+
+class Command(BaseCommand):
+    help = ('Генерирует большой набор данных с распределением Ципфа '
+            'для нагрузочного тестирования.')
+
+    def rows_users(self, options):
+        password = make_password(GENERATED_PASSWORD)
+        for user_id in self.user_ids:
+            yield (user_id, f'user{user_id}', 'Имя', f'Фамилия{user_id}',
+                   f'user{user_id}@foodgram.test', password)
+
+    def rows_subscriptions(self, options):
+        sampler = ZipfSampler(self.rnd, len(self.user_ids),
+                              options['zipf'])
+        for user_id in self.user_ids:
+            for index in sampler.sample(options['subscriptions']):
+                author_id = self.user_ids[index]
+                if author_id != user_id:
+                    yield (user_id, author_id)
+
+    def rows_recipes(self, options):
+        sampler = ZipfSampler(self.rnd, len(self.user_ids),
+                              options['zipf'])
+        authors = self.rnd.choices(
+            range(len(self.user_ids)), cum_weights=sampler.cum_weights,
+            k=len(self.recipe_ids)
+        )
+        for recipe_id, author in zip(self.recipe_ids, authors):
+            yield (recipe_id,
+                   ' '.join(self.rnd.sample(RECIPE_WORDS, 2)),
+                   self.user_ids[author],
+                   self.rnd.choice(RECIPE_IMAGES),
+                   f'Описание рецепта {recipe_id}.',
+                   self.rnd.randint(5, 180),
+                   None)
+
+    def rows_ingredients_recipe(self, options):
+        for recipe_id in self.recipe_ids:
+            for ingredient_id in self.rnd.sample(
+                self.ingredient_ids,
+                min(options['ingredients_per_recipe'],
+                    len(self.ingredient_ids))
+            ):
+                yield (ingredient_id, recipe_id, self.rnd.randint(1, 500))
+
+    def rows_tags_recipe(self, options):
+        for recipe_id in self.recipe_ids:
+            for tag_id in self.rnd.sample(
+                self.tag_ids,
+                self.rnd.randint(1, len(self.tag_ids))
+            ):
+                yield (tag_id, recipe_id)
+
+    def rows_user_recipe(self, count, options):
+        sampler = ZipfSampler(self.rnd, len(self.recipe_ids),
+                              options['zipf'])
+        for user_id in self.user_ids:
+            for index in sampler.sample(count):
+                yield (user_id, self.recipe_ids[index])
+
+    def rows_favorites(self, options):
+        return self.rows_user_recipe(options['favorites'], options)
+
+    def rows_shopping_cart(self, options):
+        return self.rows_user_recipe(options['cart'], options)
+
+    def generate(self, obj, fields, rows, chunk_size):
+        loader = LoadDataCommand()
+        start = time.monotonic()
+        count = 0
+        with transaction.atomic():
+            for chunk in loader.read_chunks(rows, chunk_size):
+                loader.insert_rows(obj, fields, chunk)
+                count += len(chunk)
+        elapsed = time.monotonic() - start
+        self.stdout.write(
+            f'{obj._meta.verbose_name_plural}: {count} строк за '
+            f'{elapsed:.2f} с ({count / max(elapsed, 1e-6):.0f} строк/с)'
+        )
+
+    def handle(self, *args, **options):
+        self.rnd = random.Random(options['seed'])
+        self.ingredient_ids = list(
+            Ingredient.objects.values_list('id', flat=True)
+        )
+        self.tag_ids = list(Tag.objects.values_list('id', flat=True))
+        if not self.ingredient_ids or not self.tag_ids:
+            raise CommandError('Сначала загрузите ингредиенты и теги '
+                               'командой load_data.')
+        first_user = (User.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+        self.user_ids = range(first_user, first_user + options['users'])
+        first_recipe = (Recipe.objects.aggregate(
+            Max('id')
+        )['id__max'] or 0) + 1
+        self.recipe_ids = range(first_recipe,
+                                first_recipe + options['recipes'])
+        generators = {
+            'users.csv': self.rows_users,
+            'subscriptions.csv': self.rows_subscriptions,
+            'recipes.csv': self.rows_recipes,
+            'ingredients_recipe.csv': self.rows_ingredients_recipe,
+            'tags_recipe.csv': self.rows_tags_recipe,
+            'favorite_recipe.csv': self.rows_favorites,
+            'shopping_cart_recipe.csv': self.rows_shopping_cart,
+        }
+        models = []
+        for filename, obj, fields in DATA:
+            if filename not in generators:
+                continue
+            self.generate(obj, fields,
+                          iter(generators[filename](options)),
+                          options['chunk_size'])
+            models.append(obj)
+        sequence_sql = connection.ops.sequence_reset_sql(no_style(), models)
+        with connection.cursor() as cursor:
+            for sql in sequence_sql:
+                cursor.execute(sql)
+        recount()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пароль созданных пользователей: {GENERATED_PASSWORD}'
+        ))
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000,
+                            help='Количество пользователей')
+        parser.add_argument('--recipes', type=int, default=10000,
+                            help='Количество рецептов')
+        parser.add_argument('--subscriptions', type=int, default=20,
+                            help='Подписок на пользователя (до)')
+        parser.add_argument('--favorites', type=int, default=30,
+                            help='Рецептов в избранном на пользователя (до)')
+        parser.add_argument('--cart', type=int, default=5,
+                            help='Рецептов в списке покупок (до)')
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8,
+                            help='Ингредиентов в рецепте')
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='Показатель распределения Ципфа')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Начальное значение генератора')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Количество строк в пакете')
@@ -0,0 +1,55 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from core.management.commands.load_data import CHUNK_SIZE
+from recipes.models import Recipe
+from recipes.servises import save_image_variants
+
+
+def make_variants(recipe):
+    recipe_id, image_name = recipe
+    return recipe_id, save_image_variants(image_name)
+
+
+class Command(BaseCommand):
+    help = ('Создаёт уменьшенные копии картинок рецептов, '
+            'у которых их ещё нет.')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.order_by('pk')
+        if not options['all']:
+            recipes = recipes.filter(image_variants=False)
+        start = time.monotonic()
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+            last_id = 0
+            while True:
+                chunk = list(recipes.filter(pk__gt=last_id).values_list(
+                    'id', 'image'
+                )[:options['chunk_size']])
+                if not chunk:
+                    break
+                last_id = chunk[-1][0]
+                made = [recipe_id for recipe_id, ok in pool.map(
+                    make_variants, chunk, chunksize=options['batch']
+                ) if ok]
+                Recipe.objects.filter(pk__in=made).update(image_variants=True)
+                done += len(made)
+                failed += len(chunk) - len(made)
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Картинки обработаны: {done}, не прочитаны: {failed}, '
+            f'{elapsed:.2f} с'
+        ))
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', default=False,
+                            help='Пересоздать копии для всех рецептов')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Количество процессов обработки')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='Количество рецептов в пакете')
+        parser.add_argument('--batch', type=int, default=16,
+                            help='Картинок на одну задачу процесса')
@@ -1,11 +1,17 @@
 import csv
+import io
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 
 from django.apps import apps
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
 from django.core.management.base import BaseCommand
 from django.core.management.color import no_style
-from django.db import IntegrityError, connection
+from django.db import IntegrityError, connection, transaction
 
+from core.management.commands.recount import recount
 from recipes.models import (FavoriteUser, Ingredient, IngredientRecipe, Recipe,
                             ShoppingCartUser, Tag)
 from users.models import SubscriptionUser
@@ -13,6 +19,9 @@ from users.models import SubscriptionUser
 User = get_user_model()
 
 DIR_DATA = 'data'
+CHUNK_SIZE = 5000
+PASSWORD_CHUNK_SIZE = 50
+COPY_NULL = '\\N'
 DATA = (
     ('ingredients.csv',
      Ingredient,
@@ -71,17 +80,112 @@ class Command(BaseCommand):
             self.stdout.write(f'Ошибка {e} при работе с файлом {filename}')
         self.stdout.write(f'Файл {filename} загружен')
 
+    @staticmethod
+    def read_chunks(reader, chunk_size):
+        while True:
+            chunk = list(islice(reader, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+    @staticmethod
+    def copy_objects(obj, objects):
+        """Вставка объектов командой COPY с заполнением всех колонок."""
+        fields = [
+            field for field in obj._meta.local_concrete_fields
+            if not (field.primary_key and objects[0].pk is None)
+        ]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for instance in objects:
+            row = []
+            for field in fields:
+                value = field.get_db_prep_save(
+                    field.pre_save(instance, add=True), connection
+                )
+                row.append(COPY_NULL if value is None else value)
+            writer.writerow(row)
+        buffer.seek(0)
+        columns = ', '.join(
+            connection.ops.quote_name(field.column) for field in fields
+        )
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {connection.ops.quote_name(obj._meta.db_table)} '
+                f'({columns}) FROM STDIN '
+                f"WITH (FORMAT csv, NULL '{COPY_NULL}')",
+                buffer
+            )
+
+    def insert_rows(self, obj, fields, rows, pool=None):
+        if obj == User and pool:
+            passwords = pool.map(
+                make_password,
+                [row[fields.index('password')] for row in rows],
+                chunksize=PASSWORD_CHUNK_SIZE
+            )
+            rows = [
+                [*row[:fields.index('password')], password,
+                 *row[fields.index('password') + 1:]]
+                for row, password in zip(rows, passwords)
+            ]
+        objects = [obj(**dict(zip(fields, row))) for row in rows]
+        if connection.vendor == 'postgresql':
+            self.copy_objects(obj, objects)
+        else:
+            obj.objects.bulk_create(objects, batch_size=len(objects))
+
+    def load_obj_bulk(self, filename, obj, fields, chunk_size, pool):
+        start = time.monotonic()
+        count = 0
+        try:
+            with open(f'{DIR_DATA}/{filename}',
+                      encoding='utf-8') as file_data, transaction.atomic():
+                reader = csv.reader(file_data)
+                for rows in self.read_chunks(reader, chunk_size):
+                    self.insert_rows(obj, fields, rows, pool)
+                    count += len(rows)
+        except FileNotFoundError:
+            self.stdout.write(f'Файл {filename} невозможно открыть')
+            return
+        except Exception as e:
+            self.stdout.write(f'Ошибка {e} при работе с файлом {filename}, '
+                              'изменения отменены')
+            return
+        elapsed = time.monotonic() - start
+        self.stdout.write(
+            f'Файл {filename} загружен: {count} строк за {elapsed:.2f} с '
+            f'({count / max(elapsed, 1e-6):.0f} строк/с)'
+        )
+
     def handle(self, *args, **kwargs):
         models = []
-        for filename, obj, fields in DATA:
-            if kwargs['erase']:
-                obj.objects.all().delete()
-            self.load_obj(filename, obj, fields)
-            models.append(obj)
+        pool = None
+        if kwargs['bulk']:
+            # Пароли хешируются с настройками дочернего процесса. При fork
+            # (Linux) он наследует настройки родителя, при spawn (macOS,
+            # Windows) заново читает модуль DJANGO_SETTINGS_MODULE, и
+            # изменения настроек во время работы, например PASSWORD_HASHERS
+            # из override_settings, в нём не видны.
+            pool = ProcessPoolExecutor(max_workers=kwargs['workers'])
+        try:
+            for filename, obj, fields in DATA:
+                if kwargs['erase']:
+                    obj.objects.all().delete()
+                if pool:
+                    self.load_obj_bulk(filename, obj, fields,
+                                       kwargs['chunk_size'], pool)
+                else:
+                    self.load_obj(filename, obj, fields)
+                models.append(obj)
+        finally:
+            if pool:
+                pool.shutdown()
         sequence_sql = connection.ops.sequence_reset_sql(no_style(), models)
         with connection.cursor() as cursor:
             for sql in sequence_sql:
                 cursor.execute(sql)
+        recount()
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -91,3 +195,23 @@ class Command(BaseCommand):
             default=False,
             help='Очистить таблицу перед загрузкой'
         )
+        parser.add_argument(
+            '-b',
+            '--bulk',
+            action='store_true',
+            default=False,
+            help=('Загружать файлы пакетами в одной транзакции на файл '
+                  '(COPY для PostgreSQL)')
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=CHUNK_SIZE,
+            help='Количество строк в пакете'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Количество процессов для хеширования паролей'
+        )
@@ -0,0 +1,44 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from recipes.constants import POPULAR_WEEK, POPULAR_WEEK_DAYS
+from recipes.models import RecipeActivity
+
+
+def prune_activity():
+    """Сдвигает недельное окно популярности и удаляет старые дни.
+
+    Добавления дней, вышедших из окна, вычитаются из недельных строк,
+    после чего дневные строки этих дней удаляются.
+    """
+    old_days = RecipeActivity.objects.filter(
+        day__gt=POPULAR_WEEK,
+        day__lte=timezone.localdate() - timedelta(days=POPULAR_WEEK_DAYS),
+    )
+    with transaction.atomic():
+        RecipeActivity.objects.filter(
+            day=POPULAR_WEEK,
+            recipe_id__in=old_days.values('recipe_id'),
+        ).update(score=F('score') - Subquery(
+            old_days.filter(recipe_id=OuterRef('recipe_id')).order_by().values(
+                'recipe_id'
+            ).annotate(total=Sum('score')).values('total')
+        ))
+        deleted, _ = old_days.delete()
+    return deleted
+
+
+class Command(BaseCommand):
+    help = ('Удаляет дневную активность рецептов старше недели и вычитает '
+            'её из недельного рейтинга. Запускается по расписанию раз '
+            'в день.')
+
+    def handle(self, *args, **options):
+        deleted = prune_activity()
+        self.stdout.write(self.style.SUCCESS(
+            f'Удалено строк активности: {deleted}'
+        ))
@@ -0,0 +1,132 @@
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import (Case, Count, F, OuterRef, Subquery, Sum, Value,
+                              When)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.management.commands.prune_activity import prune_activity
+from core.models import CatalogVersion
+from recipes.constants import FEED_BATCH_SIZE, POPULAR_ALL_TIME, POPULAR_WEEK
+from recipes.models import (FavoriteUser, FeedRecipe, Recipe, RecipeActivity,
+                            ShoppingCartUser, Tag, get_free_tag_mask)
+from users.models import SubscriptionUser, User
+
+
+def count_subquery(model, field):
+    """Число строк model, ссылающихся на внешнюю строку через field."""
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            count=Count('pk')
+        ).values('count')
+    ), 0)
+
+
+def assign_tag_masks():
+    """Назначает маски тегам, загруженным без них."""
+    used = set(Tag.objects.exclude(mask=None).values_list('mask', flat=True))
+    for tag in Tag.objects.filter(mask=None).order_by('pk'):
+        tag.mask = get_free_tag_mask(used)
+        if tag.mask is None:
+            return
+        used.add(tag.mask)
+        tag.save(update_fields=('mask',))
+
+
+def rebuild_feeds():
+    """Заново заполняет ленты подписок рецептами авторов без feed_pulled."""
+    FeedRecipe.objects.all().delete()
+    rows = Recipe.objects.filter(
+        author__feed_pulled=False,
+        author__subscribers__isnull=False,
+    ).order_by().values_list('author__subscribers__user', 'id', 'author',
+                             'created')
+    rows = rows.iterator(chunk_size=FEED_BATCH_SIZE)
+    while True:
+        chunk = list(islice(rows, FEED_BATCH_SIZE))
+        if not chunk:
+            break
+        FeedRecipe.objects.bulk_create(
+            FeedRecipe(user_id=user_id, recipe_id=recipe_id,
+                       author_id=author_id, created=created)
+            for user_id, recipe_id, author_id, created in chunk
+        )
+
+
+def rebuild_activity():
+    """Пересчитывает активность рецептов за неделю и за всё время.
+
+    Дневные строки восстановить нельзя: устаревшие удаляются, а неделя
+    складывается из оставшихся.
+    """
+    prune_activity()
+    RecipeActivity.objects.filter(
+        day__in=(POPULAR_WEEK, POPULAR_ALL_TIME)
+    ).delete()
+    week = RecipeActivity.objects.filter(
+        day__gt=POPULAR_WEEK
+    ).order_by().values('recipe_id').annotate(
+        total=Sum('score')
+    ).filter(total__gt=0).values_list('recipe_id', 'total')
+    RecipeActivity.objects.bulk_create(
+        [RecipeActivity(recipe_id=recipe_id, day=POPULAR_WEEK, score=score)
+         for recipe_id, score in week],
+        batch_size=FEED_BATCH_SIZE,
+    )
+    rows = Recipe.objects.annotate(
+        score=count_subquery(FavoriteUser, 'recipe')
+        + count_subquery(ShoppingCartUser, 'recipe')
+    ).filter(score__gt=0).order_by().values_list('id', 'score')
+    rows = rows.iterator(chunk_size=FEED_BATCH_SIZE)
+    while True:
+        chunk = list(islice(rows, FEED_BATCH_SIZE))
+        if not chunk:
+            break
+        RecipeActivity.objects.bulk_create(
+            RecipeActivity(recipe_id=recipe_id, day=POPULAR_ALL_TIME,
+                           score=score)
+            for recipe_id, score in chunk
+        )
+
+
+def recount():
+    """Пересчитывает все счётчики одним UPDATE на таблицу."""
+    with transaction.atomic():
+        assign_tag_masks()
+        Recipe.objects.update_tags_mask()
+        recipes = Recipe.objects.update(
+            favorites_count=count_subquery(FavoriteUser, 'recipe')
+        )
+        users = User.objects.update(
+            recipes_count=count_subquery(Recipe, 'author'),
+            subscribers_count=count_subquery(SubscriptionUser, 'author'),
+        )
+        User.objects.update(feed_pulled=Case(
+            When(subscribers_count__gte=settings.FEED_PULL_SUBSCRIBERS,
+                 then=Value(True)),
+            default=Value(False),
+        ))
+        rebuild_feeds()
+        rebuild_activity()
+        CatalogVersion.objects.update(
+            version=F('version') + 1, updated=timezone.now()
+        )
+    return recipes, users
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает число добавлений рецептов в избранное, '
+            'рецептов и подписчиков пользователей, маски тегов рецептов, '
+            'ленты подписок и популярность рецептов.')
+
+    def handle(self, *args, **options):
+        recipes, users = recount()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитаны счётчики: рецептов {recipes}, '
+            f'пользователей {users}'
+        ))
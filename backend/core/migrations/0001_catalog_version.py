@@ -0,0 +1,37 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:10
+
+from django.db import migrations, models
+
+CATALOGS = ('ingredients', 'recipes', 'tags')
+
+
+def create_versions(apps, schema_editor):
+    CatalogVersion = apps.get_model('core', 'CatalogVersion')
+    CatalogVersion.objects.bulk_create(
+        (CatalogVersion(name=name) for name in CATALOGS),
+        ignore_conflicts=True
+    )
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogVersion',
+            fields=[
+                ('name', models.CharField(max_length=200, primary_key=True, serialize=False, verbose_name='Каталог')),
+                ('version', models.PositiveBigIntegerField(default=0, verbose_name='Версия')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+            ],
+            options={
+                'verbose_name': 'версия каталога',
+                'verbose_name_plural': 'Версии каталогов',
+            },
+        ),
+        migrations.RunPython(create_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:45
+
+from django.db import migrations
+
+
+def drop_subscription_versions(apps, schema_editor):
+    CatalogVersion = apps.get_model('core', 'CatalogVersion')
+    CatalogVersion.objects.filter(name__startswith='subscriptions:').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_catalog_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_subscription_versions,
+                             migrations.RunPython.noop),
+    ]
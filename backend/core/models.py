@@ -1,8 +1,45 @@
-from django.db import models
+from django.db import models, transaction
 
 from recipes.constants import NAME_MAX_LENGHT, TEXT_LIMIT
 
 
+class AtomicSaveModel(models.Model):
+    """Сохранение и обработчики post_save выполняются в одной транзакции."""
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
+
+class DenormalizedFieldsModel(models.Model):
+    """Поля denormalized_fields (счётчики, маски) меняются запросами UPDATE.
+
+    Сохранение загруженного объекта обновляет все поля, кроме них,
+    чтобы не вернуть в БД значения, устаревшие с момента загрузки.
+    """
+
+    denormalized_fields = ()
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and not args
+                and kwargs.get('update_fields') is None
+                and not kwargs.get('force_insert')):
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.denormalized_fields
+                and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
+
+
 class NameModel(models.Model):
     name = models.CharField(
         'Название',
@@ -17,7 +54,7 @@ class NameModel(models.Model):
         return self.name[:TEXT_LIMIT]
 
 
-class UserRecipeModel(models.Model):
+class UserRecipeModel(AtomicSaveModel):
     user = models.ForeignKey(
         'users.User',
         on_delete=models.CASCADE,
@@ -35,3 +72,19 @@ class UserRecipeModel(models.Model):
 
     def __str__(self):
         return self.recipe.name[:TEXT_LIMIT]
+
+
+class CatalogVersion(models.Model):
+    """Номер изменения каталога, общий для всех процессов."""
+
+    name = models.CharField('Каталог', max_length=NAME_MAX_LENGHT,
+                            primary_key=True)
+    version = models.PositiveBigIntegerField('Версия', default=0)
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
+
+    class Meta:
+        verbose_name = 'версия каталога'
+        verbose_name_plural = 'Версии каталогов'
+
+    def __str__(self):
+        return f'{self.name} {self.version}'
@@ -0,0 +1,287 @@
+import threading
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.signals import (m2m_changed, post_delete, post_migrate,
+                                      post_save, pre_delete)
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from recipes.constants import FEED_BATCH_SIZE, POPULAR_ALL_TIME, POPULAR_WEEK
+from recipes.models import (FavoriteUser, FeedRecipe, Recipe, RecipeActivity,
+                            ShoppingCartExport, ShoppingCartUser, Tag)
+from recipes.servises import create_sqlite_search
+from users.models import SubscriptionUser, User
+
+# Пакетное добавление или удаление рецептов пользователя в избранном
+# и списке покупок: sender - модель связи, user, recipe_ids, delta.
+options_bulk_changed = Signal()
+# Пакетная запись ингредиентов рецептов: sender - IngredientRecipe,
+# recipe_ids.
+ingredients_bulk_changed = Signal()
+
+_deleting = threading.local()
+
+
+def change_counter(model, pk, field, delta):
+    """Атомарно изменяет счётчик в строке pk на delta."""
+    model.objects.filter(pk=pk).update(**{field: F(field) + delta})
+
+
+def deleting(model):
+    """id строк model, которые поток удаляет вместе со связанными.
+
+    Обработчики post_delete строк связей пропускают их: счётчики удаляемых
+    строк не нужны, а счётчики остальных меняются одним запросом в
+    pre_delete.
+    """
+    ids = getattr(_deleting, model._meta.model_name, None)
+    if ids is None:
+        ids = set()
+        setattr(_deleting, model._meta.model_name, ids)
+    return ids
+
+
+def is_deleting(instance):
+    """Строка связи удаляется каскадом вместе с рецептом или пользователем."""
+    users = deleting(User)
+    return (getattr(instance, 'recipe_id', None) in deleting(Recipe)
+            or instance.user_id in users
+            or getattr(instance, 'author_id', None) in users)
+
+
+def fan_out(user_ids, recipes):
+    """Копирует рецепты (id, автор, дата) в ленты пользователей."""
+    FeedRecipe.objects.bulk_create(
+        (FeedRecipe(user_id=user_id, recipe_id=recipe_id,
+                    author_id=author_id, created=created)
+         for user_id in user_ids
+         for recipe_id, author_id, created in recipes),
+        batch_size=FEED_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def fan_out_recipe(recipe):
+    """Добавляет рецепт в ленты подписчиков автора.
+
+    Рецепты авторов с признаком feed_pulled не копируются, а выбираются
+    при чтении ленты.
+    """
+    fan_out(
+        SubscriptionUser.objects.filter(
+            author_id=recipe.author_id, author__feed_pulled=False
+        ).values_list('user_id', flat=True).iterator(),
+        ((recipe.pk, recipe.author_id, recipe.created), )
+    )
+
+
+def author_recipes(author_id):
+    return Recipe.objects.filter(author_id=author_id).order_by().values_list(
+        'id', 'author_id', 'created'
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(instance, created, **kwargs):
+    loaded_author_id = getattr(instance, 'loaded_author_id', None)
+    if created:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+        fan_out_recipe(instance)
+    elif loaded_author_id and loaded_author_id != instance.author_id:
+        change_counter(User, loaded_author_id, 'recipes_count', -1)
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+        FeedRecipe.objects.filter(recipe=instance).delete()
+        fan_out_recipe(instance)
+    instance.loaded_author_id = instance.author_id
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(instance, **kwargs):
+    deleting(Recipe).add(instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    deleting(Recipe).discard(instance.pk)
+    if instance.author_id not in deleting(User):
+        change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(instance, **kwargs):
+    """Снимает счётчики, которые меняют каскадно удаляемые связи.
+
+    Один UPDATE на таблицу вместо запросов на каждую строку избранного,
+    списка покупок и подписок. Рецепты самого пользователя удаляются
+    вместе с ним и не меняются.
+    """
+    deleting(User).add(instance.pk)
+    options = {
+        model: model.objects.filter(user=instance).exclude(
+            recipe__author=instance
+        ).values('recipe_id')
+        for model in (FavoriteUser, ShoppingCartUser)
+    }
+    Recipe.objects.filter(pk__in=options[FavoriteUser]).update(
+        favorites_count=F('favorites_count') - 1
+    )
+    for recipe_ids in options.values():
+        RecipeActivity.objects.filter(
+            recipe_id__in=recipe_ids, day=POPULAR_ALL_TIME
+        ).update(score=F('score') - 1)
+    User.objects.filter(pk__in=SubscriptionUser.objects.filter(
+        user=instance
+    ).values('author_id')).update(subscribers_count=F('subscribers_count') - 1)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(instance, **kwargs):
+    deleting(User).discard(instance.pk)
+
+
+@receiver(post_save, sender=FavoriteUser)
+def favorite_saved(instance, created, **kwargs):
+    if created:
+        change_counter(Recipe, instance.recipe_id, 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=FavoriteUser)
+def favorite_deleted(instance, **kwargs):
+    if is_deleting(instance):
+        return
+    change_counter(Recipe, instance.recipe_id, 'favorites_count', -1)
+
+
+@receiver(options_bulk_changed, sender=FavoriteUser)
+def favorites_changed(recipe_ids, delta, **kwargs):
+    Recipe.objects.filter(pk__in=recipe_ids).update(
+        favorites_count=F('favorites_count') + delta
+    )
+
+
+def change_activity(recipe_ids, delta):
+    """Меняет активность рецептов.
+
+    Добавление учитывается в строках за сегодня, за неделю и за всё
+    время, удаление - только за всё время: окна дня и недели считают
+    добавления, а итог за всё время равен текущему числу добавлений.
+    Поэтому удаление рецепта каскадом не создаёт строк, ссылающихся
+    на него.
+    """
+    days = (POPULAR_ALL_TIME, )
+    if delta > 0:
+        days += (timezone.localdate(), POPULAR_WEEK)
+        RecipeActivity.objects.bulk_create(
+            [RecipeActivity(recipe_id=recipe_id, day=day)
+             for recipe_id in recipe_ids for day in days],
+            ignore_conflicts=True,
+        )
+    RecipeActivity.objects.filter(
+        recipe_id__in=recipe_ids, day__in=days
+    ).update(score=F('score') + delta)
+
+
+@receiver(post_save, sender=FavoriteUser)
+@receiver(post_save, sender=ShoppingCartUser)
+def option_saved(instance, created, **kwargs):
+    if created:
+        change_activity((instance.recipe_id, ), 1)
+
+
+@receiver(post_delete, sender=FavoriteUser)
+@receiver(post_delete, sender=ShoppingCartUser)
+def option_deleted(instance, **kwargs):
+    if is_deleting(instance):
+        return
+    change_activity((instance.recipe_id, ), -1)
+
+
+@receiver(options_bulk_changed, sender=FavoriteUser)
+@receiver(options_bulk_changed, sender=ShoppingCartUser)
+def options_activity_changed(recipe_ids, delta, **kwargs):
+    change_activity(recipe_ids, delta)
+
+
+@receiver(post_save, sender=SubscriptionUser)
+def subscription_saved(instance, created, **kwargs):
+    """Считает подписчика и копирует рецепты автора в его ленту.
+
+    Автор, набравший FEED_PULL_SUBSCRIBERS подписчиков, тем же запросом
+    помечается feed_pulled, и его рецепты выбираются при чтении ленты.
+    """
+    if not created:
+        return
+    User.objects.filter(pk=instance.author_id).update(
+        subscribers_count=F('subscribers_count') + 1,
+        feed_pulled=Case(
+            When(subscribers_count__gte=settings.FEED_PULL_SUBSCRIBERS - 1,
+                 then=Value(True)),
+            default=F('feed_pulled'),
+        ),
+    )
+    fan_out((instance.user_id, ), author_recipes(instance.author_id).filter(
+        author__feed_pulled=False
+    ))
+
+
+@receiver(post_delete, sender=SubscriptionUser)
+def subscription_deleted(instance, **kwargs):
+    """Убирает рецепты автора из ленты бывшего подписчика.
+
+    Признак feed_pulled при этом не снимается: рецепты автора, у которого
+    стало меньше FEED_PULL_SUBSCRIBERS подписчиков, копирует в ленты
+    команда fan_out_feeds вне запроса. Строки лент удаляемых пользователей
+    удаляются каскадом.
+    """
+    if is_deleting(instance):
+        return
+    change_counter(User, instance.author_id, 'subscribers_count', -1)
+    FeedRecipe.objects.filter(user_id=instance.user_id,
+                              author_id=instance.author_id).delete()
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        instance.tags_mask = sum(instance.tags.exclude(
+            mask=None
+        ).values_list('mask', flat=True))
+        Recipe.objects.filter(pk=instance.pk).update(
+            tags_mask=instance.tags_mask
+        )
+    elif pk_set is None:
+        Recipe.objects.with_tags(instance.mask).update_tags_mask()
+    else:
+        Recipe.objects.filter(pk__in=pk_set).update_tags_mask()
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleting(instance, **kwargs):
+    instance.recipe_ids = list(
+        instance.recipes.values_list('pk', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(instance, **kwargs):
+    Recipe.objects.filter(
+        pk__in=getattr(instance, 'recipe_ids', ())
+    ).update_tags_mask()
+
+
+@receiver(post_migrate)
+def search_index_migrated(sender, using, **kwargs):
+    connection = connections[using]
+    if sender.name == 'recipes' and connection.vendor == 'sqlite':
+        create_sqlite_search(connection)
+
+
+@receiver(post_delete, sender=ShoppingCartExport)
+def export_deleted(instance, **kwargs):
+    """Удаляет файл выгрузки после фиксации транзакции."""
+    if instance.file:
+        transaction.on_commit(lambda: instance.file.delete(save=False))
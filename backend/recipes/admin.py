@@ -3,6 +3,10 @@ from django.urls import reverse
 from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 
+from api.paginations import CachedCountPaginator
+from core.admin import AutocompleteFilter
+from users.servises import image_url
+
 from .constants import IMAGE_SIZE
 from .models import Ingredient, IngredientRecipe, Recipe, Tag
 
@@ -26,6 +30,10 @@ class IngredientRecipeInline(admin.TabularInline):
     model = IngredientRecipe
     min_num = 1
     extra = 0
+    autocomplete_fields = ('ingredient',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('ingredient')
 
 
 @admin.register(Recipe)
@@ -35,31 +43,35 @@ class RecipeAdmin(admin.ModelAdmin):
         'author',
         'image',
         'image_of_recipe',
-        'favorite_users_count',
+        'favorites_count',
         'cooking_time',
         'tags',
         'text',
     )
     list_display = ('name', 'author_', 'tags_', 'ingredients_',
-                    'image_of_recipe', 'favorite_users_count')
-    search_fields = ('name', 'tags')
-    list_filter = ('tags', 'author', 'name')
-    readonly_fields = ('image_of_recipe', 'favorite_users_count', 'author_',
+                    'image_of_recipe', 'favorites_count')
+    search_fields = ('name',)
+    list_filter = ('tags', ('author', AutocompleteFilter))
+    autocomplete_fields = ('author',)
+    paginator = CachedCountPaginator
+    show_full_result_count = False
+    readonly_fields = ('image_of_recipe', 'favorites_count', 'author_',
                        'tags_', 'ingredients_', 'author_')
     filter_horizontal = ('tags',)
     inlines = (IngredientRecipeInline,)
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'author'
+        ).prefetch_related('tags', 'ingredients')
+
     @admin.display(description='Отображение картинки')
     def image_of_recipe(self, obj):
         return mark_safe(
-            f'<img src={obj.image.url} '
+            f'<img src={image_url(obj)} '
             f'width="{IMAGE_SIZE}" height="{IMAGE_SIZE}">'
         )
 
-    @admin.display(description='Кол-во добавлений в избранное')
-    def favorite_users_count(self, obj):
-        return obj.favorite_users.count()
-
     @admin.display(description='Автор')
     def author_(self, obj):
         link = reverse(
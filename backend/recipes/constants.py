@@ -1,3 +1,5 @@
+from datetime import date, timedelta
+
 NAME_MAX_LENGHT = 200
 TEXT_LIMIT = 50
 SLUG_MAX_LENGHT = 200
@@ -8,3 +10,48 @@ AMOUNT_MIN_VALUE = 1
 AMOUNT_MAX_VALUE = 32767
 BOOL_CHOICES = ((0, 'False'), (1, 'True'))
 IMAGE_SIZE = 100
+PDF_FONT = 'Ubuntu-Regular'
+PDF_LOGO_PATH = '../static/logo192.png'
+PDF_IMAGE_SIZE = 72
+PDF_THUMBNAILS_CACHE_SIZE = 512
+EXPORT_PENDING = 'pending'
+EXPORT_RUNNING = 'running'
+EXPORT_DONE = 'done'
+EXPORT_FAILED = 'failed'
+EXPORT_STATUSES = (
+    (EXPORT_PENDING, 'В очереди'),
+    (EXPORT_RUNNING, 'Формируется'),
+    (EXPORT_DONE, 'Готов'),
+    (EXPORT_FAILED, 'Ошибка'),
+)
+EXPORT_STATUS_MAX_LENGHT = 10
+EXPORT_DIRECTORY = 'shopping_cart'
+SHOPPING_CART_FORMATS = ('pdf', 'txt', 'csv', 'json')
+SHOPPING_CART_CHUNK_SIZE = 2000
+IMAGE_VARIANTS = (
+    ('card', 480, 'WEBP'),
+    ('thumbnail', 160, 'WEBP'),
+    ('pdf', PDF_IMAGE_SIZE, 'JPEG'),
+)
+IMAGE_VARIANT_EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+IMAGE_VARIANT_QUALITY = 80
+OPTION_CREATED = 'created'
+OPTION_DELETED = 'deleted'
+OPTION_EXISTS = 'exists'
+OPTION_MISSING = 'missing'
+OPTION_NOT_FOUND = 'not_found'
+OPTION_RECIPES_MAX_LENGTH = 100
+TAG_MASK_BITS = 63
+SEARCH_CONFIG = 'russian'
+SEARCH_FTS_TABLE = 'recipes_recipe_fts'
+SEARCH_NAME_WEIGHT = 10.0
+SEARCH_TEXT_WEIGHT = 1.0
+COOK_DEFAULT_LIMIT = 10
+COOK_MAX_LIMIT = 100
+COOK_INGREDIENTS_MAX_LENGTH = 50
+FEED_BATCH_SIZE = 1000
+POPULAR_ALL_TIME = date.min
+POPULAR_WEEK = date.min + timedelta(days=1)
+POPULAR_WEEK_DAYS = 7
+POPULAR_WINDOWS = {'day': None, 'week': POPULAR_WEEK, 'all': POPULAR_ALL_TIME}
+POPULAR_SIZE = 20
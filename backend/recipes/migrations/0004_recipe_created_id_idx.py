@@ -0,0 +1,17 @@
+# Generated by Django 3.2.3 on 2026-10-18 02:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_shoppingcartexport'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['created', 'id'], name='recipe_created_id_idx'),
+        ),
+    ]
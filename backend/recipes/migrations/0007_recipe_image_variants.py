@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-18 02:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0006_fill_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Есть уменьшенные копии картинки'),
+        ),
+    ]
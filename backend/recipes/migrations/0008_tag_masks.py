@@ -0,0 +1,43 @@
+# Generated by Django 3.2.3 on 2026-10-18 02:49
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def fill_masks(apps, schema_editor):
+    Tag = apps.get_model('recipes', 'Tag')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    # Под маски 63 бита знакового BigIntegerField, остальные теги
+    # остаются без маски.
+    for bit, tag in enumerate(Tag.objects.order_by('pk')[:63]):
+        tag.mask = 1 << bit
+        tag.save(update_fields=('mask',))
+    Recipe.objects.update(tags_mask=Coalesce(Subquery(
+        Tag.objects.filter(
+            recipes=OuterRef('pk')
+        ).order_by().values('recipes').annotate(
+            total=Sum('mask')
+        ).values('total')
+    ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0007_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Маска тегов'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='mask',
+            field=models.BigIntegerField(editable=False, null=True, unique=True, verbose_name='Битовая маска'),
+        ),
+        migrations.RunPython(fill_masks, migrations.RunPython.noop),
+    ]
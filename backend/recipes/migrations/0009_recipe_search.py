@@ -0,0 +1,40 @@
+from django.db import migrations
+
+# На SQLite FTS5-таблицу и триггеры создаёт обработчик post_migrate,
+# так как SQLite пересоздаёт таблицу рецептов при изменении схемы.
+
+
+def create_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'ALTER TABLE recipes_recipe ADD COLUMN search_vector tsvector '
+        "GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('russian', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('russian', coalesce(text, '')), 'B')"
+        ') STORED'
+    )
+    schema_editor.execute(
+        'CREATE INDEX recipe_search_idx ON recipes_recipe '
+        'USING gin (search_vector)'
+    )
+
+
+def drop_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS recipe_search_idx')
+    schema_editor.execute(
+        'ALTER TABLE recipes_recipe DROP COLUMN IF EXISTS search_vector'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_tag_masks'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_vector, drop_search_vector),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 3.2.3 on 2026-10-18 02:59
+
+from itertools import islice
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+FEED_BATCH_SIZE = 1000
+
+
+def fill_feeds(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FeedRecipe = apps.get_model('recipes', 'FeedRecipe')
+    rows = Recipe.objects.filter(
+        author__subscribers_count__lt=settings.FEED_PULL_SUBSCRIBERS,
+        author__subscribers__isnull=False,
+    ).values_list('author__subscribers__user', 'id', 'author', 'created')
+    rows = rows.iterator(chunk_size=FEED_BATCH_SIZE)
+    while True:
+        chunk = list(islice(rows, FEED_BATCH_SIZE))
+        if not chunk:
+            break
+        FeedRecipe.objects.bulk_create(
+            FeedRecipe(user_id=user_id, recipe_id=recipe_id,
+                       author_id=author_id, created=created)
+            for user_id, recipe_id, author_id, created in chunk
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0009_recipe_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedRecipe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(verbose_name='Дата добавления рецепта')),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_recipes', to='recipes.recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_recipes', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'рецепт ленты',
+                'verbose_name_plural': 'Ленты подписок',
+                'ordering': ('-created', '-recipe_id'),
+                'abstract': False,
+                'default_related_name': 'feed_recipes',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feedrecipe',
+            index=models.Index(fields=['user', '-created', '-recipe'], name='feed_user_created_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedrecipe',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_feed_user_recipe'),
+        ),
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
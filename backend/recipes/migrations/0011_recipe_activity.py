@@ -0,0 +1,67 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:02
+
+from datetime import date
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def count_subquery(model, field):
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            count=Count('pk')
+        ).values('count')
+    ), 0)
+
+
+def fill_activity(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeActivity = apps.get_model('recipes', 'RecipeActivity')
+    FavoriteUser = apps.get_model('recipes', 'FavoriteUser')
+    ShoppingCartUser = apps.get_model('recipes', 'ShoppingCartUser')
+    RecipeActivity.objects.bulk_create(
+        (RecipeActivity(recipe_id=recipe_id, day=date.min, score=score)
+         for recipe_id, score in Recipe.objects.annotate(
+             score=count_subquery(FavoriteUser, 'recipe')
+             + count_subquery(ShoppingCartUser, 'recipe')
+        ).filter(score__gt=0).values_list('id', 'score')),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_feed_recipe'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('score', models.IntegerField(default=0, verbose_name='Добавления')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activities', to='recipes.recipe', verbose_name='Рецепт')),
+            ],
+            options={
+                'verbose_name': 'активность рецепта',
+                'verbose_name_plural': 'Активность рецептов',
+                'ordering': ('-day', '-score'),
+                'default_related_name': 'activities',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recipeactivity',
+            index=models.Index(fields=['day', '-score', '-recipe'], name='activity_day_score_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipeactivity',
+            constraint=models.UniqueConstraint(fields=('recipe', 'day'), name='unique_recipe_activity_day'),
+        ),
+        migrations.RunPython(fill_activity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:14
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+import recipes.servises
+
+
+def delete_public_exports(apps, schema_editor):
+    ShoppingCartExport = apps.get_model('recipes', 'ShoppingCartExport')
+    for name in ShoppingCartExport.objects.exclude(file='').values_list(
+        'file', flat=True
+    ):
+        default_storage.delete(name)
+    ShoppingCartExport.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_activity'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='shoppingcartexport',
+            name='file',
+            field=models.FileField(blank=True, storage=recipes.servises.ExportStorage(), upload_to=recipes.servises.export_file_name, verbose_name='Файл'),
+        ),
+        migrations.RunPython(delete_public_exports, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:40
+
+from datetime import date, timedelta
+
+from django.db import migrations
+from django.db.models import Sum
+from django.utils import timezone
+
+POPULAR_WEEK = date.min + timedelta(days=1)
+POPULAR_WEEK_DAYS = 7
+
+
+def fill_week(apps, schema_editor):
+    RecipeActivity = apps.get_model('recipes', 'RecipeActivity')
+    RecipeActivity.objects.filter(
+        day__gt=POPULAR_WEEK,
+        day__lte=timezone.localdate() - timedelta(days=POPULAR_WEEK_DAYS),
+    ).delete()
+    RecipeActivity.objects.bulk_create(
+        (RecipeActivity(recipe_id=recipe_id, day=POPULAR_WEEK, score=score)
+         for recipe_id, score in RecipeActivity.objects.filter(
+             day__gt=POPULAR_WEEK
+        ).order_by().values('recipe_id').annotate(
+             total=Sum('score')
+        ).filter(total__gt=0).values_list('recipe_id', 'total')),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def clear_week(apps, schema_editor):
+    RecipeActivity = apps.get_model('recipes', 'RecipeActivity')
+    RecipeActivity.objects.filter(day=POPULAR_WEEK).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_export_storage'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_week, clear_week),
+    ]
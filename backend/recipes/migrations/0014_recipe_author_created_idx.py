@@ -0,0 +1,17 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0013_popular_week'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-created', '-id'], name='recipe_author_created_idx'),
+        ),
+    ]
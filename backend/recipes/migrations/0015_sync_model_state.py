@@ -0,0 +1,46 @@
+# Generated by Django 3.2.3 on 2026-10-18 02:30
+
+from django.conf import settings
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0014_recipe_author_created_idx'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='favoriteuser',
+            options={'default_related_name': 'favorite_users', 'ordering': ('recipe', 'user'), 'verbose_name': 'избранное', 'verbose_name_plural': 'Избранное'},
+        ),
+        migrations.AlterField(
+            model_name='favoriteuser',
+            name='recipe',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favorite_users', to='recipes.recipe', verbose_name='Рецепт'),
+        ),
+        migrations.AlterField(
+            model_name='favoriteuser',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='favorite_users', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь'),
+        ),
+        migrations.AlterField(
+            model_name='ingredient',
+            name='measurement_unit',
+            field=models.CharField(max_length=200, verbose_name='Единица измерения'),
+        ),
+        migrations.AlterField(
+            model_name='ingredientrecipe',
+            name='amount',
+            field=models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1, message='Задайте количество ингредиента.'), django.core.validators.MaxValueValidator(32767, message='Количество ингредиента превысило максимальное.')], verbose_name='Количество'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='cooking_time',
+            field=models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1, message='Задайте время приготовления'), django.core.validators.MaxValueValidator(32767, message='Время приготовления превысило максимальное')], verbose_name='Время приготовления'),
+        ),
+    ]
@@ -1,11 +1,27 @@
+from datetime import timedelta
+
 from colorfield.fields import ColorField
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
-from core.models import NameModel, UserRecipeModel
+from core.models import (AtomicSaveModel, DenormalizedFieldsModel, NameModel,
+                         UserRecipeModel)
 from recipes.constants import (AMOUNT_MAX_VALUE, AMOUNT_MIN_VALUE,
                                COOKING_MAX_TIME, COOKING_MIN_TIME,
-                               NAME_MAX_LENGHT, SLUG_MAX_LENGHT, TEXT_LIMIT)
+                               EXPORT_FAILED, EXPORT_PENDING, EXPORT_RUNNING,
+                               EXPORT_STATUS_MAX_LENGHT, EXPORT_STATUSES,
+                               NAME_MAX_LENGHT, SEARCH_CONFIG,
+                               SEARCH_FTS_TABLE, SEARCH_NAME_WEIGHT,
+                               SEARCH_TEXT_WEIGHT, SLUG_MAX_LENGHT,
+                               TAG_MASK_BITS, TEXT_LIMIT)
+from recipes.servises import (ExportStorage, export_file_name,
+                              image_variant_name, save_image_variants,
+                              search_terms)
 
 
 class Ingredient(NameModel):
@@ -40,6 +56,12 @@ class Tag(models.Model):
         max_length=SLUG_MAX_LENGHT,
         unique=True,
     )
+    mask = models.BigIntegerField(
+        'Битовая маска',
+        unique=True,
+        null=True,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'тег'
@@ -49,8 +71,147 @@ class Tag(models.Model):
     def __str__(self):
         return self.name[:TEXT_LIMIT]
 
+    def clean(self):
+        if self._state.adding and get_free_tag_mask(
+            Tag.objects.exclude(mask=None).values_list('mask', flat=True)
+        ) is None:
+            raise ValidationError(
+                f'Нельзя создать больше {TAG_MASK_BITS} тегов.'
+            )
+
+    def save(self, *args, **kwargs):
+        """Назначает тегу свободную маску.
+
+        Если ту же маску одновременно занял другой тег, берётся
+        следующая свободная. Тег сверх TAG_MASK_BITS остаётся без маски
+        и фильтруется по связям рецептов.
+        """
+        if self.mask is not None:
+            return super().save(*args, **kwargs)
+        while True:
+            self.mask = get_free_tag_mask(
+                Tag.objects.exclude(mask=None).values_list('mask', flat=True)
+            )
+            try:
+                with transaction.atomic(using=kwargs.get('using')):
+                    return super().save(*args, **kwargs)
+            except IntegrityError:
+                if self.mask is None or not Tag.objects.filter(
+                    mask=self.mask
+                ).exclude(pk=self.pk).exists():
+                    raise
+
+
+def get_free_tag_mask(used_masks):
+    """Первый свободный бит для маски тега или None, если бит не осталось."""
+    used_masks = set(used_masks)
+    for bit in range(TAG_MASK_BITS):
+        if 1 << bit not in used_masks:
+            return 1 << bit
+    return None
+
+
+class RecipeQuerySet(models.QuerySet):
+
+    def update_tags_mask(self):
+        """Пересчитывает маски тегов рецептов одним UPDATE."""
+        return self.update(tags_mask=Coalesce(models.Subquery(
+            Tag.objects.filter(
+                recipes=models.OuterRef('pk')
+            ).order_by().values('recipes').annotate(
+                total=models.Sum('mask')
+            ).values('total')
+        ), 0))
+
+    def with_tags(self, mask):
+        """Рецепты, у которых есть хотя бы один тег из маски."""
+        return self.alias(
+            tag_bits=models.F('tags_mask').bitand(mask)
+        ).filter(tag_bits__gt=0)
+
+    def search(self, query):
+        """Полнотекстовый поиск по названию и описанию.
+
+        Аннотирует search_rank: чем больше, тем точнее совпадение.
+        Слова запроса ищутся по префиксу и должны встретиться все.
+        """
+        terms = search_terms(query)
+        if not terms:
+            return self.annotate(search_rank=models.Value(
+                0.0, output_field=models.FloatField()
+            )).none()
+        if connections[self.db].vendor == 'postgresql':
+            tsquery = f"to_tsquery('{SEARCH_CONFIG}', %s)"
+            params = (' & '.join(f'{term}:*' for term in terms), )
+            return self.filter(RawSQL(
+                f'recipes_recipe.search_vector @@ {tsquery}', params,
+                output_field=models.BooleanField()
+            )).annotate(search_rank=RawSQL(
+                f'ts_rank(recipes_recipe.search_vector, {tsquery})', params,
+                output_field=models.FloatField()
+            ))
+        table = SEARCH_FTS_TABLE
+        params = (' '.join(f'"{term}"*' for term in terms), )
+        return self.filter(pk__in=RawSQL(
+            f'SELECT rowid FROM {table} WHERE {table} MATCH %s', params
+        )).annotate(search_rank=RawSQL(
+            f'SELECT -bm25({table}, {SEARCH_NAME_WEIGHT}, '
+            f'{SEARCH_TEXT_WEIGHT}) FROM {table} WHERE {table} MATCH %s '
+            'AND rowid = recipes_recipe.id', params,
+            output_field=models.FloatField()
+        ))
+
+    def feed(self, user):
+        """Рецепты авторов из подписок пользователя, новые сначала.
+
+        Рецепты обычных авторов читаются из ленты пользователя одним
+        проходом по индексу, рецепты авторов с признаком feed_pulled
+        в ленты не копируются и выбираются по автору.
+        Порядок задают аннотации feed_created и feed_recipe_id: при чтении
+        только из ленты это поля её строк из индекса feed_user_created_idx.
+        """
+        pull_author_ids = list(user.authors.filter(
+            author__feed_pulled=True
+        ).values_list('author_id', flat=True))
+        if not pull_author_ids:
+            queryset = self.filter(feed_recipes__user=user).annotate(
+                feed_created=models.F('feed_recipes__created'),
+                feed_recipe_id=models.F('feed_recipes__recipe_id'),
+            )
+        else:
+            queryset = self.filter(
+                models.Q(pk__in=FeedRecipe.objects.filter(
+                    user=user
+                ).values('recipe'))
+                | models.Q(author_id__in=pull_author_ids)
+            ).annotate(
+                feed_created=models.F('created'),
+                feed_recipe_id=models.F('id'),
+            )
+        return queryset.order_by('-feed_created', '-feed_recipe_id')
+
+    def with_user_flags(self, user):
+        """Аннотирует признаки избранного и списка покупок пользователя."""
+        if not user or not user.is_authenticated:
+            return self.annotate(
+                is_favorited=models.Value(
+                    False, output_field=models.BooleanField()
+                ),
+                is_in_shopping_cart=models.Value(
+                    False, output_field=models.BooleanField()
+                ),
+            )
+        return self.annotate(
+            is_favorited=models.Exists(FavoriteUser.objects.filter(
+                user=user, recipe=models.OuterRef('pk')
+            )),
+            is_in_shopping_cart=models.Exists(ShoppingCartUser.objects.filter(
+                user=user, recipe=models.OuterRef('pk')
+            )),
+        )
+
 
-class Recipe(NameModel):
+class Recipe(DenormalizedFieldsModel, AtomicSaveModel, NameModel):
     author = models.ForeignKey(
         'users.User',
         on_delete=models.CASCADE,
@@ -83,12 +244,57 @@ class Recipe(NameModel):
     created = models.DateTimeField(
         'Дата добавления', auto_now_add=True, db_index=True
     )
+    favorites_count = models.PositiveIntegerField(
+        'Кол-во добавлений в избранное', default=0, db_index=True,
+        editable=False,
+    )
+    tags_mask = models.BigIntegerField(
+        'Маска тегов', default=0, editable=False,
+    )
+    image_variants = models.BooleanField(
+        'Есть уменьшенные копии картинки', default=False, editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
+    denormalized_fields = ('favorites_count', 'tags_mask')
 
     class Meta(NameModel.Meta):
         verbose_name = 'рецепт'
         verbose_name_plural = 'Рецепты'
         default_related_name = 'recipes'
         ordering = ('-created',)
+        indexes = (
+            models.Index(fields=('created', 'id'),
+                         name='recipe_created_id_idx'),
+            models.Index(fields=('author', '-created', '-id'),
+                         name='recipe_author_created_idx'),
+        )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        instance.loaded_author_id = loaded.get('author_id')
+        instance.loaded_image_name = loaded.get('image')
+        return instance
+
+    def save(self, *args, **kwargs):
+        if ('image' not in self.get_deferred_fields()
+                and self.image.name != getattr(self, 'loaded_image_name',
+                                               None)):
+            if not self.image._committed:
+                self.image.save(self.image.name, self.image.file,
+                                save=False)
+            self.image_variants = save_image_variants(self.image.name)
+        super().save(*args, **kwargs)
+        self.loaded_image_name = self.image.name
+
+    def get_image_name(self, variant):
+        """Имя варианта картинки или оригинала, если вариантов нет."""
+        if self.image_variants:
+            return image_variant_name(self.image.name, variant)
+        return self.image.name
 
 
 class IngredientRecipe(models.Model):
@@ -158,3 +364,117 @@ class ShoppingCartUser(UserRecipeModel):
                 name='unique_shopping_cart_user_recipe'
             ),
         )
+
+
+class FeedRecipe(UserRecipeModel):
+    """Рецепт автора в ленте подписчика, заполняется при записи."""
+
+    author = models.ForeignKey(
+        'users.User',
+        on_delete=models.CASCADE,
+        verbose_name='Автор',
+        related_name='+',
+    )
+    created = models.DateTimeField('Дата добавления рецепта')
+
+    class Meta(UserRecipeModel.Meta):
+        verbose_name = 'рецепт ленты'
+        verbose_name_plural = 'Ленты подписок'
+        default_related_name = 'feed_recipes'
+        ordering = ('-created', '-recipe_id')
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_feed_user_recipe'
+            ),
+        )
+        indexes = (
+            models.Index(fields=('user', '-created', '-recipe'),
+                         name='feed_user_created_idx'),
+        )
+
+
+class RecipeActivity(models.Model):
+    """Добавления рецепта в избранное и покупки за день.
+
+    Дневные строки считают только добавления. Строка с днём POPULAR_WEEK
+    хранит их сумму за POPULAR_WEEK_DAYS дней, строка с днём
+    POPULAR_ALL_TIME - число добавлений, за вычетом удалений.
+    """
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт',
+    )
+    day = models.DateField('День')
+    score = models.IntegerField('Добавления', default=0)
+
+    class Meta:
+        verbose_name = 'активность рецепта'
+        verbose_name_plural = 'Активность рецептов'
+        default_related_name = 'activities'
+        ordering = ('-day', '-score')
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'day'),
+                name='unique_recipe_activity_day'
+            ),
+        )
+        indexes = (
+            models.Index(fields=('day', '-score', '-recipe'),
+                         name='activity_day_score_idx'),
+        )
+
+    def __str__(self):
+        return f'{self.recipe} {self.day}'
+
+
+class ShoppingCartExportQuerySet(models.QuerySet):
+
+    def fail_stale(self):
+        """Помечает упавшими выгрузки, не готовые за EXPORT_TIMEOUT.
+
+        Задачи выполняются в памяти процесса и пропадают при его
+        падении или перезапуске, поэтому статус не ждёт их вечно.
+        """
+        return self.filter(
+            status__in=(EXPORT_PENDING, EXPORT_RUNNING),
+            created__lt=timezone.now() - timedelta(
+                seconds=settings.EXPORT_TIMEOUT
+            )
+        ).update(status=EXPORT_FAILED)
+
+    def expired(self):
+        """Выгрузки старше EXPORT_EXPIRY."""
+        return self.filter(created__lt=timezone.now() - timedelta(
+            seconds=settings.EXPORT_EXPIRY
+        ))
+
+
+class ShoppingCartExport(models.Model):
+    user = models.ForeignKey(
+        'users.User',
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+    )
+    status = models.CharField(
+        'Статус',
+        max_length=EXPORT_STATUS_MAX_LENGHT,
+        choices=EXPORT_STATUSES,
+        default=EXPORT_PENDING,
+    )
+    file = models.FileField('Файл', upload_to=export_file_name,
+                            storage=ExportStorage(), blank=True)
+    created = models.DateTimeField('Дата создания', auto_now_add=True)
+
+    objects = ShoppingCartExportQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'выгрузка списка покупок'
+        verbose_name_plural = 'Выгрузки списка покупок'
+        default_related_name = 'shopping_cart_exports'
+        ordering = ('-created',)
+
+    def __str__(self):
+        return f'{self.user} {self.created:%d.%m.%Y %H:%M}'
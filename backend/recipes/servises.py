@@ -0,0 +1,111 @@
+import os
+import re
+from io import BytesIO
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from PIL import Image, ImageOps
+
+from recipes.constants import (EXPORT_DIRECTORY, IMAGE_VARIANT_EXTENSIONS,
+                               IMAGE_VARIANT_QUALITY, IMAGE_VARIANTS,
+                               SEARCH_FTS_TABLE)
+
+
+class ExportStorage(FileSystemStorage):
+    """Хранилище выгрузок в EXPORT_ROOT вне MEDIA_ROOT.
+
+    Файлы не имеют публичного URL и отдаются владельцу только через API.
+    """
+
+    @property
+    def base_location(self):
+        return settings.EXPORT_ROOT
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    def url(self, name):
+        raise ValueError('Выгрузки отдаются только через API.')
+
+
+def export_file_name(instance, filename):
+    """Неугадываемое имя файла выгрузки."""
+    return f'{EXPORT_DIRECTORY}/{uuid4().hex}.pdf'
+
+
+VARIANT_EXTENSIONS = {
+    variant: IMAGE_VARIANT_EXTENSIONS[image_format]
+    for variant, _, image_format in IMAGE_VARIANTS
+}
+
+
+def image_variant_name(name, variant):
+    """Имя файла варианта картинки рядом с оригиналом."""
+    root, _ = os.path.splitext(name)
+    return f'{root}_{variant}.{VARIANT_EXTENSIONS[variant]}'
+
+
+def save_image_variants(name):
+    """Сохраняет уменьшенные копии картинки, False если её не прочитать."""
+    try:
+        with default_storage.open(name) as image_file:
+            image = Image.open(image_file)
+            image = ImageOps.exif_transpose(image).convert('RGB')
+    except (OSError, ValueError):
+        return False
+    for variant, size, image_format in IMAGE_VARIANTS:
+        variant_image = image.copy()
+        variant_image.thumbnail((size, size))
+        buffer = BytesIO()
+        variant_image.save(buffer, image_format,
+                           quality=IMAGE_VARIANT_QUALITY)
+        variant_name = image_variant_name(name, variant)
+        default_storage.delete(variant_name)
+        default_storage.save(variant_name, ContentFile(buffer.getvalue()))
+    return True
+
+
+def search_terms(query):
+    """Слова поискового запроса без служебных символов."""
+    return re.findall(r'\w+', query)
+
+
+def create_sqlite_search(connection):
+    """Создаёт FTS5-таблицу рецептов и триггеры, перестраивает индекс.
+
+    SQLite пересоздаёт таблицу при изменении схемы и теряет триггеры,
+    поэтому вызывается после каждой миграции.
+    """
+    if 'recipes_recipe' not in connection.introspection.table_names():
+        return
+    table = SEARCH_FTS_TABLE
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5('
+            "name, text, content='recipes_recipe', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2')"
+        )
+        cursor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS {table}_insert '
+            'AFTER INSERT ON recipes_recipe BEGIN '
+            f'INSERT INTO {table}(rowid, name, text) '
+            'VALUES (new.id, new.name, new.text); END'
+        )
+        cursor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS {table}_delete '
+            'AFTER DELETE ON recipes_recipe BEGIN '
+            f'INSERT INTO {table}({table}, rowid, name, text) '
+            "VALUES ('delete', old.id, old.name, old.text); END"
+        )
+        cursor.execute(
+            f'CREATE TRIGGER IF NOT EXISTS {table}_update '
+            'AFTER UPDATE OF name, text ON recipes_recipe BEGIN '
+            f'INSERT INTO {table}({table}, rowid, name, text) '
+            "VALUES ('delete', old.id, old.name, old.text); "
+            f'INSERT INTO {table}(rowid, name, text) '
+            'VALUES (new.id, new.name, new.text); END'
+        )
+        cursor.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
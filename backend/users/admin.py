@@ -3,10 +3,11 @@ from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import Group
 from django.utils.safestring import mark_safe
 
+from api.paginations import CachedCountPaginator
 from recipes.models import FavoriteUser, ShoppingCartUser
 from users.constants import MAX_HEIGHT_IMAGE_SIZE
 from users.models import SubscriptionUser, User
-from users.servises import object_link
+from users.servises import image_url, object_link
 
 admin.site.unregister(Group)
 
@@ -15,16 +16,28 @@ class UserSubscriptorInline(admin.TabularInline):
     model = SubscriptionUser
     extra = 1
     fk_name = 'user'
+    autocomplete_fields = ('author',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('author')
 
 
 class UserFavoriteInline(admin.TabularInline):
     model = FavoriteUser
     extra = 1
+    autocomplete_fields = ('recipe',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('recipe')
 
 
 class UserFShoppingCartInline(admin.TabularInline):
     model = ShoppingCartUser
     extra = 1
+    autocomplete_fields = ('recipe',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('recipe')
 
 
 @admin.register(User)
@@ -52,26 +65,20 @@ class UserAdmin(BaseUserAdmin):
         'subscribers_count',
         'is_staff',
     )
-    list_filter = ('email', 'username')
+    list_filter = ('is_staff', 'is_active')
     search_fields = ('email', 'username', 'first_name', 'last_name')
     list_editable = ('first_name', 'last_name', 'email')
     readonly_fields = ('recipes_of_user',)
+    paginator = CachedCountPaginator
+    show_full_result_count = False
     inlines = (UserSubscriptorInline, UserFavoriteInline,
                UserFShoppingCartInline)
 
-    @admin.display(description='Кол-во рецептов.')
-    def recipes_count(self, obj):
-        return obj.recipes.count()
-
     @admin.display(description='Рецепты пользователя.')
     def recipes_of_user(self, obj):
         recipes = ', '.join(
-            [(f'<img src={recipe.image.url} '
+            [(f'<img src={image_url(recipe)} '
               f'style="max-height: {MAX_HEIGHT_IMAGE_SIZE}px;"> '
               f'{object_link(recipe)}') for recipe in obj.recipes.all()]
         )
         return mark_safe(recipes)
-
-    @admin.display(description='Кол-во подписчиков.')
-    def subscribers_count(self, obj):
-        return obj.subscribers.count()
@@ -0,0 +1,28 @@
+# Generated by Django 3.2.3 on 2026-10-18 03:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_feed_pulled(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    User.objects.filter(
+        subscribers_count__gte=settings.FEED_PULL_SUBSCRIBERS
+    ).update(feed_pulled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_counters'),
+        ('recipes', '0006_fill_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='feed_pulled',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Рецепты выбираются при чтении ленты'),
+        ),
+        migrations.RunPython(fill_feed_pulled, migrations.RunPython.noop),
+    ]
@@ -3,14 +3,17 @@ from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 from django.db import models
 
+from core.models import AtomicSaveModel, DenormalizedFieldsModel
 from users.constants import (EMAIL_MAX_LENGHT, NAME_MAX_LENGHT,
                              PASSWORD_MAX_LENGHT)
 
 
-class User(AbstractUser):
+class User(DenormalizedFieldsModel, AbstractUser):
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ('first_name', 'last_name', 'username')
+    denormalized_fields = ('recipes_count', 'subscribers_count',
+                           'feed_pulled')
 
     password = models.CharField(
         max_length=PASSWORD_MAX_LENGHT,
@@ -30,6 +33,22 @@ class User(AbstractUser):
         max_length=NAME_MAX_LENGHT,
         verbose_name='Фамилия'
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Кол-во рецептов'
+    )
+    subscribers_count = models.PositiveIntegerField(
+        default=0,
+        db_index=True,
+        editable=False,
+        verbose_name='Кол-во подписчиков'
+    )
+    feed_pulled = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Рецепты выбираются при чтении ленты'
+    )
 
     class Meta:
         ordering = ('username',)
@@ -40,7 +59,7 @@ class User(AbstractUser):
         return self.get_full_name()
 
 
-class SubscriptionUser(models.Model):
+class SubscriptionUser(AtomicSaveModel):
     user = models.ForeignKey(
         User,
         verbose_name='Пользователь',
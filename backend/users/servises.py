@@ -1,3 +1,4 @@
+from django.core.files.storage import default_storage
 from django.urls import reverse
 
 
@@ -8,3 +9,7 @@ def object_link(obj):
         f'admin:{app_label}_{model_label}_change', args=(obj.id,)
     )
     return f'<a href="{url}">{obj.name}</a>'
+
+
+def image_url(recipe, variant='thumbnail'):
+    return default_storage.url(recipe.get_image_name(variant))